@@ -0,0 +1,152 @@
+# chatbot/async_mongo.py
+"""
+Motor (asyncio) counterpart of MongoDBManager for the async chatbot view.
+
+Only the calls on the chat path are here: history, summary and KV context,
+saving a turn and logging a failed one. Documents are built by the same helpers the
+sync manager uses, so both views write identical records. Reads go through
+motor; finished and failed turns are handed to the sync manager's background TurnWriter
+(a non-blocking queue put), so the event loop never waits on those writes.
+
+Motor binds its client to the event loop it is first used on, like the
+httpx client in ollama_async, so this assumes the single long-lived loop of
+an ASGI server. Without motor installed, the same calls run on the sync
+manager in worker threads instead (ThreadedMongoManager).
+"""
+import pymongo
+from datetime import datetime
+from asgiref.sync import sync_to_async
+from decouple import config
+
+try:
+    from motor.motor_asyncio import AsyncIOMotorClient
+except ImportError:
+    AsyncIOMotorClient = None
+
+from .mongo_manager import (
+    KV_CONTEXT_COLLECTION, KV_CONTEXT_TTL_SECONDS, build_turn_docs, cached_mongo_user_id, error_doc, error_ops,
+    format_history, kv_context_ops, mongo_manager, new_session_doc, remember_mongo_user_id,
+    reusable_session_id, turn_ops,
+)
+
+
+class AsyncMongoManager:
+    def __init__(self):
+        self.mongo_uri = config('MONGO_URI', default=None)
+        self.db_name = config('MONGO_DB_NAME', default='investomart')
+        self.client = None
+        self.db = None
+        self._kv_index_ready = False
+
+    def connect(self):
+        """Motor connects lazily, so this only builds the client (once per process)."""
+        if self.client is None:
+            print(f"🔌 [MOTOR] Client for DB: {self.db_name}")
+            self.client = AsyncIOMotorClient(self.mongo_uri)
+            self.db = self.client[self.db_name]
+        return self.db
+
+    async def get_chat_history(self, session_id, limit=6):
+        if not session_id: return []
+        db = self.connect()
+        cursor = db['chat_messages'].find(
+            {'session_id': session_id},
+            sort=[('timestamp', pymongo.DESCENDING)],
+            limit=limit
+        )
+        messages = await cursor.to_list(length=limit)
+        messages.reverse()
+        return format_history(messages)
+
+    async def get_session_summary(self, session_id):
+        if not session_id: return ''
+        db = self.connect()
+        session = await db['chatbot_sessions'].find_one({'session_id': session_id}, {'summary': 1})
+        return (session or {}).get('summary', '')
+
+    async def _kv_collection(self):
+        collection = self.connect()[KV_CONTEXT_COLLECTION]
+        if not self._kv_index_ready:
+            self._kv_index_ready = True
+            try:
+                await collection.create_index('updated_at', expireAfterSeconds=KV_CONTEXT_TTL_SECONDS)
+            except Exception as e:
+                print(f"[MOTOR] Could not create KV context TTL index: {e}")
+        return collection
+
+    async def get_kv_context(self, session_id, fingerprint):
+        if not session_id: return None
+        doc = await (await self._kv_collection()).find_one({'_id': session_id, 'fingerprint': fingerprint}, {'tokens': 1})
+        return doc['tokens'] if doc else None
+
+    async def save_kv_context(self, session_id, fingerprint, kv_context):
+        """Same contract as MongoDBManager.save_kv_context."""
+        if not session_id: return
+        try:
+            mongo_manager.writer.submit(kv_context_ops(session_id, fingerprint, kv_context))
+        except Exception as e:
+            print(f"❌ [MOTOR] KV context save failed: {e}")
+
+    async def save_chat_message(
+        self,
+        user_django_id,
+        user_message,
+        bot_response,
+        metrics=None,
+        session_id=None,
+        sentiment='neutral',
+        intent='general',
+        wall_clock_ms=0,
+        time_to_first_token_ms=None,
+        cached=False,
+        retrieval_timings=None,
+        stage_ms=None,
+    ):
+        """Same contract as MongoDBManager.save_chat_message."""
+        db = self.connect()
+        try:
+            mongo_user_id = "anonymous"
+            if user_django_id != "anonymous":
+                mongo_user_id = cached_mongo_user_id(user_django_id) or remember_mongo_user_id(
+                    user_django_id, await db['auth_user'].find_one({'id': user_django_id}, {'_id': 1}))
+
+            new_session = None
+            if not session_id:
+                latest_session = await db['chatbot_sessions'].find_one(
+                    {'user_id': mongo_user_id},
+                    sort=[('started_at', pymongo.DESCENDING)]
+                )
+                session_id = reusable_session_id(latest_session)
+                if not session_id:
+                    new_session = new_session_doc(mongo_user_id, user_message)
+                    session_id = new_session['session_id']
+
+            now = datetime.utcnow()
+            user_doc, assistant_doc = build_turn_docs(
+                session_id, user_message, bot_response, metrics, sentiment, intent,
+                wall_clock_ms, time_to_first_token_ms, cached, retrieval_timings, now, stage_ms,
+            )
+            mongo_manager.writer.submit(turn_ops(session_id, user_doc, assistant_doc, now, new_session),
+                                        session_id=session_id)
+            print(f"✅ [MOTOR] Queued. wall_clock={wall_clock_ms}ms, session={session_id}")
+            return session_id
+        except Exception as e:
+            print(f"❌ [MOTOR] Error in save_chat_message: {e}")
+            return session_id
+
+    async def log_error_metric(self, session_id, error_type, error_msg, user_message=''):
+        try:
+            mongo_manager.writer.submit(error_ops(session_id, error_doc(session_id, error_type, error_msg, user_message)))
+        except Exception as e:
+            print(f"❌ [MOTOR] log_error_metric failed: {e}")
+
+
+class ThreadedMongoManager:
+    """AsyncMongoManager's interface over the sync manager, one worker thread per call."""
+
+    def __getattr__(self, name):
+        method = getattr(mongo_manager, name)
+        return sync_to_async(method, thread_sensitive=False)
+
+
+async_mongo_manager = AsyncMongoManager() if AsyncIOMotorClient is not None else ThreadedMongoManager()
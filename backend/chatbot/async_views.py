@@ -0,0 +1,195 @@
+# chatbot/async_views.py
+"""
+Async chat endpoint for ASGI deployments (investomart/asgi.py).
+
+While the model generates, the turn holds no worker thread: Ollama is called
+through httpx and history/persistence go through motor. The short
+CPU/blocking steps (retrieval, response cache lookup) run in the default
+thread pool via sync_to_async. Under an ASGI server one process can keep
+hundreds of chats in flight. The request/response contract matches
+chatbot_api. Streaming needs Django 4.2+ (async iterators in
+StreamingHttpResponse); older versions answer a stream request with JSON.
+
+Only the Bearer token scheme is accepted; the view is csrf_exempt, so
+cookie sessions would be unsafe here.
+"""
+import asyncio
+import json
+import time
+import traceback
+
+import django
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+
+from data.authentication import SimpleTokenAuthentication
+from .async_mongo import async_mongo_manager
+from .context_builder import KEEP_RECENT_MESSAGES
+from .ollama_async import AsyncOllama
+from .views import (
+    _sse, append_table, cache_answer, cached_answer, fast_path_answer, ollama_client, prepare_turn, wants_stream,
+)
+
+async_ollama = AsyncOllama(model_name=ollama_client.model_name)
+
+ASYNC_STREAMING = django.VERSION >= (4, 2)
+
+
+def _authenticate(request):
+    result = SimpleTokenAuthentication().authenticate(request)
+    return result[0] if result else AnonymousUser()
+
+
+async def _persist_turn(turn, final_output, metrics, wall_clock_ms, time_to_first_token_ms, cached,
+                        kv_context=None):
+    user_obj = turn['user_obj']
+    if turn['kv_context'] and not cached and not metrics.get('fast_path'):
+        metrics = {**metrics, 'kv_context_tokens': len(turn['kv_context'])}
+    session_id = await async_mongo_manager.save_chat_message(
+        user_obj.id if (user_obj and turn['user_authenticated']) else "anonymous",
+        turn['message'],
+        final_output,
+        metrics=metrics,
+        session_id=turn['session_id'],
+        sentiment=turn['sentiment'],
+        intent=turn['intent'],
+        wall_clock_ms=wall_clock_ms,
+        time_to_first_token_ms=time_to_first_token_ms,
+        cached=cached,
+        retrieval_timings=turn['retrieval_timings'],
+        stage_ms=turn['stage_ms'],
+    )
+    await async_mongo_manager.save_kv_context(session_id, async_ollama.context_fingerprint(), kv_context)
+    return session_id
+
+
+async def _local_events(text, metrics):
+    yield 'token', text
+    yield 'done', {'text': text, 'metrics': metrics}
+
+
+async def _stream_turn(turn, request_start_time, cache_embedding, cached_text, fast_text=None, fast_metrics=None):
+    """Async twin of views.stream_turn; same SSE events."""
+    time_to_first_token_ms = None
+    if fast_text is not None:
+        events = _local_events(fast_text, fast_metrics)
+    elif cached_text is not None:
+        events = _local_events(cached_text, {'model': async_ollama.model_name})
+    else:
+        events = async_ollama.stream_response(turn['message'], turn['context'], kv_context=turn['kv_context'])
+
+    async for kind, payload in events:
+        if kind == 'token':
+            if time_to_first_token_ms is None:
+                time_to_first_token_ms = int((time.time() - request_start_time) * 1000)
+            yield _sse('token', {'text': payload})
+        elif kind == 'error':
+            await async_mongo_manager.log_error_metric(
+                turn['session_id'] or 'unknown', 'OllamaStreamError', payload, user_message=turn['message'])
+            yield _sse('error', {'response': "Sorry, I couldn't generate a response."})
+            return
+        else:
+            metrics = payload.get('metrics', {})
+            if cached_text is None:
+                await sync_to_async(cache_answer, thread_sensitive=False)(
+                    turn, cache_embedding, payload.get('text', ''), metrics)
+            final_output = append_table(turn, payload.get('text', ''))
+            wall_clock_ms = int((time.time() - request_start_time) * 1000)
+            new_session_id = await _persist_turn(turn, final_output, metrics, wall_clock_ms,
+                                                 time_to_first_token_ms or wall_clock_ms,
+                                                 cached_text is not None, payload.get('kv_context'))
+            yield _sse('done', {
+                'response': final_output,
+                'success': True,
+                'cached': cached_text is not None,
+                'session_id': new_session_id,
+                'metrics': {
+                    **metrics,
+                    'wall_clock_ms': wall_clock_ms,
+                    'time_to_first_token_ms': time_to_first_token_ms or wall_clock_ms,
+                } if settings.DEBUG else None,
+            })
+            return
+
+
+@csrf_exempt
+async def chatbot_api_async(request):
+    """One chat turn; same body and response as chatbot_api."""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST only'}, status=405)
+
+    request_start_time = time.time()
+    message, session_id = '', None
+    try:
+        data = json.loads(request.body)
+        message = data.get('message', '').strip()
+        session_id = data.get('session_id')
+        if not message: return JsonResponse({'response': 'Please type a message.'})
+
+        request.user = await sync_to_async(_authenticate)(request)
+        session_state = {}
+        if session_id:
+            history, summary, kv_context = await asyncio.gather(
+                async_mongo_manager.get_chat_history(session_id, limit=KEEP_RECENT_MESSAGES),
+                async_mongo_manager.get_session_summary(session_id),
+                async_mongo_manager.get_kv_context(session_id, async_ollama.context_fingerprint()),
+            )
+            session_state = {'history': history, 'summary': summary, 'kv_context': kv_context}
+        turn = await sync_to_async(prepare_turn, thread_sensitive=False)(
+            request, message, session_id, session_state=session_state)
+        fast_text, fast_metrics = fast_path_answer(turn)
+        cache_embedding, cached_text = None, None
+        if fast_text is None:
+            cache_embedding, cached_text = await sync_to_async(cached_answer, thread_sensitive=False)(turn)
+
+        if ASYNC_STREAMING and wants_stream(request, data):
+            response = StreamingHttpResponse(
+                _stream_turn(turn, request_start_time, cache_embedding, cached_text, fast_text, fast_metrics),
+                content_type='text/event-stream',
+            )
+            response['Cache-Control'] = 'no-cache'
+            response['X-Accel-Buffering'] = 'no'
+            return response
+
+        kv_context = None
+        if fast_text is not None:
+            response_text, metrics = fast_text, fast_metrics
+        elif cached_text is not None:
+            response_text = cached_text
+            metrics = {'model': async_ollama.model_name}
+        else:
+            ollama_response = await async_ollama.generate_response(message, turn['context'],
+                                                                   kv_context=turn['kv_context'])
+            if not ollama_response:
+                return JsonResponse({'response': "Sorry, I couldn't generate a response."}, status=200)
+            response_text = ollama_response.get('text', '')
+            metrics = ollama_response.get('metrics', {})
+            kv_context = ollama_response.get('kv_context')
+            await sync_to_async(cache_answer, thread_sensitive=False)(turn, cache_embedding, response_text, metrics)
+
+        final_output = append_table(turn, response_text)
+        wall_clock_ms = int((time.time() - request_start_time) * 1000)
+        print(f"[ASYNC API] Wall-clock latency: {wall_clock_ms}ms")
+        new_session_id = await _persist_turn(turn, final_output, metrics, wall_clock_ms, None,
+                                             cached_text is not None, kv_context)
+
+        return JsonResponse({
+            'response': final_output,
+            'success': True,
+            'cached': cached_text is not None,
+            'session_id': new_session_id,
+            'metrics': {
+                **metrics,
+                'wall_clock_ms': wall_clock_ms,
+                'time_to_first_token_ms': None,
+            } if settings.DEBUG else None
+        })
+
+    except Exception as e:
+        print(f"CRITICAL ASYNC VIEW ERROR: {e}\n{traceback.format_exc()}")
+        await async_mongo_manager.log_error_metric(session_id or 'unknown', type(e).__name__, str(e),
+                                                   user_message=message)
+        return JsonResponse({'response': "Sorry, something went wrong.", 'success': False}, status=500)
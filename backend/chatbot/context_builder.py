@@ -0,0 +1,126 @@
+# chatbot/context_builder.py
+"""
+Token-budgeted prompt context.
+
+Sections are filled in priority order until CHATBOT_CONTEXT_TOKEN_BUDGET
+(estimated tokens) is spent; a section that does not fit is cut line by line
+(history keeps its newest lines, data sections their first ones) and lower
+priority sections are dropped. The prompt still shows sections in their
+natural order.
+
+Older turns are not resent verbatim: once a session has more than
+KEEP_RECENT_MESSAGES messages, the oldest are folded into a short extractive
+summary kept on the chatbot_sessions document.
+"""
+import re
+from collections import namedtuple
+
+from decouple import config
+
+CHATBOT_CONTEXT_TOKEN_BUDGET = config('CHATBOT_CONTEXT_TOKEN_BUDGET', default=1500, cast=int)
+CHATBOT_SUMMARY_TOKEN_BUDGET = config('CHATBOT_SUMMARY_TOKEN_BUDGET', default=300, cast=int)
+# Messages sent verbatim as recent history; everything older lives in the summary
+KEEP_RECENT_MESSAGES = 6
+
+_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+_TAG_RE = re.compile(r"<[^>]+>")
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s")
+
+
+def estimate_tokens(text):
+    """
+    Local BPE-style estimate: every ~4 characters of a word is a token and
+    every punctuation mark is one. Rough, but cheap and needs no tokenizer files.
+    """
+    return sum((len(piece) + 3) // 4 for piece in _PIECE_RE.findall(text or ''))
+
+
+def strip_tables(text):
+    """Drop the |||TABLE||| payload and any HTML left in a stored answer."""
+    text = (text or '').split('|||TABLE|||', 1)[0]
+    return re.sub(r'\s+', ' ', _TAG_RE.sub(' ', text)).strip()
+
+
+def _clip(text, max_chars):
+    return text if len(text) <= max_chars else text[:max_chars].rsplit(' ', 1)[0] + '...'
+
+
+def summarize_messages(messages):
+    """One line per turn: the question and the opening sentence of the answer."""
+    lines = []
+    question = None
+    for msg in messages:
+        content = strip_tables(msg.get('content'))
+        if msg.get('role') == 'user':
+            question = _clip(content, 120)
+        elif msg.get('role') == 'assistant':
+            answer = _SENTENCE_END_RE.split(content, 1)[0] if content else ''
+            lines.append(f"- User asked: {question or '(unknown)'} | Answer: {_clip(answer, 160)}")
+            question = None
+    return lines
+
+
+def merge_summary(summary, new_lines, budget=CHATBOT_SUMMARY_TOKEN_BUDGET):
+    """Append new_lines to the rolling summary, forgetting the oldest lines past budget."""
+    lines = (summary.split('\n') if summary else []) + list(new_lines)
+    while lines and estimate_tokens('\n'.join(lines)) > budget:
+        lines.pop(0)
+    return '\n'.join(lines)
+
+
+# keep_tail: when cut, keep the last lines (history) rather than the first
+Section = namedtuple('Section', 'title lines priority keep_tail')
+
+
+def _fit(lines, budget, keep_tail):
+    ordered = list(reversed(lines)) if keep_tail else list(lines)
+    kept, used = [], 0
+    for line in ordered:
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget:
+            if not kept:
+                # Not even one whole line fits: keep a prefix of it
+                kept.append(_clip(line, max(0, (budget - used) * 4)))
+                used = budget
+            break
+        kept.append(line)
+        used += cost
+    if keep_tail:
+        kept.reverse()
+    return [line for line in kept if line], used
+
+
+def build_context(sections, budget=CHATBOT_CONTEXT_TOKEN_BUDGET):
+    """
+    Returns (context_text, stats) for a list of Sections given in display order.
+    Lower priority numbers are filled first.
+    """
+    remaining = budget
+    fitted = {}
+    stats = {'budget': budget, 'truncated': [], 'dropped': []}
+    full = False
+    for index in sorted(range(len(sections)), key=lambda i: sections[i].priority):
+        section = sections[index]
+        lines = [line for line in section.lines if line]
+        if not lines:
+            continue
+        header_cost = estimate_tokens(section.title) + 1
+        if full or remaining <= header_cost:
+            stats['dropped'].append(section.title)
+            continue
+        kept, used = _fit(lines, remaining - header_cost, section.keep_tail)
+        if kept != lines:
+            # Budget spent: nothing of lower priority goes in after a cut section
+            full = True
+            if not kept:
+                stats['dropped'].append(section.title)
+                continue
+            stats['truncated'].append(section.title)
+        fitted[index] = kept
+        remaining -= header_cost + used
+
+    stats['used'] = budget - remaining
+    context = "\n\n".join(
+        sections[i].title + "\n" + "\n".join(fitted[i]) for i in sorted(fitted)
+    )
+    return context, stats
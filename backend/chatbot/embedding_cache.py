@@ -0,0 +1,135 @@
+# chatbot/embedding_cache.py
+"""
+Two-tier cache for query embeddings.
+
+Tier 1 is an in-process LRU; tier 2 is the `embedding_cache` MongoDB
+collection shared by every worker and kept across restarts. Entries are keyed
+by sha256(model + normalized text), so "Goat price?" and "goat  price" share
+one embedding and switching the embed model never returns stale vectors.
+"""
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from decouple import config
+
+from .mongo_manager import mongo_manager
+
+EMBEDDING_CACHE_SIZE = config('EMBEDDING_CACHE_SIZE', default=2048, cast=int)
+# Unused persistent entries expire after this many days
+EMBEDDING_CACHE_TTL_DAYS = config('EMBEDDING_CACHE_TTL_DAYS', default=90, cast=int)
+COLLECTION_NAME = 'embedding_cache'
+
+
+def normalize_text(text):
+    """Lowercase, collapse whitespace and drop surrounding punctuation."""
+    text = re.sub(r'\s+', ' ', (text or '').lower()).strip()
+    return text.strip(' ?!.,;:')
+
+
+def cache_key(model_name, text):
+    return hashlib.sha256(f"{model_name}\x00{normalize_text(text)}".encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, max_size=EMBEDDING_CACHE_SIZE):
+        self.max_size = max_size
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._index_ready = False
+        self._stats = {'memory_hits': 0, 'persistent_hits': 0, 'misses': 0, 'errors': 0}
+
+    def _collection(self):
+        db = mongo_manager.connect()
+        if db is None:
+            return None
+        collection = db[COLLECTION_NAME]
+        if not self._index_ready:
+            try:
+                collection.create_index('last_used_at', expireAfterSeconds=EMBEDDING_CACHE_TTL_DAYS * 86400)
+            except Exception as e:
+                print(f"[EMBED CACHE] Could not create TTL index: {e}")
+            self._index_ready = True
+        return collection
+
+    def _remember(self, key, embedding):
+        with self._lock:
+            self._memory[key] = embedding
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_size:
+                self._memory.popitem(last=False)
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def get_or_compute(self, text, model_name, compute):
+        """
+        Return the cached embedding for (model_name, text), calling
+        compute(text) only on a miss in both tiers. None results are not cached.
+        """
+        key = cache_key(model_name, text)
+
+        with self._lock:
+            embedding = self._memory.get(key)
+            if embedding is not None:
+                self._memory.move_to_end(key)
+                self._stats['memory_hits'] += 1
+                return embedding
+
+        collection = None
+        try:
+            collection = self._collection()
+            if collection is not None:
+                doc = collection.find_one_and_update(
+                    {'_id': key},
+                    {'$set': {'last_used_at': datetime.utcnow()}, '$inc': {'hits': 1}},
+                    projection={'embedding': 1},
+                )
+                if doc and doc.get('embedding'):
+                    self._count('persistent_hits')
+                    self._remember(key, doc['embedding'])
+                    return doc['embedding']
+        except Exception as e:
+            self._count('errors')
+            print(f"[EMBED CACHE] Persistent lookup failed: {e}")
+
+        self._count('misses')
+        embedding = compute(text)
+        if embedding is None:
+            return None
+
+        self._remember(key, embedding)
+        if collection is not None:
+            try:
+                now = datetime.utcnow()
+                collection.update_one(
+                    {'_id': key},
+                    {
+                        '$set': {'embedding': embedding, 'last_used_at': now},
+                        '$setOnInsert': {
+                            'model': model_name,
+                            'text': normalize_text(text),
+                            'created_at': now,
+                            'hits': 0,
+                        },
+                    },
+                    upsert=True,
+                )
+            except Exception as e:
+                self._count('errors')
+                print(f"[EMBED CACHE] Persistent write failed: {e}")
+        return embedding
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_entries'] = len(self._memory)
+        lookups = stats['memory_hits'] + stats['persistent_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['memory_hits'] + stats['persistent_hits']) / lookups, 4) if lookups else 0.0
+        return stats
+
+
+embedding_cache = EmbeddingCache()
@@ -0,0 +1,123 @@
+# chatbot/fast_path.py
+"""
+Deterministic answers for structured lookups.
+
+"Show my portfolio" or "which livestock are the best performers" need no
+generation: prepare_turn has already fetched the exact rows, and the HTML
+table appended to the answer shows them. The router recognises these
+lookups and answers from a template in milliseconds instead of a multi-second
+Ollama call. Anything open-ended (advice, explanations, comparisons, long
+questions) or without data goes to the model as before.
+
+Answers carry metrics {'model': FAST_PATH_MODEL, 'fast_path': route}, which
+the metrics rollups count for the fast-path hit ratio.
+"""
+import threading
+
+from decouple import config
+
+CHATBOT_FAST_PATH = config('CHATBOT_FAST_PATH', default=True, cast=bool)
+FAST_PATH_MODEL = 'fast_path'
+# Longer messages are rarely plain lookups
+FAST_PATH_MAX_WORDS = 16
+
+PORTFOLIO, LEADERBOARD = 'portfolio', 'livestock_leaderboard'
+
+OPEN_ENDED_MARKERS = [
+    'why', 'should', 'advice', 'advise', 'recommend', 'suggest', 'explain', 'compare', 'improve',
+    'predict', 'forecast', 'what if', 'how can', 'how do i', 'how to', 'better', 'strategy',
+]
+
+
+def is_open_ended(message):
+    lowered = message.lower()
+    return len(lowered.split()) > FAST_PATH_MAX_WORDS or any(m in lowered for m in OPEN_ENDED_MARKERS)
+
+
+def _nrs(amount):
+    return f"NRS {amount:,.0f}"
+
+
+def portfolio_answer(portfolio_data):
+    if not portfolio_data:
+        return ("You don't have any active investments yet. Browse the marketplace to make your first "
+                "investment and it will show up here.")
+    invested = sum(i.get('total_investment', 0) for i in portfolio_data)
+    current = sum(i.get('current_value', 0) for i in portfolio_data)
+    profit = current - invested
+    pct = (profit / invested * 100) if invested else 0.0
+    holdings = len(portfolio_data)
+    lines = [
+        f"You hold {holdings} investment{'s' if holdings != 1 else ''} with a total of {_nrs(invested)} invested, "
+        f"now worth {_nrs(current)}.",
+        f"That is an overall {'profit' if profit >= 0 else 'loss'} of {_nrs(abs(profit))} ({pct:+.2f}%).",
+    ]
+    if holdings > 1:
+        best = max(portfolio_data, key=lambda i: i.get('profit_loss', 0))
+        worst = min(portfolio_data, key=lambda i: i.get('profit_loss', 0))
+        lines.append(f"Best performer: {best['product_name']} ({_nrs(best.get('profit_loss', 0))}, "
+                     f"{best.get('percentage_change', 0):+.2f}%).")
+        if worst is not best and worst.get('profit_loss', 0) < best.get('profit_loss', 0):
+            lines.append(f"Weakest: {worst['product_name']} ({_nrs(worst.get('profit_loss', 0))}, "
+                         f"{worst.get('percentage_change', 0):+.2f}%).")
+    lines.append("The full breakdown is in the table below.")
+    return " ".join(lines)
+
+
+def leaderboard_answer(message, best, worst):
+    lowered = message.lower()
+    # Same choice of list as append_table makes for the table
+    wants_worst = 'worst' in lowered or 'bottom' in lowered
+    ranked, label = (worst, 'worst') if wants_worst else (best, 'top')
+    if not ranked:
+        return None
+    listed = "; ".join(
+        f"{i + 1}. {item.get('name') or item.get('breed') or 'Unknown'} ({item.get('type', 'livestock')}): "
+        f"net {'profit' if item.get('profit', 0) >= 0 else 'loss'} {_nrs(abs(item.get('profit', 0)))}"
+        for i, item in enumerate(ranked[:3])
+    )
+    return (f"Here are the {label} performing livestock by net profit (current value minus purchase price): "
+            f"{listed}. The table below lists the {label} {len(ranked)}.")
+
+
+class FastPathRouter:
+    def __init__(self, enabled=CHATBOT_FAST_PATH):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stats = {'turns': 0, 'hits': 0, 'routes': {}}
+
+    def _match(self, turn):
+        message = turn['message']
+        if is_open_ended(message):
+            return None, None
+        lowered = message.lower()
+        # 'portfolio' is also what makes append_table add the holdings table
+        if turn['user_authenticated'] and 'portfolio' in lowered and turn['portfolio_data'] is not None:
+            return PORTFOLIO, portfolio_answer(turn['portfolio_data'])
+        if turn['livestock_perf_req']:
+            text = leaderboard_answer(message, turn['best_livestock'], turn['worst_livestock'])
+            if text:
+                return LEADERBOARD, text
+        return None, None
+
+    def route(self, turn):
+        """(route, text) for a structured lookup, (None, None) when the model should answer."""
+        route, text = self._match(turn) if self.enabled else (None, None)
+        with self._lock:
+            self._stats['turns'] += 1
+            if route:
+                self._stats['hits'] += 1
+                self._stats['routes'][route] = self._stats['routes'].get(route, 0) + 1
+        if route:
+            print(f"[FAST PATH] Answered '{route}' from template")
+        return route, text
+
+    def stats(self):
+        with self._lock:
+            stats = {**self._stats, 'routes': dict(self._stats['routes'])}
+        stats['hit_rate'] = round(stats['hits'] / stats['turns'], 4) if stats['turns'] else 0.0
+        stats['enabled'] = self.enabled
+        return stats
+
+
+fast_path_router = FastPathRouter()
@@ -0,0 +1,68 @@
+# chatbot/latency_sketch.py
+"""
+DDSketch-style latency quantiles that live inside Mongo documents.
+
+A value v > 0 falls in bucket ceil(log_gamma(v)), gamma = (1 + a) / (1 - a);
+reporting 2 * gamma^i / (gamma + 1) for that bucket is within a relative
+error of a (SKETCH_RELATIVE_ACCURACY) of the true value. Values <= 0 are
+counted in a separate zero bucket.
+
+A sketch is just {bucket key: count}, so it is updated with $inc and two
+sketches merge by adding counts: any set of daily rollups can be combined
+into one sketch for the whole window. With a = 2%, 1 ms to 10 minutes spans
+at most ~330 buckets, and real traffic fills far fewer.
+"""
+import math
+
+SKETCH_RELATIVE_ACCURACY = 0.02
+GAMMA = (1 + SKETCH_RELATIVE_ACCURACY) / (1 - SKETCH_RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(GAMMA)
+ZERO_BUCKET = 'z'
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def bucket_key(value):
+    if value is None or value <= 0:
+        return ZERO_BUCKET
+    return str(math.ceil(math.log(value) / _LOG_GAMMA))
+
+
+def bucket_value(key):
+    if key == ZERO_BUCKET:
+        return 0.0
+    return 2 * GAMMA ** int(key) / (GAMMA + 1)
+
+
+def sketch_inc(path, value, count=1):
+    """$inc entry adding value to the sketch stored at `path`."""
+    return {f"{path}.{bucket_key(value)}": count}
+
+
+def quantile(sketch, q):
+    """Estimated q-quantile (0 <= q <= 1) of a sketch; None if it is empty."""
+    buckets = sorted(
+        ((bucket_value(key), count) for key, count in (sketch or {}).items() if count > 0),
+        key=lambda b: b[0],
+    )
+    total = sum(count for _, count in buckets)
+    if not total:
+        return None
+    rank = q * (total - 1)
+    seen = 0
+    for value, count in buckets:
+        seen += count
+        if seen > rank:
+            return value
+    return buckets[-1][0]
+
+
+def percentiles(sketch):
+    """{'count', 'p50', 'p90', 'p95', 'p99'} in ms (rounded), or None for an empty sketch."""
+    count = sum((sketch or {}).values())
+    if not count:
+        return None
+    stats = {'count': count}
+    for p in PERCENTILES:
+        stats[f"p{p}"] = round(quantile(sketch, p / 100), 1)
+    return stats
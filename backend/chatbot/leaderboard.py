@@ -0,0 +1,179 @@
+# chatbot/leaderboard.py
+"""
+Materialised livestock performance leaderboard.
+
+`livestock_leaderboard` holds one document per scope: 'all' plus one per
+livestock type ('type:goat', ...). Each has the top and bottom
+LEADERBOARD_BUFFER animals by profit (current_value - purchase_price), twice
+the LEADERBOARD_SIZE the chat shows, so incremental removals rarely leave a
+list short before the next rebuild.
+
+Rebuilds stream the livestock collection once and keep bounded heaps per
+scope (`python manage.py rebuild_leaderboard`, scheduled). The 'all' document
+is written even when no animal ranks, so an empty collection is not rescanned
+on every read. Writers that change an animal's current_value, purchase_price,
+type or status (the payment flow marking it sold) call
+`animal_changed(db, animal_id)`, which patches every scope with atomic
+$pull / $push-$sort-$slice updates. The chat path is one _id lookup and never
+rebuilds inline: a missing or stale board is rebuilt in the background.
+"""
+import heapq
+import re
+import threading
+from datetime import datetime
+
+from decouple import config
+from pymongo import ReplaceOne
+
+LEADERBOARD_COLLECTION = 'livestock_leaderboard'
+LEADERBOARD_SIZE = 5
+LEADERBOARD_BUFFER = LEADERBOARD_SIZE * 2
+# Rebuilt in the background when read and older than this
+LEADERBOARD_MAX_AGE_SECONDS = config('LEADERBOARD_MAX_AGE_SECONDS', default=6 * 60 * 60, cast=int)
+
+ANIMAL_FIELDS = {'name': 1, 'breed': 1, 'type': 1, 'purchase_price': 1, 'current_value': 1, 'status': 1}
+ALL_SCOPE = 'all'
+
+_rebuilding = threading.Lock()
+
+
+def type_scope(animal_type):
+    return f"type:{str(animal_type).strip().lower()}"
+
+
+def _number(value):
+    try:
+        return float(str(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def leaderboard_entry(doc):
+    """The stored form of an animal, or None when its prices are not numeric."""
+    purchase_price = _number(doc.get('purchase_price'))
+    current_value = _number(doc.get('current_value'))
+    if purchase_price is None or current_value is None:
+        return None
+    return {
+        'key': doc['_id'],
+        'name': doc.get('name'),
+        'breed': doc.get('breed'),
+        'type': doc.get('type'),
+        'status': doc.get('status'),
+        'purchase_price': purchase_price,
+        'current_value': current_value,
+        'profit': current_value - purchase_price,
+    }
+
+
+def rebuild(db):
+    """Recompute every scope in one pass over livestock; returns the number of animals ranked."""
+    started = datetime.utcnow()
+    # scope -> (min-heap of top entries, max-heap of bottom entries); tie-break on a counter
+    heaps = {ALL_SCOPE: ([], [])}
+    counter = 0
+    for doc in db['livestock'].find({}, ANIMAL_FIELDS):
+        entry = leaderboard_entry(doc)
+        if entry is None:
+            continue
+        counter += 1
+        scopes = [ALL_SCOPE] + ([type_scope(entry['type'])] if entry.get('type') else [])
+        for scope in scopes:
+            top, bottom = heaps.setdefault(scope, ([], []))
+            item = (entry['profit'], counter, entry)
+            if len(top) < LEADERBOARD_BUFFER:
+                heapq.heappush(top, item)
+            elif item[:2] > top[0][:2]:
+                heapq.heapreplace(top, item)
+            neg = (-entry['profit'], counter, entry)
+            if len(bottom) < LEADERBOARD_BUFFER:
+                heapq.heappush(bottom, neg)
+            elif neg[:2] > bottom[0][:2]:
+                heapq.heapreplace(bottom, neg)
+
+    collection = db[LEADERBOARD_COLLECTION]
+    ops = []
+    for scope, (top, bottom) in heaps.items():
+        ops.append(ReplaceOne({'_id': scope}, {
+            '_id': scope,
+            'top': [e for _, _, e in sorted(top, key=lambda i: i[:2], reverse=True)],
+            'bottom': [e for _, _, e in sorted(bottom, key=lambda i: i[:2], reverse=True)],
+            'rebuilt_at': started,
+            'updated_at': datetime.utcnow(),
+        }, upsert=True))
+    if ops:
+        collection.bulk_write(ops, ordered=False)
+    # Types that no longer have any animals
+    collection.delete_many({'_id': {'$nin': list(heaps)}})
+    print(f"[LEADERBOARD] Rebuilt {len(heaps)} scope(s) from {counter} animals")
+    return counter
+
+
+def animal_changed(db, animal_id):
+    """
+    Patch every scope after one animal's prices, type, status or existence
+    changed. animal_id is the livestock document's _id. Failures are logged,
+    not raised: the next rebuild repairs the board.
+    """
+    collection = db[LEADERBOARD_COLLECTION]
+    now = datetime.utcnow()
+    try:
+        # Drop the old entry wherever it is (its type may have changed too)
+        collection.update_many(
+            {'$or': [{'top.key': animal_id}, {'bottom.key': animal_id}]},
+            {'$pull': {'top': {'key': animal_id}, 'bottom': {'key': animal_id}}, '$set': {'updated_at': now}},
+        )
+        doc = db['livestock'].find_one({'_id': animal_id}, ANIMAL_FIELDS)
+        entry = leaderboard_entry(doc) if doc else None
+        if entry is None:
+            return
+        scopes = [ALL_SCOPE] + ([type_scope(entry['type'])] if entry.get('type') else [])
+        for scope in scopes:
+            collection.update_one({'_id': scope}, {
+                '$push': {
+                    'top': {'$each': [entry], '$sort': {'profit': -1}, '$slice': LEADERBOARD_BUFFER},
+                    'bottom': {'$each': [entry], '$sort': {'profit': 1}, '$slice': LEADERBOARD_BUFFER},
+                },
+                '$set': {'updated_at': now},
+            }, upsert=True)
+    except Exception as e:
+        print(f"[LEADERBOARD] Update for animal {animal_id} failed: {e}")
+
+
+def _rebuild_in_background(db):
+    if not _rebuilding.acquire(blocking=False):
+        return
+
+    def run():
+        try:
+            rebuild(db)
+        except Exception as e:
+            print(f"[LEADERBOARD] Background rebuild failed: {e}")
+        finally:
+            _rebuilding.release()
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def read_leaderboard(db, message=''):
+    """
+    (best, worst, scope) for the chat: the type-specific board when the
+    message names a ranked livestock type, otherwise the overall one.
+    """
+    words = set()
+    for w in re.findall(r"[a-z]+", message.lower()):
+        # 'goats' -> goat, 'buffaloes' -> buffalo
+        words.update({w, w[:-1] if w.endswith('s') else w, w[:-2] if w.endswith('es') else w})
+    candidates = [ALL_SCOPE] + sorted(type_scope(w) for w in words)
+    docs = {d['_id']: d for d in db[LEADERBOARD_COLLECTION].find({'_id': {'$in': candidates}})}
+
+    scope = next((s for s in candidates[1:] if s in docs), ALL_SCOPE)
+    board = docs.get(scope)
+    if not board:
+        # Never built: build it off the request path; this answer goes without rankings
+        _rebuild_in_background(db)
+        return [], [], scope
+    rebuilt_at = board.get('rebuilt_at')
+    if rebuilt_at is None or (datetime.utcnow() - rebuilt_at).total_seconds() > LEADERBOARD_MAX_AGE_SECONDS:
+        _rebuild_in_background(db)
+    return board.get('top', [])[:LEADERBOARD_SIZE], board.get('bottom', [])[:LEADERBOARD_SIZE], scope
@@ -0,0 +1,83 @@
+"""
+Rebuild chatbot_metrics_rollups from chat_messages and chatbot_sessions.
+
+Needed once after deploying the rollups (older turns were never counted),
+or after changing what the rollups track. Rollups in the range are deleted
+and recomputed with the same update ops the live path uses. Turns saved
+while it runs can be counted twice, so run it when the chatbot is quiet.
+
+    python manage.py backfill_metrics_rollups
+    python manage.py backfill_metrics_rollups --days 30
+"""
+import time
+from datetime import datetime, timedelta
+
+from decouple import config
+from django.core.management.base import BaseCommand
+from pymongo import ASCENDING, MongoClient
+
+from chatbot.metrics_rollups import (
+    DAY, ROLLUP_COLLECTION, error_rollup_ops, period_start, session_rollup_ops, turn_rollup_ops,
+)
+
+MONGO_URI = config('MONGO_URI')
+MONGO_DB_NAME = config('MONGO_DB_NAME', default='django_project')
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the pre-aggregated chatbot metrics rollups from raw messages and sessions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help='Only rebuild the last N UTC days (default: all history)')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        client = MongoClient(MONGO_URI)
+        db = client[MONGO_DB_NAME]
+        rollups = db[ROLLUP_COLLECTION]
+        rollups.create_index([('granularity', ASCENDING), ('period_start', ASCENDING)])
+
+        since = None
+        if options['days']:
+            since = period_start(datetime.utcnow() - timedelta(days=options['days'] - 1), DAY)
+        deleted = rollups.delete_many({'period_start': {'$gte': since}} if since else {}).deleted_count
+        self.stdout.write(f"Deleted {deleted} rollup documents")
+
+        started = time.time()
+        batch_size = options['batch_size']
+        pending = []
+        counts = {'turns': 0, 'errors': 0, 'sessions': 0}
+
+        def flush():
+            if pending:
+                rollups.bulk_write([op for _, op in pending], ordered=True)
+                pending.clear()
+
+        window = {'$gte': since} if since else {'$exists': True}
+        messages = db['chat_messages'].find(
+            {'timestamp': window, '$or': [{'role': 'assistant', 'error': False}, {'error': True}]},
+            {'content': 0, 'retrieval_timings': 0},
+        )
+        for doc in messages:
+            if doc.get('error'):
+                pending.extend(error_rollup_ops(doc['timestamp']))
+                counts['errors'] += 1
+            else:
+                pending.extend(turn_rollup_ops(doc))
+                counts['turns'] += 1
+            if len(pending) >= batch_size:
+                flush()
+
+        for session in db['chatbot_sessions'].find({'started_at': window}, {'started_at': 1}):
+            pending.extend(session_rollup_ops(session['started_at']))
+            counts['sessions'] += 1
+            if len(pending) >= batch_size:
+                flush()
+        flush()
+
+        client.close()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rolled up {counts['turns']} turns, {counts['errors']} errors and {counts['sessions']} sessions "
+            f"in {time.time() - started:.1f}s"
+        ))
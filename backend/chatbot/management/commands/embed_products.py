@@ -0,0 +1,217 @@
+"""
+Management command to (re)embed product listings for chatbot retrieval.
+
+Products are scanned in _id order and only those whose embedded text changed
+(tracked by a sha256 `embedding_hash` of model + text) are sent to Ollama.
+Texts go out in batches over a bounded thread pool, results are written back
+with one unordered bulk_write per batch, and progress is checkpointed so an
+interrupted run resumes where it stopped.
+
+    python manage.py embed_products
+    python manage.py embed_products --workers 8 --batch-size 64
+    python manage.py embed_products --restart
+"""
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+
+import requests
+from decouple import config
+from django.core.management.base import BaseCommand
+from pymongo import ASCENDING, MongoClient, UpdateOne
+
+OLLAMA_BASE_URL = "http://localhost:11434"
+OLLAMA_EMBED_MODEL = "qwen3-embedding:0.6b"
+MONGO_URI = config('MONGO_URI')
+MONGO_DB_NAME = config('MONGO_DB_NAME', default='django_project')
+PRODUCTS_COLLECTION = "products"
+CHECKPOINT_COLLECTION = "embedding_checkpoints"
+
+TEXT_FIELDS = {'name': 1, 'title': 1, 'description': 1, 'category': 1}
+
+
+def embedding_text(doc):
+    name = doc.get('name') or doc.get('title') or ''
+    return f"{name} {doc.get('description', '') or ''} {doc.get('category', '') or ''}".strip()
+
+
+def embedding_hash(model_name, text):
+    return hashlib.sha256(f"{model_name}\x00{text}".encode('utf-8')).hexdigest()
+
+
+class OllamaEmbedder:
+    """Batch embeddings over a pooled session, with retries."""
+
+    def __init__(self, model_name, base_url=OLLAMA_BASE_URL, pool_size=8, retries=3):
+        self.model_name = model_name
+        self.base_url = base_url
+        self.retries = retries
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._batch_endpoint = True
+
+    def embed(self, texts):
+        for attempt in range(1, self.retries + 1):
+            try:
+                return self._embed_once(texts)
+            except Exception:
+                if attempt == self.retries:
+                    raise
+                time.sleep(2 ** attempt)
+
+    def _embed_once(self, texts):
+        if self._batch_endpoint:
+            res = self.session.post(
+                f"{self.base_url}/api/embed",
+                json={"model": self.model_name, "input": texts},
+                timeout=120,
+            )
+            if res.status_code != 404:
+                res.raise_for_status()
+                return res.json()["embeddings"]
+            # Older Ollama: no batch endpoint, one text per call
+            self._batch_endpoint = False
+
+        embeddings = []
+        for text in texts:
+            res = self.session.post(
+                f"{self.base_url}/api/embeddings",
+                json={"model": self.model_name, "prompt": text},
+                timeout=60,
+            )
+            res.raise_for_status()
+            embeddings.append(res.json()["embedding"])
+        return embeddings
+
+
+class Command(BaseCommand):
+    help = 'Embeds new and changed products in batches (resumable)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=32, help='Texts per embed request')
+        parser.add_argument('--workers', type=int, default=4, help='Concurrent embed requests')
+        parser.add_argument('--model', default=OLLAMA_EMBED_MODEL, help='Ollama embedding model')
+        parser.add_argument('--restart', action='store_true', help='Ignore the saved checkpoint')
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        workers = max(1, options['workers'])
+        model_name = options['model']
+
+        client = MongoClient(MONGO_URI)
+        db = client[MONGO_DB_NAME]
+        products = db[PRODUCTS_COLLECTION]
+        checkpoints = db[CHECKPOINT_COLLECTION]
+        checkpoint_id = f"{PRODUCTS_COLLECTION}:{model_name}"
+
+        checkpoint = None if options['restart'] else checkpoints.find_one({'_id': checkpoint_id})
+        query = {}
+        if checkpoint and checkpoint.get('last_id') is not None:
+            query['_id'] = {'$gt': checkpoint['last_id']}
+            self.stdout.write(self.style.WARNING(f"Resuming after _id {checkpoint['last_id']}"))
+
+        embedder = OllamaEmbedder(model_name, pool_size=workers)
+        stats = {'scanned': 0, 'unchanged': 0, 'embedded': 0, 'failed': 0}
+        started = time.time()
+
+        # Batches are numbered in scan order; the checkpoint only advances past
+        # a batch once it and every batch before it have been written.
+        pending = {}
+        finished = {}
+        next_to_commit = 0
+        submitted = 0
+
+        def run_batch(batch):
+            texts = [text for _, text, _ in batch]
+            embeddings = embedder.embed(texts)
+            # embedded_at is the server's clock when the write is applied, not when the
+            # batch was built, so the vector index watermark tracks commit order
+            ops = [
+                UpdateOne({'_id': doc_id}, {
+                    '$set': {
+                        'embedding': embedding,
+                        'embedding_hash': digest,
+                        'embedding_model': model_name,
+                    },
+                    '$currentDate': {'embedded_at': True},
+                })
+                for (doc_id, _, digest), embedding in zip(batch, embeddings)
+            ]
+            products.bulk_write(ops, ordered=False)
+            return len(ops)
+
+        def collect(done):
+            nonlocal next_to_commit
+            for future in done:
+                seq, last_id = pending.pop(future)
+                try:
+                    stats['embedded'] += future.result()
+                except Exception as e:
+                    stats['failed'] += 1
+                    self.stderr.write(f"Batch {seq} failed: {e}")
+                    last_id = None
+                finished[seq] = last_id
+
+            # Advance the checkpoint over the completed prefix; stop at a failed batch
+            while next_to_commit in finished and finished[next_to_commit] is not None:
+                last_id = finished.pop(next_to_commit)
+                checkpoints.update_one(
+                    {'_id': checkpoint_id},
+                    {'$set': {'last_id': last_id, 'updated_at': datetime.utcnow(), **stats}},
+                    upsert=True,
+                )
+                next_to_commit += 1
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            batch = []
+            cursor = products.find(query, {**TEXT_FIELDS, 'embedding_hash': 1}).sort('_id', ASCENDING)
+
+            def submit(batch_docs, last_id):
+                nonlocal submitted
+                # Bound memory: at most two batches queued per worker
+                while len(pending) >= workers * 2:
+                    done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                    collect(done)
+                pending[pool.submit(run_batch, batch_docs)] = (submitted, last_id)
+                submitted += 1
+
+            last_scanned = None
+            for doc in cursor:
+                stats['scanned'] += 1
+                last_scanned = doc['_id']
+                text = embedding_text(doc)
+                digest = embedding_hash(model_name, text)
+                if not text or doc.get('embedding_hash') == digest:
+                    stats['unchanged'] += 1
+                    continue
+                batch.append((doc['_id'], text, digest))
+                if len(batch) >= batch_size:
+                    submit(batch, last_scanned)
+                    batch = []
+
+                if stats['scanned'] % 5000 == 0:
+                    self.stdout.write(f"  scanned {stats['scanned']}, embedded {stats['embedded']}")
+
+            if batch:
+                submit(batch, last_scanned)
+            while pending:
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                collect(done)
+
+        if stats['failed']:
+            self.stdout.write(self.style.WARNING(
+                f"{stats['failed']} batch(es) failed; rerun to resume from the last checkpoint"
+            ))
+        else:
+            # Full pass done: the next run scans from the start again for changed listings
+            checkpoints.delete_one({'_id': checkpoint_id})
+
+        elapsed = time.time() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Scanned {stats['scanned']}, embedded {stats['embedded']}, "
+            f"unchanged {stats['unchanged']} in {elapsed:.1f}s"
+        ))
+        client.close()
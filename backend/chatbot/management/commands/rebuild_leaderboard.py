@@ -0,0 +1,34 @@
+"""
+Recompute the materialised livestock performance leaderboard.
+
+Schedule it (cron / systemd timer) to pick up price changes made outside the
+app; the chat path also triggers a background rebuild once the board is older
+than LEADERBOARD_MAX_AGE_SECONDS.
+
+    python manage.py rebuild_leaderboard
+"""
+import time
+
+from decouple import config
+from django.core.management.base import BaseCommand
+from pymongo import MongoClient
+
+from chatbot.leaderboard import rebuild
+
+MONGO_URI = config('MONGO_URI')
+MONGO_DB_NAME = config('MONGO_DB_NAME', default='django_project')
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the livestock performance leaderboard (overall and per type)'
+
+    def handle(self, *args, **options):
+        client = MongoClient(MONGO_URI)
+        try:
+            started = time.time()
+            ranked = rebuild(client[MONGO_DB_NAME])
+            self.stdout.write(self.style.SUCCESS(
+                f"Ranked {ranked} animals in {time.time() - started:.1f}s"
+            ))
+        finally:
+            client.close()
@@ -0,0 +1,288 @@
+# chatbot/metrics_rollups.py
+"""
+Pre-aggregated chatbot metrics.
+
+Every saved turn, failed turn and new session bumps two small documents in
+chatbot_metrics_rollups: one for its UTC day ('day:2026-01-31') and one for
+its hour ('hour:2026-01-31T14'). Counters, sums and histograms use $inc,
+extremes use $min/$max, so concurrent writers never conflict and the
+dashboard reads O(days) documents instead of aggregating chat_messages.
+
+Day documents also carry latency sketches (chatbot/latency_sketch.py) for
+wall-clock and time to first token, overall and per model and intent, plus
+one per pipeline stage; summing them across days gives window percentiles.
+
+`python manage.py backfill_metrics_rollups` rebuilds the rollups from the
+raw collections (first deploy, or after changing what is counted).
+"""
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne
+
+from .latency_sketch import percentiles, sketch_inc
+
+ROLLUP_COLLECTION = 'chatbot_metrics_rollups'
+DAY, HOUR = 'day', 'hour'
+
+# Same output_tokens boundaries the tokens-vs-latency chart has always used
+TOKEN_BUCKET_BOUNDARIES = [0, 50, 100, 150, 200, 300, 400, 600, 800, 1200]
+
+# Summed per answered turn; averages are sum / messages, except time to
+# first token, which only streamed turns have (sum / streamed_messages)
+SUMMED_FIELDS = {
+    'time_to_first_token_ms': 'time_to_first_token_ms',
+    'wall_clock_ms':          'wall_clock_ms',
+    'ollama_ms':              'ollama_duration_ms',
+    'tokens_per_second':      'tokens_per_second',
+    'output_tokens':          'output_tokens',
+    'bot_words':              'word_count',
+    'user_words':             'user_word_count',
+}
+EXTREME_FIELDS = ['time_to_first_token_ms', 'wall_clock_ms']
+
+# Sketched overall, per model and per intent (day documents only)
+SKETCHED_FIELDS = ['wall_clock_ms', 'time_to_first_token_ms']
+# Pipeline stages sketched overall; persistence comes from the write-behind batches
+STAGES = ['embedding', 'retrieval', 'prompt_eval', 'generation', 'persistence']
+
+
+def rollup_key(value):
+    """A value usable as a field name: Mongo reserves '.' and a leading '$'."""
+    key = str(value if value is not None else 'unknown').replace('.', '_').lstrip('$')
+    return key or 'unknown'
+
+
+def period_start(ts, granularity):
+    if granularity == DAY:
+        return datetime(ts.year, ts.month, ts.day)
+    return datetime(ts.year, ts.month, ts.day, ts.hour)
+
+
+def period_id(ts, granularity):
+    start = period_start(ts, granularity)
+    return f"{granularity}:{start.strftime('%Y-%m-%d' if granularity == DAY else '%Y-%m-%dT%H')}"
+
+
+def token_bucket(output_tokens):
+    """Lower boundary of the output_tokens bucket as a key ('0', '50', ..., '1200+')."""
+    if output_tokens >= TOKEN_BUCKET_BOUNDARIES[-1]:
+        return f"{TOKEN_BUCKET_BOUNDARIES[-1]}+"
+    lower = max(b for b in TOKEN_BUCKET_BOUNDARIES if b <= output_tokens)
+    return str(lower)
+
+
+def _rollup_ops(ts, update, day_inc=None):
+    """
+    (collection, op) pairs applying update to ts's day and hour rollups;
+    day_inc adds day-only $inc entries (the sketches).
+    """
+    ops = []
+    for granularity in (DAY, HOUR):
+        full = dict(update)
+        if granularity == DAY and day_inc:
+            full['$inc'] = {**full.get('$inc', {}), **day_inc}
+        full['$setOnInsert'] = {'granularity': granularity, 'period_start': period_start(ts, granularity)}
+        ops.append((ROLLUP_COLLECTION, UpdateOne({'_id': period_id(ts, granularity)}, full, upsert=True)))
+    return ops
+
+
+def measured(assistant_doc, field):
+    """
+    The turn's value for field, or None when it was not measured: only
+    streamed turns have a time to first token (older non-streamed messages
+    stored the wall clock there, hence the check on `streamed`).
+    """
+    if field == 'time_to_first_token_ms' and not assistant_doc.get('streamed'):
+        return None
+    return assistant_doc.get(field)
+
+
+def turn_rollup_ops(assistant_doc):
+    """Rollup ops for one answered turn (an assistant chat_messages doc)."""
+    inc = {
+        'messages': 1,
+        'streamed_messages': 1 if assistant_doc.get('streamed') else 0,
+        'total_tokens': assistant_doc.get('total_tokens', 0),
+        'total_cost': assistant_doc.get('cost_usd', 0.0),
+        'cached_responses': 1 if assistant_doc.get('cached') else 0,
+        'fast_path_responses': 1 if assistant_doc.get('fast_path') else 0,
+        f"intents.{rollup_key(assistant_doc.get('intent'))}": 1,
+        f"sentiments.{rollup_key(assistant_doc.get('sentiment'))}": 1,
+    }
+    for name, field in SUMMED_FIELDS.items():
+        inc[f"sums.{name}"] = measured(assistant_doc, field) or 0
+    if assistant_doc.get('fast_path'):
+        inc[f"fast_path.{rollup_key(assistant_doc['fast_path'])}"] = 1
+
+    update = {'$inc': inc}
+    extremes = {name: measured(assistant_doc, name) for name in EXTREME_FIELDS
+                if measured(assistant_doc, name) is not None}
+    if extremes:
+        update['$min'] = {f"min.{name}": value for name, value in extremes.items()}
+        update['$max'] = {f"max.{name}": value for name, value in extremes.items()}
+
+    output_tokens = assistant_doc.get('output_tokens') or 0
+    wall_clock_ms = assistant_doc.get('wall_clock_ms') or 0
+    if output_tokens > 0 and wall_clock_ms > 0:
+        bucket = f"token_buckets.{token_bucket(output_tokens)}"
+        inc[f"{bucket}.count"] = 1
+        inc[f"{bucket}.latency_sum"] = wall_clock_ms
+        inc[f"{bucket}.chars_sum"] = assistant_doc.get('message_length', 0)
+    return _rollup_ops(assistant_doc['timestamp'], update, turn_sketch_inc(assistant_doc))
+
+
+def turn_sketch_inc(assistant_doc):
+    """Day-rollup sketch increments for one answered turn."""
+    model = rollup_key(assistant_doc.get('model'))
+    intent = rollup_key(assistant_doc.get('intent'))
+    inc = {}
+    for name in SKETCHED_FIELDS:
+        value = measured(assistant_doc, name)
+        if value is None:
+            continue
+        for path in ('all', f"model.{model}", f"intent.{intent}"):
+            inc.update(sketch_inc(f"sketches.{name}.{path}", value))
+
+    stage_ms = dict(assistant_doc.get('stage_ms') or {})
+    # Cached answers and canned replies never reached the model
+    if not assistant_doc.get('cached') and assistant_doc.get('output_tokens'):
+        stage_ms['prompt_eval'] = assistant_doc.get('prompt_eval_ms', 0)
+        stage_ms['generation'] = assistant_doc.get('eval_ms', 0)
+    for stage, value in stage_ms.items():
+        if stage in STAGES and value is not None:
+            inc.update(sketch_inc(f"stages.{stage}", value))
+    return inc
+
+
+def persistence_rollup_ops(ts, write_ms, turns):
+    """Record `turns` turns written by one write-behind batch that took write_ms."""
+    inc = sketch_inc('stages.persistence', write_ms, turns)
+    return [(ROLLUP_COLLECTION, UpdateOne(
+        {'_id': period_id(ts, DAY)},
+        {'$inc': inc, '$setOnInsert': {'granularity': DAY, 'period_start': period_start(ts, DAY)}},
+        upsert=True,
+    ))]
+
+
+def error_rollup_ops(ts):
+    return _rollup_ops(ts, {'$inc': {'errors': 1}})
+
+
+def session_rollup_ops(ts):
+    return _rollup_ops(ts, {'$inc': {'sessions': 1}})
+
+
+def _merge(total, part):
+    """Add a rollup document's counters into total (nested dicts summed key by key)."""
+    for key, value in part.items():
+        if isinstance(value, dict):
+            _merge(total.setdefault(key, {}), value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            total[key] = total.get(key, 0) + value
+
+
+def summarize_rollups(day_docs, hour_docs=()):
+    """
+    Fold day rollups (and optionally hour rollups) into the figures
+    get_metrics_summary reports. Docs are expected oldest first.
+    """
+    totals = {}
+    mins, maxs = {}, {}
+    daily_counts = []
+    for doc in day_docs:
+        _merge(totals, {k: v for k, v in doc.items() if k not in ('min', 'max', 'period_start')})
+        for name, value in doc.get('min', {}).items():
+            mins[name] = min(mins.get(name, value), value)
+        for name, value in doc.get('max', {}).items():
+            maxs[name] = max(maxs.get(name, value), value)
+        daily_counts.append({'date': doc['period_start'].strftime('%Y-%m-%d'), 'messages': doc.get('messages', 0)})
+
+    messages = totals.get('messages', 0)
+    streamed = totals.get('streamed_messages', 0)
+    errors = totals.get('errors', 0)
+    sums = totals.get('sums', {})
+
+    def avg(name, count=messages):
+        return round(sums.get(name, 0) / count, 2) if count else 0
+
+    tokens_vs_latency = []
+    buckets = totals.get('token_buckets', {})
+    for lower, upper in zip(TOKEN_BUCKET_BOUNDARIES, TOKEN_BUCKET_BOUNDARIES[1:] + [None]):
+        key = str(lower) if upper is not None else f"{lower}+"
+        bucket = buckets.get(key)
+        if not bucket or not bucket.get('count'):
+            continue
+        tokens_vs_latency.append({
+            'bucket': f"{lower}–{upper} tok" if upper is not None else f"{key} tok",
+            'avg_latency_ms': round(bucket.get('latency_sum', 0) / bucket['count'], 1),
+            'avg_chars': round(bucket.get('chars_sum', 0) / bucket['count'], 0),
+            'count': bucket['count'],
+        })
+
+    sketches = totals.get('sketches', {})
+    latency_percentiles = {name: percentiles(sketches.get(name, {}).get('all')) for name in SKETCHED_FIELDS}
+    by_model, by_intent = {}, {}
+    for name in SKETCHED_FIELDS:
+        for model, sketch in sketches.get(name, {}).get('model', {}).items():
+            by_model.setdefault(model, {})[name] = percentiles(sketch)
+        for intent, sketch in sketches.get(name, {}).get('intent', {}).items():
+            by_intent.setdefault(intent, {})[name] = percentiles(sketch)
+    stage_percentiles = {stage: percentiles(totals.get('stages', {}).get(stage)) for stage in STAGES}
+
+    intents = sorted(totals.get('intents', {}).items(), key=lambda kv: kv[1], reverse=True)[:10]
+    cached = totals.get('cached_responses', 0)
+    fast_path = totals.get('fast_path_responses', 0)
+    return {
+        'total_sessions':       totals.get('sessions', 0),
+        'total_messages':       messages,
+        'total_errors':         errors,
+        'error_rate_pct':       round(errors / (messages + errors) * 100, 2) if messages + errors else 0.0,
+        'total_tokens':         totals.get('total_tokens', 0),
+        'total_cost_usd':       round(totals.get('total_cost', 0.0), 4),
+        'cached_responses':     cached,
+        'cache_hit_rate_pct':   round(cached / messages * 100, 2) if messages else 0.0,
+        'fast_path_responses':  fast_path,
+        'fast_path_hit_rate_pct': round(fast_path / messages * 100, 2) if messages else 0.0,
+        'fast_path_breakdown':  totals.get('fast_path', {}),
+        'streamed_messages':    streamed,
+        'avg_time_to_first_token_ms': avg('time_to_first_token_ms', streamed),
+        'min_time_to_first_token_ms': mins.get('time_to_first_token_ms', 0),
+        'max_time_to_first_token_ms': maxs.get('time_to_first_token_ms', 0),
+        'avg_wall_clock_ms':    avg('wall_clock_ms'),
+        'min_wall_clock_ms':    mins.get('wall_clock_ms', 0),
+        'max_wall_clock_ms':    maxs.get('wall_clock_ms', 0),
+        'avg_ollama_ms':        avg('ollama_ms'),
+        'avg_tokens_per_second':avg('tokens_per_second'),
+        'avg_output_tokens':    avg('output_tokens'),
+        'avg_bot_words':        avg('bot_words'),
+        'avg_user_words':       avg('user_words'),
+        'intent_breakdown':     dict(intents),
+        'sentiment_breakdown':  totals.get('sentiments', {}),
+        'daily_counts':         daily_counts,
+        'hourly_counts':        [
+            {'hour': doc['period_start'].strftime('%Y-%m-%dT%H:00'), 'messages': doc.get('messages', 0),
+             'errors': doc.get('errors', 0)}
+            for doc in hour_docs
+        ],
+        'tokens_vs_latency':    tokens_vs_latency,
+        # Percentiles (ms) from the merged daily sketches
+        'latency_percentiles':  latency_percentiles,
+        'latency_percentiles_by_model':  by_model,
+        'latency_percentiles_by_intent': by_intent,
+        'stage_percentiles':    stage_percentiles,
+    }
+
+
+def read_rollups(db, days, hours=48):
+    """(day_docs, hour_docs) covering the last `days` UTC days and `hours` hours, oldest first."""
+    now = datetime.utcnow()
+    collection = db[ROLLUP_COLLECTION]
+    day_docs = list(collection.find(
+        {'granularity': DAY, 'period_start': {'$gte': period_start(now - timedelta(days=days - 1), DAY)}},
+        sort=[('period_start', 1)],
+    ))
+    hour_docs = list(collection.find(
+        {'granularity': HOUR, 'period_start': {'$gte': period_start(now - timedelta(hours=hours - 1), HOUR)}},
+        sort=[('period_start', 1)],
+    ))
+    return day_docs, hour_docs
@@ -1,8 +1,282 @@
+import threading
 import pymongo
-from pymongo import MongoClient
-from datetime import datetime, timedelta
+from pymongo import DeleteOne, InsertOne, MongoClient, ReplaceOne, UpdateOne
+from datetime import datetime
 from decouple import config
 
+from .context_builder import KEEP_RECENT_MESSAGES, merge_summary, summarize_messages
+from .metrics_rollups import (
+    ROLLUP_COLLECTION, error_rollup_ops, persistence_rollup_ops, read_rollups, session_rollup_ops, summarize_rollups,
+    turn_rollup_ops,
+)
+from .turn_writer import TurnWriter
+
+# Sessions idle for less than this are continued when no session_id is sent
+SESSION_REUSE_SECONDS = 3600
+
+# Ollama KV contexts (token arrays) kept per session for follow-up turns
+KV_CONTEXT_COLLECTION = 'chatbot_kv_contexts'
+OLLAMA_KV_CONTEXT_MAX_TOKENS = config('OLLAMA_KV_CONTEXT_MAX_TOKENS', default=8192, cast=int)
+KV_CONTEXT_TTL_SECONDS = 6 * 60 * 60
+
+
+# ── Document builders (shared by the sync and async managers) ─────────────
+def reusable_session_id(latest_session):
+    """The user's latest session id if it is recent enough to continue, else None."""
+    if latest_session and (datetime.utcnow() - latest_session['last_activity']).seconds < SESSION_REUSE_SECONDS:
+        return latest_session['session_id']
+    return None
+
+
+def new_session_doc(mongo_user_id, user_message):
+    now = datetime.utcnow()
+    title = (user_message[:30] + '...') if len(user_message) > 30 else user_message
+    return {
+        'session_id': f"SESSION_{now.strftime('%Y%m%d_%H%M%S')}",
+        'user_id': mongo_user_id,
+        'title': title,
+        'started_at': now,
+        'last_activity': now,
+        'total_messages': 0,
+        'total_tokens_used': 0,
+        'total_cost': 0.0,
+        'avg_response_time_ms': 0.0,
+        'error_count': 0,
+        'is_active': True,
+    }
+
+
+def build_turn_docs(session_id, user_message, bot_response, metrics, sentiment, intent,
+                    wall_clock_ms, time_to_first_token_ms, cached, retrieval_timings, now, stage_ms=None):
+    """(user_doc, assistant_doc) for one completed turn."""
+    # ── Derived metrics ────────────────────────────────────────────
+    m = metrics or {}
+    input_tokens      = m.get('input_tokens', 0)
+    output_tokens     = m.get('output_tokens', 0)
+    total_tokens      = m.get('total_tokens', 0)
+    ollama_ms         = m.get('total_duration_ms', 0)
+    tokens_per_second = m.get('tokens_per_second', 0)
+    model_name        = m.get('model', 'unknown')
+
+    # Cost estimate: $0.03 / 1k tokens
+    cost = (total_tokens / 1000) * 0.03
+
+    # Message / word counts
+    user_msg_len  = len(user_message)
+    user_words    = len(user_message.split())
+    bot_msg_len   = len(bot_response)
+    bot_words     = len(bot_response.split())
+
+    # ── User message ───────────────────────────────────────────────
+    user_doc = {
+        'message_id':          f"MSG_{now.strftime('%y%m%d%H%M%S%f')}",
+        'session_id':          session_id,
+        'role':                'user',
+        'content':             user_message,
+        'timestamp':           now,
+        'message_length':      user_msg_len,
+        'word_count':          user_words,
+        'sentiment':           sentiment,
+        'intent':              intent,
+        'error':               False,
+    }
+
+    # ── Assistant response with full metrics ───────────────────────
+    assistant_doc = {
+        'message_id':           f"MSG_{now.strftime('%y%m%d%H%M%S%f')}_bot",
+        'session_id':           session_id,
+        'role':                 'assistant',
+        'content':              bot_response,
+        'timestamp':            now,
+        # Response timing
+        # Only a streamed turn has a first token; None for non-streamed turns
+        'time_to_first_token_ms': time_to_first_token_ms,
+        'ollama_first_token_ms': m.get('ollama_first_token_ms', 0),
+        'streamed':             time_to_first_token_ms is not None,
+        'wall_clock_ms':        wall_clock_ms,       # full request→response latency
+        'ollama_duration_ms':   ollama_ms,           # Ollama-only processing time
+        'prompt_eval_ms':       m.get('prompt_eval_duration_ms', 0),
+        'eval_ms':              m.get('eval_duration_ms', 0),
+        'load_duration_ms':     m.get('load_duration_ms', 0),
+        'kv_context_tokens':    m.get('kv_context_tokens', 0),  # prior turns reused from Ollama's KV context
+        # Token usage
+        'input_tokens':         input_tokens,
+        'output_tokens':        output_tokens,
+        'total_tokens':         total_tokens,
+        'context_tokens':       input_tokens,        # tokens used for context
+        'tokens_per_second':    tokens_per_second,
+        # Message quality
+        'message_length':       bot_msg_len,
+        'word_count':           bot_words,
+        'user_message_length':  user_msg_len,
+        'user_word_count':      user_words,
+        # Cost
+        'cost_usd':             cost,
+        # Classification
+        'model':                model_name,
+        'sentiment':            sentiment,
+        'intent':               intent,
+        'cached':               cached,              # served from the semantic response cache
+        'fast_path':            m.get('fast_path'),  # template route that answered without the model, if any
+        # Per-source context retrieval: {'ms': ..., 'status': 'ok'|'error'|'timeout'}
+        'retrieval_timings':    retrieval_timings or {},
+        # Request-path stage latencies measured in the view: {'retrieval': ms, 'embedding': ms}
+        'stage_ms':             stage_ms or {},
+        # The canned reply served while the Ollama circuit is open is a failed turn, not an answer
+        'error':                bool(m.get('circuit_open')),
+    }
+    if assistant_doc['error']:
+        assistant_doc['error_type'] = 'circuit_open'
+    return user_doc, assistant_doc
+
+
+def session_update(assistant_doc, now):
+    """
+    chatbot_sessions update for one turn. An aggregation-pipeline update, so
+    the server computes the rolling average response time from the stored
+    counts: no read-modify-write, and concurrent turns cannot lose an update.
+    """
+    prev_msgs = {'$ifNull': ['$total_messages', 0]}
+    prev_turns = {'$floor': {'$divide': [prev_msgs, 2]}}  # completed turns before this one
+    prev_avg = {'$ifNull': ['$avg_response_time_ms', 0]}
+    return [{'$set': {
+        'total_messages':       {'$add': [prev_msgs, 2]},
+        'total_tokens_used':    {'$add': [{'$ifNull': ['$total_tokens_used', 0]}, assistant_doc['total_tokens']]},
+        'total_cost':           {'$add': [{'$ifNull': ['$total_cost', 0]}, assistant_doc['cost_usd']]},
+        'last_activity':        now,
+        'primary_topic':        {'$literal': assistant_doc['intent']},
+        'avg_response_time_ms': {'$round': [{'$divide': [
+            {'$add': [{'$multiply': [prev_avg, prev_turns]}, assistant_doc['wall_clock_ms']]},
+            {'$add': [prev_turns, 1]},
+        ]}, 2]},
+        'session_duration_s':   {'$round': [{'$divide': [
+            {'$subtract': [now, {'$ifNull': ['$started_at', now]}]}, 1000]}, 1]},
+    }}]
+
+
+def turn_ops(session_id, user_doc, assistant_doc, now, new_session=None):
+    """
+    Write ops for one turn (metrics rollups included), in order, for
+    TurnWriter.submit. A failed turn (error=True) is kept in the history but
+    counted like log_error_metric: session error_count and the error rollups,
+    never the message counts or latency figures.
+    """
+    ops = []
+    if new_session:
+        ops.append(('chatbot_sessions', InsertOne(new_session)))
+        ops.extend(session_rollup_ops(new_session['started_at']))
+    ops.append(('chat_messages', InsertOne(user_doc)))
+    ops.append(('chat_messages', InsertOne(assistant_doc)))
+    if assistant_doc['error']:
+        ops.append(('chatbot_sessions', UpdateOne(
+            {'session_id': session_id}, {'$inc': {'error_count': 1}, '$set': {'last_activity': now}})))
+        ops.extend(error_rollup_ops(assistant_doc['timestamp']))
+        return ops
+    ops.append(('chatbot_sessions', UpdateOne({'session_id': session_id}, session_update(assistant_doc, now))))
+    ops.extend(turn_rollup_ops(assistant_doc))
+    return ops
+
+
+def error_ops(session_id, doc):
+    """Write ops for a failed turn logged on its own (error_doc), for TurnWriter.submit."""
+    return [
+        ('chat_messages', InsertOne(doc)),
+        ('chatbot_sessions', UpdateOne({'session_id': session_id}, {'$inc': {'error_count': 1}})),
+    ] + error_rollup_ops(doc['timestamp'])
+
+
+def pending_summary_query(session_doc):
+    """chat_messages filter for the turns not yet folded into the session summary."""
+    query = {'session_id': session_doc['session_id'], 'role': {'$in': ['user', 'assistant']}}
+    if session_doc.get('summarized_until'):
+        query['timestamp'] = {'$gt': session_doc['summarized_until']}
+    return query
+
+
+def summary_update(session_doc, pending):
+    """
+    Fold all but the newest KEEP_RECENT_MESSAGES unsummarised messages
+    (oldest first) into the session's rolling summary; None if none need folding.
+    """
+    if len(pending) <= KEEP_RECENT_MESSAGES:
+        return None
+    fold = pending[:-KEEP_RECENT_MESSAGES]
+    return {'$set': {
+        'summary': merge_summary(session_doc.get('summary', ''), summarize_messages(fold)),
+        'summarized_until': fold[-1]['timestamp'],
+    }}
+
+
+def kv_context_doc(session_id, fingerprint, kv_context):
+    """
+    Document to store for the session, or None when there is nothing worth
+    keeping: no context, or one past OLLAMA_KV_CONTEXT_MAX_TOKENS (the next
+    turn then starts fresh from the summary and recent history).
+    """
+    if not kv_context or len(kv_context) > OLLAMA_KV_CONTEXT_MAX_TOKENS:
+        return None
+    return {
+        '_id': session_id,
+        'fingerprint': fingerprint,
+        'tokens': kv_context,
+        'length': len(kv_context),
+        'updated_at': datetime.utcnow(),
+    }
+
+
+def kv_context_ops(session_id, fingerprint, kv_context):
+    """Write op replacing (or clearing) the session's stored KV context, for TurnWriter.submit."""
+    doc = kv_context_doc(session_id, fingerprint, kv_context)
+    if doc:
+        return [(KV_CONTEXT_COLLECTION, ReplaceOne({'_id': session_id}, doc, upsert=True))]
+    return [(KV_CONTEXT_COLLECTION, DeleteOne({'_id': session_id}))]
+
+
+# Django user id -> auth_user _id (as str). The mapping never changes once a
+# user is synced, so only hits are cached; misses are looked up again.
+_mongo_user_ids = {}
+MONGO_USER_ID_CACHE_SIZE = 10000
+
+
+def cached_mongo_user_id(user_django_id):
+    return _mongo_user_ids.get(user_django_id)
+
+
+def remember_mongo_user_id(user_django_id, auth_user):
+    """Cache and return the auth_user's id, or "anonymous" if there is no such user."""
+    if not auth_user:
+        return "anonymous"
+    if len(_mongo_user_ids) >= MONGO_USER_ID_CACHE_SIZE:
+        _mongo_user_ids.clear()
+    _mongo_user_ids[user_django_id] = str(auth_user['_id'])
+    return _mongo_user_ids[user_django_id]
+
+
+def error_doc(session_id, error_type, error_msg, user_message=''):
+    now = datetime.utcnow()
+    return {
+        'message_id':     f"ERR_{now.strftime('%y%m%d%H%M%S%f')}",
+        'session_id':     session_id,
+        'role':           'error',
+        'content':        error_msg,
+        'error_type':     error_type,
+        'user_message':   user_message,
+        'timestamp':      now,
+        'error':          True,
+        'wall_clock_ms':  0,
+        'total_tokens':   0,
+    }
+
+
+def format_history(messages):
+    """Oldest-first chat_messages docs as '[Role]: content' prompt lines."""
+    history = []
+    for msg in messages:
+        role = "Assistant" if msg.get('role') == 'assistant' else "User"
+        history.append(f"[{role}]: {msg.get('content')}")
+    return history
+
+
 class MongoDBManager:
     def __init__(self):
         self.mongo_uri = config('MONGO_URI', default=None)
@@ -11,20 +285,30 @@ class MongoDBManager:
         self.db_name = config('MONGO_DB_NAME', default='investomart')
         self.client = None
         self.db = None
+        self._connect_lock = threading.Lock()
+        self._kv_index_ready = False
+        self._rollup_index_ready = False
+        # Turns are persisted off the request path
+        self.writer = TurnWriter(self.connect, on_flush=self._after_flush)
 
     def connect(self):
         """Connect to MongoDB"""
-        if self.client is None:
-            print(f"🔌 [MONGO] Connecting to URI: {self.mongo_uri[:25]}... DB: {self.db_name}")
-            try:
-                self.client = MongoClient(self.mongo_uri)
-                self.db = self.client[self.db_name]
-                self.client.admin.command('ping')
-                print("✅ [MONGO] Connection Successful!")
-            except Exception as e:
-                print(f"❌ [MONGO] Connection FAILED: {e}")
-                self.client = None
-                self.db = None
+        if self.client is not None:
+            return self.db
+        # Retrieval threads may race here on the first request
+        with self._connect_lock:
+            if self.client is None:
+                print(f"🔌 [MONGO] Connecting to URI: {self.mongo_uri[:25]}... DB: {self.db_name}")
+                try:
+                    client = MongoClient(self.mongo_uri)
+                    client.admin.command('ping')
+                    self.db = client[self.db_name]
+                    self.client = client
+                    print("✅ [MONGO] Connection Successful!")
+                except Exception as e:
+                    print(f"❌ [MONGO] Connection FAILED: {e}")
+                    self.client = None
+                    self.db = None
         return self.db
 
     def save_chat_message(
@@ -37,145 +321,43 @@ class MongoDBManager:
         sentiment='neutral',
         intent='general',
         wall_clock_ms=0,
+        time_to_first_token_ms=None,
+        cached=False,
+        retrieval_timings=None,
+        stage_ms=None,
     ):
         print(f"💾 [MONGO] Attempting to save message... Session: {session_id}")
         self.connect()
-        if not self.db:
+        if self.db is None:
             print("❌ [MONGO] Skipping save - No Database Connection")
             return session_id
 
         try:
             # Link to enterprise user_id if possible
-            if user_django_id != "anonymous":
-                auth_user = self.db['auth_user'].find_one({'id': user_django_id})
-                mongo_user_id = str(auth_user['_id']) if auth_user else "anonymous"
-            else:
-                mongo_user_id = "anonymous"
+            mongo_user_id = self.mongo_user_id(user_django_id)
 
             # Generate or use existing session
+            new_session = None
             if not session_id:
                 latest_session = self.db['chatbot_sessions'].find_one(
                     {'user_id': mongo_user_id},
                     sort=[('started_at', pymongo.DESCENDING)]
                 )
-                if latest_session and (datetime.utcnow() - latest_session['last_activity']).seconds < 3600:
-                    session_id = latest_session['session_id']
-                else:
-                    session_id = f"SESSION_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}"
-                    title = (user_message[:30] + '...') if len(user_message) > 30 else user_message
-
-                    self.db['chatbot_sessions'].insert_one({
-                        'session_id': session_id,
-                        'user_id': mongo_user_id,
-                        'title': title,
-                        'started_at': datetime.utcnow(),
-                        'last_activity': datetime.utcnow(),
-                        'total_messages': 0,
-                        'total_tokens_used': 0,
-                        'total_cost': 0.0,
-                        'avg_response_time_ms': 0.0,
-                        'error_count': 0,
-                        'is_active': True,
-                    })
-                    print(f"🆕 [MONGO] Created new session: {title}")
-
-            # ── Derived metrics ────────────────────────────────────────────
-            m = metrics or {}
-            input_tokens      = m.get('input_tokens', 0)
-            output_tokens     = m.get('output_tokens', 0)
-            total_tokens      = m.get('total_tokens', 0)
-            ollama_ms         = m.get('total_duration_ms', 0)
-            tokens_per_second = m.get('tokens_per_second', 0)
-            model_name        = m.get('model', 'unknown')
-
-            # Cost estimate: $0.03 / 1k tokens
-            cost = (total_tokens / 1000) * 0.03
-
-            # Message / word counts
-            user_msg_len  = len(user_message)
-            user_words    = len(user_message.split())
-            bot_msg_len   = len(bot_response)
-            bot_words     = len(bot_response.split())
+                session_id = reusable_session_id(latest_session)
+                if not session_id:
+                    new_session = new_session_doc(mongo_user_id, user_message)
+                    session_id = new_session['session_id']
+                    print(f"🆕 [MONGO] Created new session: {new_session['title']}")
 
             now = datetime.utcnow()
-
-            # ── Save user message ──────────────────────────────────────────
-            user_doc = {
-                'message_id':          f"MSG_{now.strftime('%y%m%d%H%M%S%f')}",
-                'session_id':          session_id,
-                'role':                'user',
-                'content':             user_message,
-                'timestamp':           now,
-                'message_length':      user_msg_len,
-                'word_count':          user_words,
-                'sentiment':           sentiment,
-                'intent':              intent,
-                'error':               False,
-            }
-            self.db['chat_messages'].insert_one(user_doc)
-
-            # ── Save assistant response with full metrics ──────────────────
-            assistant_doc = {
-                'message_id':           f"MSG_{now.strftime('%y%m%d%H%M%S%f')}_bot",
-                'session_id':           session_id,
-                'role':                 'assistant',
-                'content':              bot_response,
-                'timestamp':            now,
-                # Response timing
-                'wall_clock_ms':        wall_clock_ms,       # full request→response latency
-                'ollama_duration_ms':   ollama_ms,           # Ollama-only processing time
-                'prompt_eval_ms':       m.get('prompt_eval_duration_ms', 0),
-                'eval_ms':              m.get('eval_duration_ms', 0),
-                'load_duration_ms':     m.get('load_duration_ms', 0),
-                # Token usage
-                'input_tokens':         input_tokens,
-                'output_tokens':        output_tokens,
-                'total_tokens':         total_tokens,
-                'context_tokens':       input_tokens,        # tokens used for context
-                'tokens_per_second':    tokens_per_second,
-                # Message quality
-                'message_length':       bot_msg_len,
-                'word_count':           bot_words,
-                'user_message_length':  user_msg_len,
-                'user_word_count':      user_words,
-                # Cost
-                'cost_usd':             cost,
-                # Classification
-                'model':                model_name,
-                'sentiment':            sentiment,
-                'intent':               intent,
-                'error':                False,
-            }
-            self.db['chat_messages'].insert_one(assistant_doc)
-
-            # ── Update session aggregates (rolling avg response time) ──────
-            session_doc = self.db['chatbot_sessions'].find_one({'session_id': session_id})
-            prev_msgs    = session_doc.get('total_messages', 0) if session_doc else 0
-            prev_avg     = session_doc.get('avg_response_time_ms', 0.0) if session_doc else 0.0
-            new_turn_n   = (prev_msgs // 2) + 1  # number of completed turns after this one
-            new_avg      = ((prev_avg * (new_turn_n - 1)) + wall_clock_ms) / new_turn_n
-
-            session_start = session_doc.get('started_at', now) if session_doc else now
-            session_duration_s = (now - session_start).total_seconds()
-
-            self.db['chatbot_sessions'].update_one(
-                {'session_id': session_id},
-                {
-                    '$inc': {
-                        'total_messages':    2,
-                        'total_tokens_used': total_tokens,
-                        'total_cost':        cost,
-                    },
-                    '$set': {
-                        'last_activity':        now,
-                        'primary_topic':        intent,
-                        'avg_response_time_ms': round(new_avg, 2),
-                        'session_duration_s':   round(session_duration_s, 1),
-                    }
-                }
+            user_doc, assistant_doc = build_turn_docs(
+                session_id, user_message, bot_response, metrics, sentiment, intent,
+                wall_clock_ms, time_to_first_token_ms, cached, retrieval_timings, now, stage_ms,
             )
+            # Messages, session insert and aggregates are written by the background writer
+            self.writer.submit(turn_ops(session_id, user_doc, assistant_doc, now, new_session), session_id=session_id)
 
-            print(f"✅ [MONGO] Saved. wall_clock={wall_clock_ms}ms, tps={tokens_per_second}, session={session_id}")
+            print(f"✅ [MONGO] Queued. wall_clock={wall_clock_ms}ms, tps={assistant_doc['tokens_per_second']}, session={session_id}")
             return session_id
 
         except Exception as e:
@@ -184,200 +366,46 @@ class MongoDBManager:
             traceback.print_exc()
             return session_id
 
+    def mongo_user_id(self, user_django_id):
+        """auth_user _id (as str) for a Django user id, "anonymous" if unknown."""
+        if user_django_id == "anonymous":
+            return "anonymous"
+        cached = cached_mongo_user_id(user_django_id)
+        if cached:
+            return cached
+        return remember_mongo_user_id(user_django_id, self.db['auth_user'].find_one({'id': user_django_id}, {'_id': 1}))
+
     # ── Error metric logger ───────────────────────────────────────────────
     def log_error_metric(self, session_id, error_type, error_msg, user_message=''):
-        """Log a failed chatbot turn to chat_messages with error=True."""
+        """Queue a failed chatbot turn (chat_messages with error=True) on the turn writer."""
         self.connect()
-        if not self.db:
+        if self.db is None:
             return
         try:
-            now = datetime.utcnow()
-            self.db['chat_messages'].insert_one({
-                'message_id':     f"ERR_{now.strftime('%y%m%d%H%M%S%f')}",
-                'session_id':     session_id,
-                'role':           'error',
-                'content':        error_msg,
-                'error_type':     error_type,
-                'user_message':   user_message,
-                'timestamp':      now,
-                'error':          True,
-                'wall_clock_ms':  0,
-                'total_tokens':   0,
-            })
-            # Increment error count on the session
-            self.db['chatbot_sessions'].update_one(
-                {'session_id': session_id},
-                {'$inc': {'error_count': 1}}
-            )
+            self.writer.submit(error_ops(session_id, error_doc(session_id, error_type, error_msg, user_message)))
         except Exception as e:
             print(f"❌ [MONGO] log_error_metric failed: {e}")
 
     # ── Metrics summary ───────────────────────────────────────────────────
     def get_metrics_summary(self, days=30):
         """
-        Return a comprehensive metrics summary for the last `days` days.
+        Return a comprehensive metrics summary for the last `days` UTC days
+        (today included), read from the pre-aggregated rollups.
         Used by the /api/chatbot/metrics/ endpoint.
         """
         self.connect()
-        if not self.db:
+        if self.db is None:
             return {}
 
-        since = datetime.utcnow() - timedelta(days=days)
-
-        # ── Session-level stats ──────────────────────────────────────────
-        sessions_cursor = self.db['chatbot_sessions'].find({'started_at': {'$gte': since}})
-        sessions_list = list(sessions_cursor)
-        total_sessions = len(sessions_list)
-        total_session_tokens = sum(s.get('total_tokens_used', 0) for s in sessions_list)
-        total_session_cost   = sum(s.get('total_cost', 0.0) for s in sessions_list)
-
-        # ── Message-level stats (assistant messages only) ────────────────
-        pipeline_base = [
-            {'$match': {
-                'role': 'assistant',
-                'error': False,
-                'timestamp': {'$gte': since},
-            }}
-        ]
-
-        # Aggregate core stats
-        core_stats = list(self.db['chat_messages'].aggregate(pipeline_base + [
-            {'$group': {
-                '_id': None,
-                'total_messages':       {'$sum': 1},
-                'total_tokens':         {'$sum': '$total_tokens'},
-                'total_cost':           {'$sum': '$cost_usd'},
-                'avg_wall_clock_ms':    {'$avg': '$wall_clock_ms'},
-                'min_wall_clock_ms':    {'$min': '$wall_clock_ms'},
-                'max_wall_clock_ms':    {'$max': '$wall_clock_ms'},
-                'avg_ollama_ms':        {'$avg': '$ollama_duration_ms'},
-                'avg_tokens_per_second':{'$avg': '$tokens_per_second'},
-                'avg_output_tokens':    {'$avg': '$output_tokens'},
-                'avg_bot_words':        {'$avg': '$word_count'},
-                'avg_user_words':       {'$avg': '$user_word_count'},
-            }}
-        ]))
-        stats = core_stats[0] if core_stats else {}
-        stats.pop('_id', None)
-        # Round floats
-        for k, v in stats.items():
-            if isinstance(v, float):
-                stats[k] = round(v, 2)
-
-        # Intent breakdown
-        intent_pipeline = pipeline_base + [
-            {'$group': {'_id': '$intent', 'count': {'$sum': 1}}},
-            {'$sort': {'count': -1}},
-            {'$limit': 10},
-        ]
-        intent_breakdown = {
-            d['_id']: d['count']
-            for d in self.db['chat_messages'].aggregate(intent_pipeline)
-        }
-
-        # Sentiment breakdown
-        sentiment_pipeline = pipeline_base + [
-            {'$group': {'_id': '$sentiment', 'count': {'$sum': 1}}},
-        ]
-        sentiment_breakdown = {
-            d['_id']: d['count']
-            for d in self.db['chat_messages'].aggregate(sentiment_pipeline)
-        }
-
-        # Daily message counts (all roles)
-        daily_pipeline = [
-            {'$match': {'timestamp': {'$gte': since}, 'role': 'assistant', 'error': False}},
-            {'$group': {
-                '_id': {
-                    'year':  {'$year': '$timestamp'},
-                    'month': {'$month': '$timestamp'},
-                    'day':   {'$dayOfMonth': '$timestamp'},
-                },
-                'count': {'$sum': 1}
-            }},
-            {'$sort': {'_id': 1}},
-        ]
-        daily_counts = []
-        for d in self.db['chat_messages'].aggregate(daily_pipeline):
-            day_str = f"{d['_id']['year']}-{d['_id']['month']:02d}-{d['_id']['day']:02d}"
-            daily_counts.append({'date': day_str, 'messages': d['count']})
-
-        # Error rate
-        total_error_docs = self.db['chat_messages'].count_documents({
-            'error': True, 'timestamp': {'$gte': since}
-        })
-        total_assistant_docs = stats.get('total_messages', 0)
-        total_turns = total_assistant_docs + total_error_docs
-        error_rate_pct = round((total_error_docs / total_turns) * 100, 2) if total_turns > 0 else 0.0
-
-        # Tokens vs Latency: bucket messages by output_tokens range, show avg latency per bucket
-        token_buckets_pipeline = [
-            {'$match': {
-                'role': 'assistant',
-                'error': False,
-                'timestamp': {'$gte': since},
-                'output_tokens': {'$gt': 0},
-                'wall_clock_ms': {'$gt': 0},
-            }},
-            {'$bucket': {
-                'groupBy': '$output_tokens',
-                'boundaries': [0, 50, 100, 150, 200, 300, 400, 600, 800, 1200],
-                'default': '1200+',
-                'output': {
-                    'count': {'$sum': 1},
-                    'avg_latency_ms': {'$avg': '$wall_clock_ms'},
-                    'avg_chars': {'$avg': '$message_length'},
-                }
-            }},
-            {'$sort': {'_id': 1}},
-        ]
-        tokens_vs_latency = []
-        try:
-            for b in self.db['chat_messages'].aggregate(token_buckets_pipeline):
-                bucket_label = str(b['_id']) if b['_id'] != '1200+' else '1200+'
-                try:
-                    next_boundary_map = {0:50, 50:100, 100:150, 150:200, 200:300, 300:400, 400:600, 600:800, 800:1200}
-                    start = int(bucket_label)
-                    end = next_boundary_map.get(start, start + 200)
-                    label = f"{start}–{end} tok"
-                except (ValueError, TypeError):
-                    label = f"{bucket_label} tok"
-
-                tokens_vs_latency.append({
-                    'bucket': label,
-                    'avg_latency_ms': round(b.get('avg_latency_ms', 0), 1),
-                    'avg_chars': round(b.get('avg_chars', 0), 0),
-                    'count': b.get('count', 0),
-                })
-        except Exception as e:
-            print(f"[MONGO] tokens_vs_latency aggregation error: {e}")
-
-        return {
-            'period_days':          days,
-            'total_sessions':       total_sessions,
-            'total_messages':       total_assistant_docs,
-            'total_errors':         total_error_docs,
-            'error_rate_pct':       error_rate_pct,
-            'total_tokens':         stats.get('total_tokens', total_session_tokens),
-            'total_cost_usd':       round(stats.get('total_cost', total_session_cost), 4),
-            # Response timing
-            'avg_wall_clock_ms':    stats.get('avg_wall_clock_ms', 0),
-            'min_wall_clock_ms':    stats.get('min_wall_clock_ms', 0),
-            'max_wall_clock_ms':    stats.get('max_wall_clock_ms', 0),
-            'avg_ollama_ms':        stats.get('avg_ollama_ms', 0),
-            # Throughput
-            'avg_tokens_per_second':stats.get('avg_tokens_per_second', 0),
-            'avg_output_tokens':    stats.get('avg_output_tokens', 0),
-            # Message quality
-            'avg_bot_words':        stats.get('avg_bot_words', 0),
-            'avg_user_words':       stats.get('avg_user_words', 0),
-            # Classification
-            'intent_breakdown':     intent_breakdown,
-            'sentiment_breakdown':  sentiment_breakdown,
-            'daily_counts':         daily_counts,
-            # Performance correlation
-            'tokens_vs_latency':    tokens_vs_latency,
-        }
+        if not self._rollup_index_ready:
+            try:
+                self.db[ROLLUP_COLLECTION].create_index([('granularity', pymongo.ASCENDING), ('period_start', pymongo.ASCENDING)])
+            except Exception as e:
+                print(f"[MONGO] Could not create rollup index: {e}")
+            self._rollup_index_ready = True
+
+        day_docs, hour_docs = read_rollups(self.db, days)
+        return {'period_days': days, **summarize_rollups(day_docs, hour_docs)}
 
     # ── Existing methods (unchanged) ──────────────────────────────────────
     def get_chat_history(self, session_id, limit=6):
@@ -393,19 +421,81 @@ class MongoDBManager:
         messages = list(cursor)
         print(f"[MONGO] Found {len(messages)} raw messages in DB.")
         messages.reverse()
-        history = []
-        for msg in messages:
-            role = "Assistant" if msg.get('role') == 'assistant' else "User"
-            history.append(f"[{role}]: {msg.get('content')}")
+        history = format_history(messages)
         print(f"[MONGO] Successfully formatted {len(history)} history lines.")
         return history
 
+    def get_session_summary(self, session_id):
+        """Rolling summary of the turns older than the recent history ('' if none yet)."""
+        if not session_id: return ''
+        self.connect()
+        session = self.db['chatbot_sessions'].find_one({'session_id': session_id}, {'summary': 1})
+        return (session or {}).get('summary', '')
+
+    def update_session_summary(self, session_doc):
+        """Compress turns that have left the recent-history window into the summary."""
+        try:
+            pending = list(self.db['chat_messages'].find(
+                pending_summary_query(session_doc),
+                {'role': 1, 'content': 1, 'timestamp': 1},
+                sort=[('timestamp', pymongo.ASCENDING)],
+            ))
+            update = summary_update(session_doc, pending)
+            if update:
+                self.db['chatbot_sessions'].update_one({'session_id': session_doc['session_id']}, update)
+        except Exception as e:
+            print(f"❌ [MONGO] Summary update failed: {e}")
+
+    def _after_flush(self, session_ids, write_ms, turns):
+        """TurnWriter callback: persistence latency sketch, then session summaries."""
+        self.connect()
+        if self.db is None: return
+        if turns:
+            _, op = persistence_rollup_ops(datetime.utcnow(), write_ms, turns)[0]
+            self.db[ROLLUP_COLLECTION].bulk_write([op])
+        if session_ids:
+            self.update_session_summaries(session_ids)
+
+    def update_session_summaries(self, session_ids):
+        """Refresh summaries of the sessions long enough to need one."""
+        sessions = self.db['chatbot_sessions'].find(
+            {'session_id': {'$in': session_ids}, 'total_messages': {'$gt': KEEP_RECENT_MESSAGES}},
+            {'session_id': 1, 'summary': 1, 'summarized_until': 1},
+        )
+        for session_doc in sessions:
+            self.update_session_summary(session_doc)
+
+    def _kv_collection(self):
+        self.connect()
+        collection = self.db[KV_CONTEXT_COLLECTION]
+        if not self._kv_index_ready:
+            try:
+                collection.create_index('updated_at', expireAfterSeconds=KV_CONTEXT_TTL_SECONDS)
+            except Exception as e:
+                print(f"[MONGO] Could not create KV context TTL index: {e}")
+            self._kv_index_ready = True
+        return collection
+
+    def get_kv_context(self, session_id, fingerprint):
+        """The session's stored Ollama context if it was built by the same model/prompt."""
+        if not session_id: return None
+        doc = self._kv_collection().find_one({'_id': session_id, 'fingerprint': fingerprint}, {'tokens': 1})
+        return doc['tokens'] if doc else None
+
+    def save_kv_context(self, session_id, fingerprint, kv_context):
+        """Store this turn's context, or forget the old one so it is never reused out of sync."""
+        if not session_id: return
+        try:
+            self._kv_collection()  # TTL index on first use
+            self.writer.submit(kv_context_ops(session_id, fingerprint, kv_context))
+        except Exception as e:
+            print(f"❌ [MONGO] KV context save failed: {e}")
+
     def get_user_sessions(self, django_user_id):
         """Fetch all sessions for a specific user"""
         self.connect()
-        if not self.db: return []
-        auth_user = self.db['auth_user'].find_one({'id': django_user_id})
-        mongo_user_id = str(auth_user['_id']) if auth_user else "anonymous"
+        if self.db is None: return []
+        mongo_user_id = self.mongo_user_id(django_user_id)
         if mongo_user_id == "anonymous":
             return []
         cursor = self.db['chatbot_sessions'].find(
@@ -426,7 +516,7 @@ class MongoDBManager:
         """Update the title of a specific chat session."""
         print(f"[MONGO] Updating title for session: {session_id}")
         self.connect()
-        if not self.db:
+        if self.db is None:
             return False
         try:
             result = self.db['chatbot_sessions'].update_one(
@@ -441,7 +531,7 @@ class MongoDBManager:
     def get_full_session_messages(self, session_id):
         """Retrieve ALL messages for a session to hydrate the UI"""
         self.connect()
-        if not self.db: return []
+        if self.db is None: return []
         cursor = self.db['chat_messages'].find(
             {'session_id': session_id},
             sort=[('timestamp', pymongo.ASCENDING)]
@@ -0,0 +1,169 @@
+# chatbot/ollama_async.py
+"""
+httpx-based Ollama client for the async chatbot view.
+
+Requests reuse one AsyncClient connection pool and the same retry policy as
+the sync client. They also share its circuit breaker, so an outage seen on
+either path fails both fast. Prompt building, metrics and text cleanup come
+from OllamaLocal.
+"""
+import asyncio
+import json
+import random
+import time
+
+import httpx
+from decouple import config
+
+from .ollama_http import (
+    CircuitOpenError, OLLAMA_BACKOFF_SECONDS, OLLAMA_RETRIES, RETRYABLE_STATUS, ollama_http,
+)
+from .ollama_local import OllamaLocal, UNAVAILABLE_RESPONSE
+
+# Ollama queues what it cannot run in parallel, so this mostly bounds sockets
+OLLAMA_ASYNC_MAX_CONNECTIONS = config('OLLAMA_ASYNC_MAX_CONNECTIONS', default=256, cast=int)
+
+
+class AsyncOllamaHTTP:
+    def __init__(self, sync_http=ollama_http, max_connections=OLLAMA_ASYNC_MAX_CONNECTIONS,
+                 retries=OLLAMA_RETRIES, backoff=OLLAMA_BACKOFF_SECONDS):
+        self.base_url = sync_http.base_url
+        self.breaker = sync_http.breaker
+        self.max_connections = max_connections
+        self.retries = retries
+        self.backoff = backoff
+        self._client = None
+
+    @property
+    def client(self):
+        # Created on first use so it binds to the server's running event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+            )
+        return self._client
+
+    async def send(self, path, json=None, timeout=60, stream=False):
+        """
+        POST through the shared pool. With stream=True the caller must
+        `await response.aclose()`. Retries and breaker handling as OllamaHTTP.post.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"Ollama circuit open ({self.base_url})")
+
+        # Per-read timeout, like requests: a long stream is fine while tokens keep coming
+        settled = False
+        try:
+            request = self.client.build_request('POST', path, json=json, timeout=httpx.Timeout(timeout))
+            for attempt in range(self.retries + 1):
+                try:
+                    response = await self.client.send(request, stream=stream)
+                except httpx.ConnectTimeout as e:
+                    error = e
+                except httpx.TimeoutException:
+                    settled = True
+                    self.breaker.record_failure()
+                    raise
+                except httpx.TransportError as e:
+                    # Connect, read/write and protocol errors
+                    error = e
+                else:
+                    if response.status_code not in RETRYABLE_STATUS:
+                        settled = True
+                        self.breaker.record_success()
+                        return response
+                    error = httpx.HTTPStatusError(f"Ollama HTTP {response.status_code}",
+                                                  request=request, response=response)
+                    await response.aclose()
+
+                if attempt < self.retries:
+                    await asyncio.sleep(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+            settled = True
+            self.breaker.record_failure()
+            raise error
+        finally:
+            if not settled:
+                # Other exceptions and cancellation release a half-open trial, as OllamaHTTP.post
+                self.breaker.release_trial()
+
+
+class AsyncOllama(OllamaLocal):
+    """OllamaLocal with coroutine generate_response / async-generator stream_response."""
+
+    def __init__(self, model_name="qwen3:8b", http=None):
+        super().__init__(model_name=model_name)
+        self.http = http or AsyncOllamaHTTP()
+
+    async def generate_response(self, prompt, context="", temperature=0.7, max_tokens=2500, kv_context=None):
+        try:
+            data = self._build_request(prompt, context, temperature, max_tokens, stream=False, kv_context=kv_context)
+            response = await self.http.send("/api/generate", json=data, timeout=self.timeout)
+            if response.status_code != 200:
+                print(f"   ❌ Ollama HTTP {response.status_code}: {response.text[:200]}")
+                return None
+            result = response.json()
+            return {
+                'text': self._clean_response(result.get('response', '').strip()),
+                'metrics': self._metrics(result, temperature, max_tokens),
+                'kv_context': result.get('context'),
+            }
+        except CircuitOpenError:
+            print(f"   ⚡ Ollama circuit open, returning canned response")
+            return {'text': UNAVAILABLE_RESPONSE, 'metrics': self._unavailable_metrics()}
+        except Exception as e:
+            print(f"   ❌ Ollama error: {e}")
+            return None
+
+    async def stream_response(self, prompt, context="", temperature=0.7, max_tokens=2500, kv_context=None):
+        """Async version of OllamaLocal.stream_response; yields the same events."""
+        data = self._build_request(prompt, context, temperature, max_tokens, stream=True, kv_context=kv_context)
+        sent_at = time.time()
+        first_token_ms = None
+        pieces = []
+        try:
+            response = await self.http.send("/api/generate", json=data, timeout=self.timeout, stream=True)
+        except CircuitOpenError:
+            yield 'token', UNAVAILABLE_RESPONSE
+            yield 'done', {'text': UNAVAILABLE_RESPONSE, 'metrics': self._unavailable_metrics()}
+            return
+        except Exception as e:
+            print(f"   ❌ Ollama stream error: {e}")
+            yield 'error', str(e)
+            return
+
+        try:
+            if response.status_code != 200:
+                yield 'error', f"Ollama HTTP {response.status_code}"
+                return
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get('error'):
+                    yield 'error', chunk['error']
+                    return
+
+                token = self._strip_emoji(chunk.get('response', ''))
+                if token:
+                    if first_token_ms is None:
+                        first_token_ms = int((time.time() - sent_at) * 1000)
+                    pieces.append(token)
+                    yield 'token', token
+
+                if chunk.get('done'):
+                    metrics = self._metrics(chunk, temperature, max_tokens)
+                    metrics['ollama_first_token_ms'] = first_token_ms or 0
+                    yield 'done', {'text': self._clean_response(''.join(pieces)), 'metrics': metrics,
+                                   'kv_context': chunk.get('context')}
+                    return
+            yield 'error', 'Ollama stream ended before completion'
+        except Exception as e:
+            print(f"   ❌ Ollama stream error: {e}")
+            # A connection dropped mid-stream counts against the breaker too
+            self.http.breaker.record_failure()
+            yield 'error', str(e)
+        finally:
+            await response.aclose()
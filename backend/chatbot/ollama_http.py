@@ -0,0 +1,190 @@
+# chatbot/ollama_http.py
+"""
+Shared HTTP client for every Ollama call made by the chatbot.
+
+One pooled requests.Session keeps connections to Ollama alive across
+generate and embed calls. Connection errors and 502/503/504 responses are
+retried a bounded number of times with jittered exponential backoff. A
+circuit breaker counts consecutive failures; once OLLAMA_BREAKER_THRESHOLD is
+reached, calls fail immediately with CircuitOpenError for
+OLLAMA_BREAKER_RESET_SECONDS, then a single trial call decides whether to
+close it again.
+"""
+import random
+import threading
+import time
+
+import requests
+from decouple import config
+
+OLLAMA_BASE_URL = config('OLLAMA_BASE_URL', default='http://localhost:11434')
+OLLAMA_POOL_SIZE = config('OLLAMA_POOL_SIZE', default=16, cast=int)
+OLLAMA_RETRIES = config('OLLAMA_RETRIES', default=2, cast=int)
+OLLAMA_BACKOFF_SECONDS = config('OLLAMA_BACKOFF_SECONDS', default=0.25, cast=float)
+OLLAMA_BREAKER_THRESHOLD = config('OLLAMA_BREAKER_THRESHOLD', default=5, cast=int)
+OLLAMA_BREAKER_RESET_SECONDS = config('OLLAMA_BREAKER_RESET_SECONDS', default=30, cast=float)
+
+RETRYABLE_STATUS = (502, 503, 504)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling Ollama while the breaker is open."""
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, threshold=OLLAMA_BREAKER_THRESHOLD, reset_seconds=OLLAMA_BREAKER_RESET_SECONDS):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._times_opened = 0
+
+    def allow(self):
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and time.time() - self._opened_at >= self.reset_seconds:
+                self._state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self._state == self.HALF_OPEN and not self._trial_in_flight:
+                # Let exactly one request probe the backend
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                print("[OLLAMA] Circuit closed, backend healthy again")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.threshold:
+                if self._state != self.OPEN:
+                    self._times_opened += 1
+                    print(f"[OLLAMA] Circuit OPEN after {self._failures} consecutive failure(s)")
+                self._state = self.OPEN
+                self._opened_at = time.time()
+                self._trial_in_flight = False
+
+    def release_trial(self):
+        """Free the half-open probe slot when the trial call ended without a verdict."""
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._trial_in_flight = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == self.OPEN and time.time() - self._opened_at >= self.reset_seconds:
+                return self.HALF_OPEN
+            return self._state
+
+    def stats(self):
+        state = self.state
+        with self._lock:
+            return {
+                'state': state,
+                'consecutive_failures': self._failures,
+                'times_opened': self._times_opened,
+                'retry_in_seconds': max(0, round(self._opened_at + self.reset_seconds - time.time(), 1))
+                if state == self.OPEN else 0,
+            }
+
+
+class OllamaHTTP:
+    def __init__(self, base_url=OLLAMA_BASE_URL, pool_size=OLLAMA_POOL_SIZE,
+                 retries=OLLAMA_RETRIES, backoff=OLLAMA_BACKOFF_SECONDS):
+        self.base_url = base_url
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = CircuitBreaker()
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=False)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._stats = {
+            'requests': 0, 'retries': 0, 'failures': 0,
+            'short_circuited': 0, 'peak_in_flight': 0,
+        }
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._stats[name] += n
+
+    def _sleep_before_retry(self, attempt):
+        # Full jitter around the exponential step keeps workers from retrying in lockstep
+        time.sleep(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+    def post(self, path, json=None, timeout=60, stream=False):
+        """
+        POST to Ollama through the pool. Returns the Response (status < 500 or
+        a non-retryable error status); raises CircuitOpenError while the
+        breaker is open and the last exception once retries are exhausted.
+        """
+        if not self.breaker.allow():
+            self._count('short_circuited')
+            raise CircuitOpenError(f"Ollama circuit open ({self.base_url})")
+
+        with self._lock:
+            self._in_flight += 1
+            self._stats['requests'] += 1
+            self._stats['peak_in_flight'] = max(self._stats['peak_in_flight'], self._in_flight)
+        settled = False
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    response = self.session.post(f"{self.base_url}{path}", json=json, timeout=timeout, stream=stream)
+                except (requests.ConnectionError, requests.exceptions.ConnectTimeout) as e:
+                    error = e
+                except requests.Timeout:
+                    # A read timeout already cost the full timeout; don't repeat it
+                    self._count('failures')
+                    settled = True
+                    self.breaker.record_failure()
+                    raise
+                else:
+                    if response.status_code not in RETRYABLE_STATUS:
+                        settled = True
+                        self.breaker.record_success()
+                        return response
+                    error = requests.HTTPError(f"Ollama HTTP {response.status_code}", response=response)
+                    response.close()
+
+                if attempt < self.retries:
+                    self._count('retries')
+                    self._sleep_before_retry(attempt)
+
+            self._count('failures')
+            settled = True
+            self.breaker.record_failure()
+            raise error
+        finally:
+            if not settled:
+                # Any other exception: don't leave a half-open breaker waiting on this call forever
+                self.breaker.release_trial()
+            with self._lock:
+                self._in_flight -= 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = self._in_flight
+        stats['pool_size'] = self.pool_size
+        stats['breaker'] = self.breaker.stats()
+        return stats
+
+
+ollama_http = OllamaHTTP()
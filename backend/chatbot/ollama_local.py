@@ -1,22 +1,26 @@
 # chatbot/ollama_local.py
-import requests
 import json
 import re
+import time
+import hashlib
 import unicodedata
 
+from .ollama_http import ollama_http, CircuitOpenError
+
+# Returned without calling Ollama while its circuit breaker is open
+UNAVAILABLE_RESPONSE = ("InvestoBot is temporarily unavailable while the AI service recovers. "
+                        "Please try again in a minute.")
+
 class OllamaLocal:
     """Ollama integration for qwen3:8b"""
 
-    def __init__(self, model_name="qwen3:8b", base_url="http://localhost:11434"):
+    def __init__(self, model_name="qwen3:8b", http=ollama_http):
         self.model_name = model_name
-        self.base_url = base_url
+        self.http = http
+        self.base_url = http.base_url
         self.timeout = 60  # Increased timeout
 
-    def generate_response(self, prompt, context="", temperature=0.7, max_tokens=2500):
-        """Generate response using Ollama"""
-        try:
-            # Build system prompt
-            system_prompt = """You are InvestoBot, a helpful assistant for the Investomart platform. 
+    SYSTEM_PROMPT = """You are InvestoBot, a helpful assistant for the Investomart platform. 
 Your core goal is to help users with their specific queries, whether they are about livestock farming, investments, or platform features.
 
 CRITICAL INSTRUCTION:
@@ -25,87 +29,165 @@ CRITICAL INSTRUCTION:
 3. DO NOT switch to a general investment overview unless the user specifically asks to change topics.
 4. Be professional and concise. NO EMOJIS."""
 
-            # Build complete prompt
-            prompt_parts = [f"SYSTEM: {system_prompt}"]
-            if context:
-                prompt_parts.append(f"CONTEXT & HISTORY:\n{context}")
-            
-            prompt_parts.append(f"USER: {prompt}")
-            prompt_parts.append("ASSISTANT:")
-            
-            full_prompt = "\n\n".join(prompt_parts)
-            
-            # DEBUG: Log the full prompt
-            print("\n" + "="*50)
-            print("🚨 FULL PROMPT SENT TO OLLAMA:")
-            print(full_prompt)
-            print("="*50 + "\n")
-
-            # Prepare request
-            data = {
-                "model": self.model_name,
-                "prompt": full_prompt,
-                "stream": False,
-                "options": {
-                    "temperature": temperature,
-                    "num_predict": max_tokens,
-                    "top_k": 40,
-                    "top_p": 0.9,
-                    "repeat_penalty": 1.1
-                }
+    def context_fingerprint(self):
+        """Identifies what a stored KV context was built with; a change invalidates it."""
+        return hashlib.sha1(f"{self.model_name}\x00{self.SYSTEM_PROMPT}".encode('utf-8')).hexdigest()[:16]
+
+    def _build_request(self, prompt, context, temperature, max_tokens, stream, kv_context=None):
+        """
+        Ollama /api/generate payload for one turn. With kv_context (the
+        `context` array Ollama returned last turn) the system prompt and
+        earlier turns are already evaluated, so only this turn is sent.
+        """
+        # Build complete prompt
+        prompt_parts = [] if kv_context else [f"SYSTEM: {self.SYSTEM_PROMPT}"]
+        if context:
+            prompt_parts.append(f"CONTEXT & HISTORY:\n{context}")
+        
+        prompt_parts.append(f"USER: {prompt}")
+        prompt_parts.append("ASSISTANT:")
+        
+        full_prompt = "\n\n".join(prompt_parts)
+        
+        # DEBUG: Log the full prompt
+        print("\n" + "="*50)
+        print("🚨 FULL PROMPT SENT TO OLLAMA:")
+        print(full_prompt)
+        print("="*50 + "\n")
+
+        request = {
+            "model": self.model_name,
+            "prompt": full_prompt,
+            "stream": stream,
+            "options": {
+                "temperature": temperature,
+                "num_predict": max_tokens,
+                "top_k": 40,
+                "top_p": 0.9,
+                "repeat_penalty": 1.1
+            }
+        }
+        if kv_context:
+            request["context"] = kv_context
+        return request
+
+    def _metrics(self, result, temperature, max_tokens):
+        """Rich metrics for enterprise analysis from Ollama's final response object."""
+        output_tokens = result.get('eval_count', 0)
+        eval_duration_ms = result.get('eval_duration', 0) // 1_000_000
+        tokens_per_second = round(output_tokens / (eval_duration_ms / 1000), 2) if eval_duration_ms > 0 else 0
+
+        return {
+            'input_tokens': result.get('prompt_eval_count', 0),
+            'output_tokens': output_tokens,
+            'total_tokens': result.get('prompt_eval_count', 0) + output_tokens,
+            'total_duration_ms': result.get('total_duration', 0) // 1_000_000,
+            'load_duration_ms': result.get('load_duration', 0) // 1_000_000,
+            'prompt_eval_duration_ms': result.get('prompt_eval_duration', 0) // 1_000_000,
+            'eval_duration_ms': eval_duration_ms,
+            'tokens_per_second': tokens_per_second,
+            'model': self.model_name,
+            'parameters': {
+                'temperature': temperature,
+                'max_tokens': max_tokens
             }
+        }
+
+    def _unavailable_metrics(self):
+        return {'model': self.model_name, 'circuit_open': True}
+
+    def generate_response(self, prompt, context="", temperature=0.7, max_tokens=2500, kv_context=None):
+        """Generate response using Ollama; 'kv_context' in the result feeds the next turn."""
+        try:
+            data = self._build_request(prompt, context, temperature, max_tokens, stream=False, kv_context=kv_context)
 
             print(f"    Sending to Ollama...")
             # Send request
-            response = requests.post(
-                f"{self.base_url}/api/generate",
-                json=data,
-                timeout=self.timeout
-            )
+            response = self.http.post("/api/generate", json=data, timeout=self.timeout)
 
             if response.status_code == 200:
                 result = response.json()
                 response_text = result.get('response', '').strip()
-                cleaned_text = self._clean_response(response_text)
-                
-                # Return rich metrics for enterprise analysis
-                output_tokens = result.get('eval_count', 0)
-                eval_duration_ms = result.get('eval_duration', 0) // 1_000_000
-                tokens_per_second = round(output_tokens / (eval_duration_ms / 1000), 2) if eval_duration_ms > 0 else 0
-
                 return {
-                    'text': cleaned_text,
-                    'metrics': {
-                        'input_tokens': result.get('prompt_eval_count', 0),
-                        'output_tokens': output_tokens,
-                        'total_tokens': result.get('prompt_eval_count', 0) + output_tokens,
-                        'total_duration_ms': result.get('total_duration', 0) // 1_000_000,
-                        'load_duration_ms': result.get('load_duration', 0) // 1_000_000,
-                        'prompt_eval_duration_ms': result.get('prompt_eval_duration', 0) // 1_000_000,
-                        'eval_duration_ms': eval_duration_ms,
-                        'tokens_per_second': tokens_per_second,
-                        'model': self.model_name,
-                        'parameters': {
-                            'temperature': temperature,
-                            'max_tokens': max_tokens
-                        }
-                    }
+                    'text': self._clean_response(response_text),
+                    'metrics': self._metrics(result, temperature, max_tokens),
+                    'kv_context': result.get('context'),
                 }
             else:
                 print(f"   ❌ Ollama HTTP {response.status_code}: {response.text[:200]}")
                 return None
 
+        except CircuitOpenError:
+            print(f"   ⚡ Ollama circuit open, returning canned response")
+            return {'text': UNAVAILABLE_RESPONSE, 'metrics': self._unavailable_metrics()}
         except Exception as e:
             print(f"   ❌ Ollama error: {e}")
             return None
 
+    def stream_response(self, prompt, context="", temperature=0.7, max_tokens=2500, kv_context=None):
+        """
+        Streaming variant of generate_response.
+        Yields ('token', text) as Ollama emits them, then one final
+        ('done', {'text': ..., 'metrics': ..., 'kv_context': ...}) with the cleaned full text.
+        Yields ('error', message) instead if the request fails.
+        """
+        data = self._build_request(prompt, context, temperature, max_tokens, stream=True, kv_context=kv_context)
+        sent_at = time.time()
+        first_token_ms = None
+        pieces = []
+
+        print(f"    Streaming from Ollama...")
+        try:
+            # The timeout applies per read, so a long answer is fine as long as tokens keep coming
+            with self.http.post("/api/generate", json=data, stream=True, timeout=self.timeout) as response:
+                if response.status_code != 200:
+                    print(f"   ❌ Ollama HTTP {response.status_code}: {response.text[:200]}")
+                    yield 'error', f"Ollama HTTP {response.status_code}"
+                    return
+
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get('error'):
+                        yield 'error', chunk['error']
+                        return
+
+                    token = self._strip_emoji(chunk.get('response', ''))
+                    if token:
+                        if first_token_ms is None:
+                            first_token_ms = int((time.time() - sent_at) * 1000)
+                        pieces.append(token)
+                        yield 'token', token
+
+                    if chunk.get('done'):
+                        metrics = self._metrics(chunk, temperature, max_tokens)
+                        metrics['ollama_first_token_ms'] = first_token_ms or 0
+                        yield 'done', {'text': self._clean_response(''.join(pieces)), 'metrics': metrics,
+                                       'kv_context': chunk.get('context')}
+                        return
+
+            yield 'error', 'Ollama stream ended before completion'
+        except CircuitOpenError:
+            print(f"   ⚡ Ollama circuit open, returning canned response")
+            yield 'token', UNAVAILABLE_RESPONSE
+            yield 'done', {'text': UNAVAILABLE_RESPONSE, 'metrics': self._unavailable_metrics()}
+        except Exception as e:
+            print(f"   ❌ Ollama stream error: {e}")
+            # A connection dropped mid-stream counts against the breaker too
+            self.http.breaker.record_failure()
+            yield 'error', str(e)
+
     def _clean_response(self, text):
         """Clean up AI response text."""
         if not text: return ""
         text = re.sub(r'^(System:|User:|Assistant:|Context:|Response:)\s*', '', text, flags=re.IGNORECASE)
         text = re.sub(r'\n{3,}', '\n\n', text)
         text = text.strip()
-        
+        return self._strip_emoji(text)
+
+    @staticmethod
+    def _strip_emoji(text):
         def is_emoji(char):
             return unicodedata.category(char) in ('So', 'Sm', 'Sk', 'Sc') or \
                    unicodedata.name(char, '').startswith(('EMOJI', 'REGIONAL INDICATOR'))
@@ -113,7 +195,7 @@ CRITICAL INSTRUCTION:
 
     def is_available(self):
         try:
-            response = requests.get(f"{self.base_url}/api/tags", timeout=5)
+            response = self.http.session.get(f"{self.base_url}/api/tags", timeout=5)
             return response.status_code == 200 and any(m.get('name') == self.model_name for m in response.json().get('models', []))
         except:
             return False
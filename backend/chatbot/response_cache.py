@@ -0,0 +1,189 @@
+# chatbot/response_cache.py
+"""
+Semantic response cache for non-personalised chatbot answers.
+
+A new question is answered from the cache when an earlier answer with the
+same intent and model was generated for a question whose embedding has cosine
+similarity >= CHATBOT_CACHE_SIMILARITY ("goat price today" vs "current market
+price for goats"), and that answer is younger than its intent's TTL.
+
+Entries live in the `chatbot_response_cache` collection (a TTL index on
+`expires_at` cleans them up) and are mirrored per intent into an in-process
+NumPy matrix, so a lookup is one matrix-vector product. Each worker pulls
+entries written by other workers every CHATBOT_CACHE_SYNC_SECONDS.
+
+Only the model's text is cached; the |||TABLE||| payload is rebuilt from live
+data on every turn.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from bson import ObjectId
+from decouple import config
+
+from .mongo_manager import mongo_manager
+
+COLLECTION_NAME = 'chatbot_response_cache'
+CHATBOT_CACHE_SIMILARITY = config('CHATBOT_CACHE_SIMILARITY', default=0.92, cast=float)
+CHATBOT_CACHE_SYNC_SECONDS = config('CHATBOT_CACHE_SYNC_SECONDS', default=60, cast=int)
+MAX_ENTRIES_PER_INTENT = 5000
+
+# Seconds an answer stays reusable, by detected intent; prices go stale fastest
+INTENT_TTL_SECONDS = {
+    'market_price': 15 * 60,
+    'investment': 60 * 60,
+    'general': 6 * 60 * 60,
+    'livestock_advice': 24 * 60 * 60,
+    'health_advice': 24 * 60 * 60,
+    'support': 24 * 60 * 60,
+}
+
+
+def is_cacheable(turn):
+    """
+    Personalised or conversation-dependent turns are never cached:
+    portfolio context, follow-ups that lean on history, and live
+    livestock-performance tables.
+    """
+    return not (turn['personalized'] or turn['has_history'] or turn['livestock_perf_req'])
+
+
+def _normalize(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+class _IntentEntries:
+    __slots__ = ('vectors', 'texts', 'expires', 'models')
+
+    def __init__(self):
+        self.vectors = []
+        self.texts = []
+        self.expires = []
+        self.models = []
+
+
+class SemanticResponseCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._matrices = {}
+        self._synced_at = None
+        self._last_created = None
+        self._known_ids = set()
+        self._index_ready = False
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0}
+
+    def _collection(self):
+        db = mongo_manager.connect()
+        if db is None:
+            return None
+        collection = db[COLLECTION_NAME]
+        if not self._index_ready:
+            try:
+                collection.create_index('expires_at', expireAfterSeconds=0)
+            except Exception as e:
+                print(f"[RESPONSE CACHE] Could not create TTL index: {e}")
+            self._index_ready = True
+        return collection
+
+    def _add(self, entry_id, intent, vector, text, expires_at, model_name):
+        if entry_id in self._known_ids:
+            return
+        self._known_ids.add(entry_id)
+        entries = self._entries.setdefault(intent, _IntentEntries())
+        entries.vectors.append(vector)
+        entries.texts.append(text)
+        entries.expires.append(expires_at)
+        entries.models.append(model_name)
+        if len(entries.texts) > MAX_ENTRIES_PER_INTENT:
+            for field in _IntentEntries.__slots__:
+                del getattr(entries, field)[0]
+        if len(self._known_ids) > MAX_ENTRIES_PER_INTENT * len(INTENT_TTL_SECONDS):
+            # Only guards against re-adding recent entries; old ids can go
+            self._known_ids = {entry_id}
+        self._matrices.pop(intent, None)
+
+    def _sync(self):
+        """Pull entries written by any worker since the last sync."""
+        if self._synced_at is not None and time.time() - self._synced_at < CHATBOT_CACHE_SYNC_SECONDS:
+            return
+        self._synced_at = time.time()
+        collection = self._collection()
+        if collection is None:
+            return
+        query = {'expires_at': {'$gt': datetime.utcnow()}}
+        if self._last_created is not None:
+            query['created_at'] = {'$gte': self._last_created}
+        try:
+            docs = list(collection.find(query).sort('created_at', 1))
+        except Exception as e:
+            print(f"[RESPONSE CACHE] Sync failed: {e}")
+            return
+        with self._lock:
+            for doc in docs:
+                self._add(doc['_id'], doc['intent'], _normalize(doc['embedding']), doc['response'],
+                          doc['expires_at'], doc.get('model'))
+                self._last_created = doc['created_at']
+
+    def lookup(self, embedding, intent, model_name):
+        """Cached answer text for a similar question, or None."""
+        self._sync()
+        query = _normalize(embedding)
+        now = datetime.utcnow()
+        with self._lock:
+            entries = self._entries.get(intent)
+            if entries and entries.texts:
+                matrix = self._matrices.get(intent)
+                if matrix is None:
+                    matrix = self._matrices[intent] = np.vstack(entries.vectors)
+                if matrix.shape[1] == len(query):
+                    sims = matrix @ query
+                    for i in np.argsort(-sims):
+                        if sims[i] < CHATBOT_CACHE_SIMILARITY:
+                            break
+                        if entries.expires[i] > now and entries.models[i] == model_name:
+                            self._stats['hits'] += 1
+                            return entries.texts[i]
+            self._stats['misses'] += 1
+        return None
+
+    def store(self, embedding, intent, model_name, question, response_text):
+        if not response_text:
+            return
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=INTENT_TTL_SECONDS.get(intent, INTENT_TTL_SECONDS['general']))
+        doc = {
+            '_id': ObjectId(),
+            'intent': intent,
+            'model': model_name,
+            'question': question,
+            'embedding': list(map(float, embedding)),
+            'response': response_text,
+            'created_at': now,
+            'expires_at': expires_at,
+        }
+        with self._lock:
+            self._add(doc['_id'], intent, _normalize(embedding), response_text, expires_at, model_name)
+            self._stats['stores'] += 1
+        collection = self._collection()
+        if collection is None:
+            return
+        try:
+            collection.insert_one(doc)
+        except Exception as e:
+            print(f"[RESPONSE CACHE] Store failed: {e}")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = sum(len(e.texts) for e in self._entries.values())
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        return stats
+
+
+response_cache = SemanticResponseCache()
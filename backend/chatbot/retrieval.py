@@ -0,0 +1,71 @@
+# chatbot/retrieval.py
+"""
+Concurrent context retrieval for a chat turn.
+
+Portfolio, product search, livestock performance and history are independent
+lookups, so they are submitted together to a shared bounded thread pool. Each
+source has its own timeout measured from the start of the stage; a source
+that errors or overruns contributes its default value and the turn goes on
+with whatever did come back.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from decouple import config
+
+RETRIEVAL_WORKERS = config('CHATBOT_RETRIEVAL_WORKERS', default=16, cast=int)
+
+# Seconds each source may take before the turn proceeds without it
+SOURCE_TIMEOUTS = {
+    'portfolio': config('CHATBOT_PORTFOLIO_TIMEOUT', default=3.0, cast=float),
+    'products': config('CHATBOT_PRODUCTS_TIMEOUT', default=5.0, cast=float),
+    'livestock_performance': config('CHATBOT_LIVESTOCK_TIMEOUT', default=5.0, cast=float),
+    'history': config('CHATBOT_HISTORY_TIMEOUT', default=2.0, cast=float),
+}
+DEFAULT_TIMEOUT = 5.0
+
+_pool = ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS, thread_name_prefix='chat-retrieval')
+
+
+def _timed(fn):
+    started = time.perf_counter()
+    try:
+        return fn(), None, int((time.perf_counter() - started) * 1000)
+    except Exception as e:
+        return None, e, int((time.perf_counter() - started) * 1000)
+
+
+def retrieve(sources):
+    """
+    Run {name: (fn, default)} concurrently.
+
+    Returns (results, timings): results maps every name to fn() or its
+    default, timings maps it to {'ms': ..., 'status': 'ok'|'error'|'timeout'}.
+    A timed-out call keeps running on its pool thread but is no longer awaited.
+    """
+    started = time.perf_counter()
+    futures = {name: _pool.submit(_timed, fn) for name, (fn, _) in sources.items()}
+
+    results, timings = {}, {}
+    for name, future in futures.items():
+        default = sources[name][1]
+        remaining = started + SOURCE_TIMEOUTS.get(name, DEFAULT_TIMEOUT) - time.perf_counter()
+        try:
+            result, error, elapsed_ms = future.result(timeout=max(0.0, remaining))
+        except FutureTimeout:
+            results[name] = default
+            timings[name] = {'ms': int((time.perf_counter() - started) * 1000), 'status': 'timeout'}
+            print(f"[RETRIEVAL] {name} timed out")
+            continue
+        if error is not None:
+            results[name] = default
+            timings[name] = {'ms': elapsed_ms, 'status': 'error'}
+            print(f"[RETRIEVAL] {name} failed: {error}")
+        else:
+            results[name] = result
+            timings[name] = {'ms': elapsed_ms, 'status': 'ok'}
+
+    total_ms = int((time.perf_counter() - started) * 1000)
+    print(f"[RETRIEVAL] {len(sources)} source(s) in {total_ms}ms: "
+          + ", ".join(f"{n}={t['ms']}ms/{t['status']}" for n, t in timings.items()))
+    return results, timings
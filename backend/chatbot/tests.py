@@ -1,3 +1,659 @@
-from django.test import TestCase
+import asyncio
+import threading
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import httpx
+import requests
+from django.test import SimpleTestCase
+from pymongo import ReplaceOne
+from pymongo.errors import BulkWriteError, OperationFailure
+
+from . import leaderboard, turn_writer, views
+from .context_builder import Section, build_context, estimate_tokens, merge_summary, summarize_messages
+from .embedding_cache import EmbeddingCache, cache_key
+from .fast_path import LEADERBOARD, PORTFOLIO, FastPathRouter
+from .latency_sketch import SKETCH_RELATIVE_ACCURACY, percentiles, quantile, sketch_inc
+from .metrics_rollups import ROLLUP_COLLECTION, summarize_rollups, turn_rollup_ops
+from .async_mongo import AsyncMongoManager
+from .mongo_manager import build_turn_docs, mongo_manager, turn_ops
+from .ollama_async import AsyncOllamaHTTP
+from .ollama_http import CircuitBreaker, CircuitOpenError, OllamaHTTP
+from .response_cache import SemanticResponseCache, is_cacheable
+from .vector_index import ProductVectorIndex
+from .turn_writer import TurnWriter
+
+
+class PrepareTurnTests(SimpleTestCase):
+    def test_portfolio_does_not_replace_session_summary(self):
+        request = SimpleNamespace(user=SimpleNamespace(is_authenticated=True))
+        portfolio = [{'product_name': 'Boer Goat', 'quantity': 2}]
+        session_state = {'history': [], 'summary': 'User asked about goat feed prices.', 'kv_context': None}
+        with mock.patch.object(views, 'fetch_portfolio', return_value=portfolio):
+            turn = views.prepare_turn(request, 'How is my portfolio doing?', 'session-1', session_state)
+
+        summary_section = turn['context'].split('### EARLIER CONVERSATION (SUMMARY)')[1]
+        self.assertIn('User asked about goat feed prices.', summary_section.split('###')[0])
+        self.assertIn('User Portfolio: Boer Goat (2)', turn['context'])
+
+
+class ContextBuilderTests(SimpleTestCase):
+    def test_sections_fill_by_priority_and_display_in_order(self):
+        history = Section('### HISTORY', [f"user: question number {i}" for i in range(40)], 2, True)
+        portfolio = Section('### PORTFOLIO', ['Murrah buffalo: NRS 90,000'], 1, False)
+        market = Section('### MARKET', [f"listing {i}: Boer goat" for i in range(40)], 3, False)
+        context, stats = build_context([market, portfolio, history], budget=60)
+
+        self.assertLess(context.index('### PORTFOLIO'), context.index('### HISTORY'))
+        self.assertEqual(stats['truncated'], ['### HISTORY'])
+        self.assertEqual(stats['dropped'], ['### MARKET'])
+        # History is cut from the front: the newest lines survive
+        self.assertIn('question number 39', context)
+        self.assertNotIn('question number 0', context)
+        self.assertLessEqual(stats['used'], 60)
+
+    def test_everything_fits_within_a_large_budget(self):
+        sections = [Section('### A', ['one', 'two'], 1, False), Section('### B', [], 2, False)]
+        context, stats = build_context(sections, budget=100)
+        self.assertEqual(context, '### A\none\ntwo')
+        self.assertEqual((stats['truncated'], stats['dropped']), ([], []))
+
+    def test_summary_keeps_the_newest_lines_within_budget(self):
+        lines = summarize_messages([
+            {'role': 'user', 'content': 'Show my portfolio'},
+            {'role': 'assistant', 'content': 'You hold 2 investments. Details follow.|||TABLE|||<table></table>'},
+        ])
+        self.assertEqual(lines, ['- User asked: Show my portfolio | Answer: You hold 2 investments.'])
+
+        summary = merge_summary('', [f"- line {i}" for i in range(50)], budget=30)
+        self.assertLessEqual(estimate_tokens(summary), 30)
+        self.assertTrue(summary.endswith('- line 49'))
+
+
+def apply_rollup_ops(ops, docs=None):
+    """Apply the $inc/$min/$max/$setOnInsert rollup upserts to in-memory docs keyed by _id."""
+    docs = {} if docs is None else docs
+    for name, op in ops:
+        if name != ROLLUP_COLLECTION:
+            continue
+        doc = docs.setdefault(op._filter['_id'], {'_id': op._filter['_id']})
+        for operator, fields in op._doc.items():
+            for path, value in fields.items():
+                *parents, leaf = path.split('.') if operator != '$setOnInsert' else [path]
+                target = doc
+                for part in parents:
+                    target = target.setdefault(part, {})
+                if operator == '$inc':
+                    target[leaf] = target.get(leaf, 0) + value
+                elif operator == '$min':
+                    target[leaf] = min(target.get(leaf, value), value)
+                elif operator == '$max':
+                    target[leaf] = max(target.get(leaf, value), value)
+                else:
+                    target.setdefault(leaf, value)
+    return docs
+
+
+def day_docs(docs):
+    return sorted((d for d in docs.values() if d['granularity'] == 'day'), key=lambda d: d['period_start'])
+
+
+def turn(metrics, wall_clock_ms=1200, time_to_first_token_ms=None, now=datetime(2026, 1, 31, 14, 5)):
+    user_doc, assistant_doc = build_turn_docs(
+        'S1', 'what is the price of a goat', 'About NRS 20,000.', metrics, 'neutral', 'market_price',
+        wall_clock_ms, time_to_first_token_ms, False, {}, now, {'retrieval': 40},
+    )
+    return turn_ops('S1', user_doc, assistant_doc, now)
+
+
+class TurnPersistenceTests(SimpleTestCase):
+    def test_circuit_open_turn_is_counted_as_an_error(self):
+        docs = apply_rollup_ops(turn({'model': 'qwen3:8b', 'output_tokens': 40}))
+        apply_rollup_ops(turn({'model': 'qwen3:8b', 'circuit_open': True}, wall_clock_ms=5), docs)
+        summary = summarize_rollups(day_docs(docs))
+
+        self.assertEqual((summary['total_messages'], summary['total_errors']), (1, 1))
+        self.assertEqual(summary['avg_wall_clock_ms'], 1200)
+        self.assertEqual(summary['latency_percentiles']['wall_clock_ms']['count'], 1)
+
+    def test_circuit_open_turn_is_stored_as_an_error(self):
+        ops = turn({'model': 'qwen3:8b', 'circuit_open': True})
+        assistant_doc = ops[1][1]._doc
+        self.assertTrue(assistant_doc['error'])
+        self.assertEqual(assistant_doc['error_type'], 'circuit_open')
+        session_update = ops[2][1]._doc
+        self.assertEqual(session_update['$inc'], {'error_count': 1})
+
+    def test_logged_errors_go_through_the_writer(self):
+        db = mock.MagicMock()
+        writer = mock.Mock()
+        with mock.patch.object(mongo_manager, 'connect'), mock.patch.object(mongo_manager, 'db', db), \
+                mock.patch.object(mongo_manager, 'writer', writer):
+            mongo_manager.log_error_metric('s1', 'ReadTimeout', 'Ollama timed out', user_message='hi')
+            asyncio.run(AsyncMongoManager().log_error_metric('s1', 'ReadTimeout', 'Ollama timed out'))
+
+        db.__getitem__.assert_not_called()
+        self.assertEqual(writer.submit.call_count, 2)
+        ops = writer.submit.call_args_list[0].args[0]
+        self.assertEqual([name for name, _ in ops[:2]], ['chat_messages', 'chatbot_sessions'])
+        self.assertTrue(ops[0][1]._doc['error'])
+        self.assertEqual(ops[1][1]._doc, {'$inc': {'error_count': 1}})
+        self.assertTrue(all(name == ROLLUP_COLLECTION for name, _ in ops[2:]))
+
+    def test_non_streamed_turn_has_no_time_to_first_token(self):
+        assistant_doc = turn({'model': 'qwen3:8b'})[1][1]._doc
+        self.assertIsNone(assistant_doc['time_to_first_token_ms'])
+        self.assertFalse(assistant_doc['streamed'])
+
+    def test_time_to_first_token_averages_streamed_turns_only(self):
+        docs = apply_rollup_ops(turn({'model': 'qwen3:8b'}, wall_clock_ms=3000))
+        apply_rollup_ops(turn({'model': 'qwen3:8b'}, wall_clock_ms=2000, time_to_first_token_ms=400), docs)
+        summary = summarize_rollups(day_docs(docs))
+
+        self.assertEqual((summary['total_messages'], summary['streamed_messages']), (2, 1))
+        self.assertEqual(summary['avg_time_to_first_token_ms'], 400)
+        self.assertEqual(summary['max_time_to_first_token_ms'], 400)
+        self.assertEqual(summary['avg_wall_clock_ms'], 2500)
+
+    def test_only_streamed_turns_are_sketched_for_time_to_first_token(self):
+        docs = apply_rollup_ops(turn({'model': 'qwen3:8b'}, wall_clock_ms=3000, time_to_first_token_ms=350))
+        # A message stored before non-streamed turns left TTFT unset
+        legacy = dict(turn({'model': 'qwen3:8b'}, wall_clock_ms=9000)[1][1]._doc, time_to_first_token_ms=9000)
+        apply_rollup_ops(turn_rollup_ops(legacy), docs)
+        summary = summarize_rollups(day_docs(docs))
+
+        ttft = summary['latency_percentiles']['time_to_first_token_ms']
+        self.assertEqual(ttft['count'], 1)
+        self.assertAlmostEqual(ttft['p99'], 350, delta=350 * 0.02)
+        self.assertEqual(summary['latency_percentiles']['wall_clock_ms']['count'], 2)
+        self.assertEqual(summary['latency_percentiles_by_model']['qwen3:8b']['time_to_first_token_ms']['count'], 1)
+
+
+class FakeCollection:
+    """Records bulk writes; also runs the find/update/delete forms the leaderboard issues."""
+
+    def __init__(self, errors=(), docs=()):
+        self.errors = list(errors)
+        self.written = []
+        self.docs = {doc['_id']: dict(doc) for doc in docs}
+
+    def bulk_write(self, ops, ordered=True):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.written.extend(ops)
+        for op in ops:
+            if isinstance(op, ReplaceOne):
+                self.docs[op._filter['_id']] = dict(op._doc)
+
+    def _matches(self, doc, query):
+        for field, condition in query.items():
+            if field == '$or':
+                if not any(self._matches(doc, clause) for clause in condition):
+                    return False
+            elif '.' in field:
+                array, key = field.split('.', 1)
+                if not any(item.get(key) == condition for item in doc.get(array, [])):
+                    return False
+            elif isinstance(condition, dict) and '$in' in condition:
+                if doc.get(field) not in condition['$in']:
+                    return False
+            elif isinstance(condition, dict) and '$nin' in condition:
+                if doc.get(field) in condition['$nin']:
+                    return False
+            elif doc.get(field) != condition:
+                return False
+        return True
+
+    def find(self, query=None, projection=None):
+        return [dict(doc) for doc in self.docs.values() if self._matches(doc, query or {})]
+
+    def find_one(self, query, projection=None):
+        found = self.find(query, projection)
+        return found[0] if found else None
+
+    def _apply(self, doc, update):
+        doc.update(update.get('$set', {}))
+        for array, match in update.get('$pull', {}).items():
+            doc[array] = [item for item in doc.get(array, []) if not self._matches(item, match)]
+        for array, push in update.get('$push', {}).items():
+            (sort_key, direction), = push['$sort'].items()
+            items = sorted(doc.get(array, []) + push['$each'], key=lambda i: i[sort_key], reverse=direction < 0)
+            doc[array] = items[:push['$slice']]
+
+    def update_many(self, query, update):
+        for doc in self.docs.values():
+            if self._matches(doc, query):
+                self._apply(doc, update)
+
+    def update_one(self, query, update, upsert=False):
+        doc = next((d for d in self.docs.values() if self._matches(d, query)), None)
+        if doc is None and upsert:
+            doc = self.docs[query['_id']] = {'_id': query['_id']}
+        if doc is not None:
+            self._apply(doc, update)
+
+    def delete_many(self, query):
+        for key in [k for k, doc in self.docs.items() if self._matches(doc, query)]:
+            del self.docs[key]
+
+
+class TurnWriterTests(SimpleTestCase):
+    def setUp(self):
+        self.collection = FakeCollection()
+        self.flushed = threading.Event()
+        self.writer = TurnWriter(lambda: {'chat_messages': self.collection},
+                                 on_flush=lambda *args: self.flushed.set(), enabled=True)
+        self.addCleanup(self.writer.close)
+        patcher = mock.patch.object(turn_writer, 'WRITE_BACKOFF_SECONDS', 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_batches_are_written_in_order(self):
+        self.writer.enabled = False
+        self.writer.submit([('chat_messages', 'a'), ('chat_messages', 'b')], session_id='s1')
+        self.assertEqual(self.collection.written, ['a', 'b'])
+
+    def test_rejected_op_is_skipped_and_the_rest_written(self):
+        self.collection.errors = [BulkWriteError({'writeErrors': [{'index': 1, 'errmsg': 'dup key'}]})]
+        self.writer._bulk_write('chat_messages', ['a', 'b', 'c'])
+        self.assertEqual(self.collection.written, ['c'])
+        self.assertEqual(self.writer.stats()['failed_ops'], 1)
+
+    def test_write_concern_error_is_not_retried(self):
+        self.collection.errors = [BulkWriteError({'writeErrors': [], 'writeConcernErrors': [{'errmsg': 'timeout'}]})]
+        self.writer._bulk_write('chat_messages', ['a', 'b'])
+        stats = self.writer.stats()
+        self.assertEqual((stats['write_concern_errors'], stats['retries'], stats['failed_ops']), (1, 0, 0))
+
+    def test_transient_errors_are_retried(self):
+        self.collection.errors = [ConnectionError('reset'), ConnectionError('reset')]
+        self.writer._bulk_write('chat_messages', ['a'])
+        self.assertEqual(self.collection.written, ['a'])
+        self.assertEqual(self.writer.stats()['retries'], 2)
+
+    def test_failing_batch_does_not_kill_the_thread(self):
+        self.writer.submit([('chat_messages',)])  # malformed unit: fails inside _write
+        for _ in range(500):
+            if self.writer.stats()['failed_ops']:
+                break
+            time.sleep(0.01)
+        self.writer.submit([('chat_messages', 'a')], session_id='s1')
+        self.assertTrue(self.flushed.wait(5))
+        self.assertEqual(self.collection.written, ['a'])
+        self.assertTrue(self.writer._thread.is_alive())
+
+    def test_dead_thread_is_restarted(self):
+        dead = threading.Thread(target=lambda: None)
+        dead.start()
+        dead.join()
+        self.writer._thread = dead
+        self.writer.submit([('chat_messages', 'a')], session_id='s1')
+        self.assertTrue(self.flushed.wait(5))
+        self.assertIsNot(self.writer._thread, dead)
+        self.assertEqual(self.collection.written, ['a'])
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def open_breaker(self):
+        breaker = CircuitBreaker(threshold=2, reset_seconds=0)
+        breaker.record_failure()
+        breaker.record_failure()
+        return breaker
+
+    def test_opens_after_threshold_and_allows_one_trial(self):
+        breaker = CircuitBreaker(threshold=2, reset_seconds=60)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+
+        breaker.reset_seconds = 0
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_sync_trial_is_released_on_unexpected_error(self):
+        http = OllamaHTTP(retries=0)
+        http.breaker = self.open_breaker()
+        with mock.patch.object(http.session, 'post', side_effect=requests.exceptions.InvalidURL('bad')):
+            with self.assertRaises(requests.exceptions.InvalidURL):
+                http.post('/api/generate')
+        self.assertTrue(http.breaker.allow())
+
+    def test_sync_open_circuit_short_circuits(self):
+        http = OllamaHTTP(retries=0)
+        http.breaker = CircuitBreaker(threshold=1, reset_seconds=60)
+        http.breaker.record_failure()
+        with self.assertRaises(CircuitOpenError):
+            http.post('/api/generate')
+        self.assertEqual(http.stats()['short_circuited'], 1)
+
+    def async_http(self, handler):
+        http = AsyncOllamaHTTP(backoff=0)
+        http.breaker = CircuitBreaker(threshold=5, reset_seconds=0)
+        http._client = httpx.AsyncClient(base_url='http://ollama', transport=httpx.MockTransport(handler))
+        return http
+
+    def test_async_retries_transport_errors(self):
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            if len(calls) == 1:
+                raise httpx.ReadError('connection reset', request=request)
+            return httpx.Response(200, json={'response': 'ok'})
+
+        http = self.async_http(handler)
+        response = asyncio.run(http.send('/api/generate', json={}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(calls), 2)
+
+    def test_async_trial_is_released_on_unexpected_error(self):
+        def handler(request):
+            raise ValueError('unexpected')
+
+        http = self.async_http(handler)
+        http.breaker = self.open_breaker()
+        with self.assertRaises(ValueError):
+            asyncio.run(http.send('/api/generate', json={}))
+        self.assertTrue(http.breaker.allow())
+
+
+class FakeProducts:
+    """find() over in-memory products for the filters ProductVectorIndex uses."""
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    def _matches(self, doc, query):
+        if 'embedding' in query and 'embedding' not in doc:
+            return False
+        if 'embedded_at' in query and not doc.get('embedded_at', datetime.min) > query['embedded_at']['$gt']:
+            return False
+        return '_id' not in query or doc['_id'] in query['_id']['$in']
+
+    def find(self, query, projection=None):
+        return [dict(doc) for doc in self.docs if self._matches(doc, query)]
+
+
+class ProductVectorIndexTests(SimpleTestCase):
+    def test_refresh_picks_up_embedding_committed_behind_the_watermark(self):
+        t0 = datetime(2026, 1, 31, 12, 0, 0)
+        products = FakeProducts([
+            {'_id': 'a', 'name': 'Goat', 'embedding': [1.0, 0.0], 'embedded_at': t0 + timedelta(seconds=10)},
+            {'_id': 'b', 'name': 'Cow', 'embedding': [0.0, 1.0], 'embedded_at': t0},
+        ])
+        index = ProductVectorIndex()
+        index._collection = lambda: products
+        index.ensure_loaded()
+
+        # A slower writer commits b's new embedding, stamped before a's
+        products.docs[1].update(embedding=[1.0, 0.1], embedded_at=t0 + timedelta(seconds=5))
+        index._refresh()
+
+        hits = index.search([1.0, 0.1], limit=1)
+        self.assertEqual(hits[0]['name'], 'Cow')
+
+
+class VectorSearchFallbackTests(SimpleTestCase):
+    def search_with_error(self, code):
+        db = {views.PRODUCTS_COLLECTION_NAME: mock.Mock(**{'aggregate.side_effect': OperationFailure('failed', code)})}
+        with mock.patch.object(views, 'get_query_embedding', return_value=[1.0, 0.0]), \
+                mock.patch.object(views, '_shared_db', return_value=db), \
+                mock.patch.object(views.product_vector_index, 'search', return_value=[]) as local, \
+                mock.patch.object(views, '_atlas_vector_search_available', True):
+            views.search_products_via_vector_search('goat price')
+            return views._atlas_vector_search_available, local.called
+
+    def test_unrecognized_stage_switches_to_the_local_index(self):
+        self.assertEqual(self.search_with_error(40324), (False, True))
+
+    def test_other_failures_keep_trying_atlas(self):
+        self.assertEqual(self.search_with_error(50), (True, True))
+
+
+def sketch_of(values):
+    sketch = {}
+    for value in values:
+        (key, count), = sketch_inc('s', value).items()
+        key = key.split('.', 1)[1]
+        sketch[key] = sketch.get(key, 0) + count
+    return sketch
+
+
+class LatencySketchTests(SimpleTestCase):
+    def test_quantiles_are_within_the_relative_accuracy(self):
+        values = [1.5 ** (i / 10) * 40 for i in range(1000)]
+        sketch = sketch_of(values)
+        for q in (0.5, 0.9, 0.95, 0.99):
+            exact = sorted(values)[int(q * (len(values) - 1))]
+            self.assertLessEqual(abs(quantile(sketch, q) - exact), exact * SKETCH_RELATIVE_ACCURACY)
+
+    def test_merged_sketches_match_one_sketch_of_all_values(self):
+        first, second = [12, 80, 250, 3000], [0, 45, 45, 9000]
+        merged = sketch_of(first)
+        for key, count in sketch_of(second).items():
+            merged[key] = merged.get(key, 0) + count
+        self.assertEqual(merged, sketch_of(first + second))
+        self.assertEqual(percentiles(merged)['count'], 8)
+        # Non-positive values land in the zero bucket and report as 0
+        self.assertEqual(quantile(merged, 0), 0.0)
+
+    def test_empty_sketch_has_no_percentiles(self):
+        self.assertIsNone(percentiles({}))
+        self.assertIsNone(quantile(None, 0.5))
+
+
+def fast_path_turn(message, **overrides):
+    turn = {
+        'message': message, 'user_authenticated': True, 'livestock_perf_req': False,
+        'best_livestock': [], 'worst_livestock': [],
+        'portfolio_data': [
+            {'product_name': 'Murrah buffalo', 'total_investment': 100000, 'current_value': 120000,
+             'profit_loss': 20000, 'percentage_change': 20.0},
+            {'product_name': 'Boer goat', 'total_investment': 50000, 'current_value': 45000,
+             'profit_loss': -5000, 'percentage_change': -10.0},
+        ],
+    }
+    turn.update(overrides)
+    return turn
+
+
+class FastPathRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = FastPathRouter(enabled=True)
+
+    def test_portfolio_lookup_is_answered_from_the_template(self):
+        route, text = self.router.route(fast_path_turn('Show my portfolio'))
+        self.assertEqual(route, PORTFOLIO)
+        self.assertIn('NRS 150,000 invested', text)
+        self.assertIn('Best performer: Murrah buffalo', text)
+        self.assertIn('Weakest: Boer goat', text)
+
+    def test_open_ended_and_anonymous_turns_go_to_the_model(self):
+        self.assertEqual(self.router.route(fast_path_turn('How can I improve my portfolio?')), (None, None))
+        self.assertEqual(
+            self.router.route(fast_path_turn('Show my portfolio', user_authenticated=False)), (None, None),
+        )
+
+    def test_leaderboard_picks_the_worst_list_when_asked(self):
+        turn = fast_path_turn(
+            'worst performing livestock', livestock_perf_req=True,
+            best_livestock=[{'name': 'Kali', 'type': 'buffalo', 'profit': 30000}],
+            worst_livestock=[{'breed': 'Jamunapari', 'type': 'goat', 'profit': -4000}],
+        )
+        route, text = self.router.route(turn)
+        self.assertEqual(route, LEADERBOARD)
+        self.assertIn('1. Jamunapari (goat): net loss NRS 4,000', text)
+
+    def test_stats_count_hits_and_disabled_router_never_answers(self):
+        self.router.route(fast_path_turn('Show my portfolio'))
+        self.router.route(fast_path_turn('Why did prices fall?'))
+        stats = self.router.stats()
+        self.assertEqual((stats['turns'], stats['hits'], stats['hit_rate']), (2, 1, 0.5))
+        self.assertEqual(stats['routes'], {PORTFOLIO: 1})
+
+        disabled = FastPathRouter(enabled=False)
+        self.assertEqual(disabled.route(fast_path_turn('Show my portfolio')), (None, None))
+
+
+def leaderboard_db(animals):
+    return {
+        'livestock': FakeCollection(docs=animals),
+        leaderboard.LEADERBOARD_COLLECTION: FakeCollection(),
+    }
+
+
+def animal(number, animal_type, profit):
+    return {
+        '_id': f"A{number}", 'name': f"Animal {number}", 'type': animal_type, 'status': 'active',
+        'purchase_price': 10000, 'current_value': str(10000 + profit),
+    }
+
+
+class LeaderboardTests(SimpleTestCase):
+    def setUp(self):
+        # Profits -12000 .. 12000 in steps of 1000, alternating goat / buffalo
+        self.animals = [animal(i, 'goat' if i % 2 else 'buffalo', (i - 12) * 1000) for i in range(25)]
+        self.db = leaderboard_db(self.animals)
+        self.boards = self.db[leaderboard.LEADERBOARD_COLLECTION].docs
+        with mock.patch('builtins.print'):
+            leaderboard.rebuild(self.db)
+
+    def profits(self, scope, side):
+        return [entry['profit'] for entry in self.boards[scope][side]]
+
+    def test_rebuild_keeps_the_buffer_best_and_worst_in_order(self):
+        buffer = leaderboard.LEADERBOARD_BUFFER
+        self.assertEqual(self.profits('all', 'top'), [(12 - i) * 1000 for i in range(buffer)])
+        self.assertEqual(self.profits('all', 'bottom'), [(i - 12) * 1000 for i in range(buffer)])
+        self.assertEqual(self.profits('type:goat', 'top')[0], 11000)
+        self.assertEqual(set(self.boards), {'all', 'type:goat', 'type:buffalo'})
+
+    def test_message_naming_a_type_reads_that_board(self):
+        best, worst, scope = leaderboard.read_leaderboard(self.db, 'best performing goats')
+        self.assertEqual(scope, 'type:goat')
+        self.assertEqual(len(best), leaderboard.LEADERBOARD_SIZE)
+        self.assertTrue(all(entry['type'] == 'goat' for entry in best + worst))
+        self.assertEqual(leaderboard.read_leaderboard(self.db, 'top buffaloes')[2], 'type:buffalo')
+        self.assertEqual(leaderboard.read_leaderboard(self.db, 'best livestock performers')[2], 'all')
+
+    def test_animal_changed_moves_the_entry(self):
+        # The worst goat becomes the best animal overall
+        self.db['livestock'].docs['A1']['current_value'] = 50000
+        leaderboard.animal_changed(self.db, 'A1')
+        self.assertEqual(self.boards['all']['top'][0]['key'], 'A1')
+        self.assertEqual(self.boards['type:goat']['top'][0]['profit'], 40000)
+        # It can refill the freed buffer slot at the end of the bottom list, but not the part the chat shows
+        shown_worst = self.boards['type:goat']['bottom'][:leaderboard.LEADERBOARD_SIZE]
+        self.assertNotIn('A1', [entry['key'] for entry in shown_worst])
+        self.assertEqual(len(self.boards['all']['top']), leaderboard.LEADERBOARD_BUFFER)
+
+    def test_empty_livestock_is_not_rescanned_on_every_read(self):
+        db = leaderboard_db([])
+        with mock.patch('builtins.print'):
+            leaderboard.rebuild(db)
+        self.assertEqual(db[leaderboard.LEADERBOARD_COLLECTION].docs['all']['top'], [])
+
+        with mock.patch.object(leaderboard, '_rebuild_in_background') as background:
+            self.assertEqual(leaderboard.read_leaderboard(db, 'best performers'), ([], [], 'all'))
+        background.assert_not_called()
+
+    def test_missing_board_is_built_in_the_background(self):
+        db = leaderboard_db(self.animals)
+        with mock.patch.object(leaderboard, 'rebuild') as rebuild, \
+                mock.patch.object(leaderboard, '_rebuild_in_background') as background:
+            self.assertEqual(leaderboard.read_leaderboard(db, 'best performers'), ([], [], 'all'))
+        rebuild.assert_not_called()
+        background.assert_called_once_with(db)
+
+
+class FakeCacheCollection:
+    """insert_one / find().sort() over cached answers, honouring the sync query."""
+
+    def __init__(self):
+        self.docs = []
+
+    def insert_one(self, doc):
+        self.docs.append(dict(doc))
+
+    def find(self, query):
+        since = query.get('created_at', {}).get('$gte', datetime.min)
+        docs = [dict(doc) for doc in self.docs
+                if doc['created_at'] >= since and doc['expires_at'] > query['expires_at']['$gt']]
+        return SimpleNamespace(sort=lambda field, direction: sorted(docs, key=lambda d: d[field]))
+
+
+class ResponseCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.collection = FakeCacheCollection()
+        self.cache = SemanticResponseCache()
+        self.cache._collection = lambda: self.collection
+
+    def test_personalised_turns_are_not_cacheable(self):
+        plain = {'personalized': False, 'has_history': False, 'livestock_perf_req': False}
+        self.assertTrue(is_cacheable(plain))
+        for flag in plain:
+            self.assertFalse(is_cacheable(dict(plain, **{flag: True})))
+
+    def test_answer_from_another_model_misses(self):
+        self.cache.store([1.0, 0.0], 'general', 'llama3', 'how do I feed goats', 'Hay and browse.')
+        self.assertEqual(self.cache.lookup([1.0, 0.01], 'general', 'llama3'), 'Hay and browse.')
+        self.assertIsNone(self.cache.lookup([1.0, 0.01], 'general', 'mistral'))
+        self.assertIsNone(self.cache.lookup([0.0, 1.0], 'general', 'llama3'))
+        self.assertIsNone(self.cache.lookup([1.0, 0.01], 'market_price', 'llama3'))
+
+    def test_resync_does_not_duplicate_entries(self):
+        self.cache.store([1.0, 0.0], 'general', 'llama3', 'how do I feed goats', 'Hay and browse.')
+        other = SemanticResponseCache()
+        other._collection = lambda: self.collection
+        other.store([0.0, 1.0], 'general', 'llama3', 'goat shelter', 'Dry and draught-free.')
+
+        # Both syncs see the newest entry again through created_at $gte, and this cache also reads back its own
+        for _ in range(2):
+            self.cache._synced_at = None
+            self.cache._sync()
+        self.assertEqual(self.cache.stats()['entries'], 2)
+        self.assertEqual(self.cache.lookup([0.0, 1.0], 'general', 'llama3'), 'Dry and draught-free.')
+
+
+class EmbeddingCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.collection = mock.Mock(**{'find_one_and_update.return_value': None})
+        self.cache = EmbeddingCache(max_size=8)
+        self.cache._collection = lambda: self.collection
+        self.compute = mock.Mock(return_value=[0.1, 0.2])
+
+    def test_repeated_question_is_served_from_memory(self):
+        self.cache.get_or_compute('Goat price?', 'nomic', self.compute)
+        self.collection.reset_mock()
+        self.assertEqual(self.cache.get_or_compute('goat  price', 'nomic', self.compute), [0.1, 0.2])
+        self.compute.assert_called_once()
+        self.collection.find_one_and_update.assert_not_called()
+        self.assertEqual(self.cache.stats()['memory_hits'], 1)
+
+    def test_persistent_hit_is_promoted_to_memory(self):
+        self.collection.find_one_and_update.return_value = {'embedding': [0.3, 0.4]}
+        self.assertEqual(self.cache.get_or_compute('goat price', 'nomic', self.compute), [0.3, 0.4])
+        self.assertEqual(self.cache.get_or_compute('goat price', 'nomic', self.compute), [0.3, 0.4])
+        self.compute.assert_not_called()
+        self.collection.find_one_and_update.assert_called_once()
+        self.collection.update_one.assert_not_called()
+
+    def test_model_is_part_of_the_key(self):
+        self.assertNotEqual(cache_key('nomic', 'goat price'), cache_key('mxbai', 'goat price'))
+        self.cache.get_or_compute('goat price', 'nomic', self.compute)
+        self.cache.get_or_compute('goat price', 'mxbai', self.compute)
+        self.assertEqual(self.compute.call_count, 2)
+
+    def test_failed_embeddings_are_not_cached(self):
+        self.compute.return_value = None
+        self.assertIsNone(self.cache.get_or_compute('goat price', 'nomic', self.compute))
+        self.assertIsNone(self.cache.get_or_compute('goat price', 'nomic', self.compute))
+        self.assertEqual(self.compute.call_count, 2)
+        self.collection.update_one.assert_not_called()
+        self.assertEqual(self.cache.stats()['memory_entries'], 0)
@@ -0,0 +1,201 @@
+# chatbot/turn_writer.py
+"""
+Write-behind persistence for chat turns.
+
+The views hand each finished turn over as a list of (collection, pymongo
+write op) pairs and answer straight away. A single daemon thread drains the
+queue: whatever has piled up while the previous batch was being written (up
+to CHATBOT_WRITE_BATCH_SIZE units) goes out as one ordered bulk_write per
+collection, so a busy worker makes a handful of round trips per batch
+instead of several per turn. Once written, on_flush(session_ids, write_ms,
+turns) gets the sessions touched by the batch (for summary refresh) and how
+long the batch took to write.
+
+Transient errors are retried with backoff; a write the server rejects is
+logged and skipped, and a batch that still fails is dropped without
+stopping the thread (a dead thread is restarted on the next submit). The
+queue is drained at interpreter exit (atexit), so a clean worker restart
+loses nothing. CHATBOT_WRITE_BEHIND=False writes inline instead
+(management commands, debugging).
+"""
+import atexit
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+from decouple import config
+from pymongo.errors import BulkWriteError
+
+CHATBOT_WRITE_BEHIND = config('CHATBOT_WRITE_BEHIND', default=True, cast=bool)
+CHATBOT_WRITE_BATCH_SIZE = config('CHATBOT_WRITE_BATCH_SIZE', default=200, cast=int)
+CHATBOT_WRITE_QUEUE_SIZE = config('CHATBOT_WRITE_QUEUE_SIZE', default=10000, cast=int)
+WRITE_RETRIES = 3
+WRITE_BACKOFF_SECONDS = 0.5
+SHUTDOWN_TIMEOUT_SECONDS = 10
+
+_STOP = object()
+
+
+class TurnWriter:
+    def __init__(self, get_db, on_flush=None, enabled=CHATBOT_WRITE_BEHIND,
+                 batch_size=CHATBOT_WRITE_BATCH_SIZE, max_queue=CHATBOT_WRITE_QUEUE_SIZE):
+        self.get_db = get_db
+        self.on_flush = on_flush
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._closed = False
+        self._lock = threading.Lock()
+        self._stats = {'submitted': 0, 'written': 0, 'batches': 0, 'largest_batch': 0,
+                       'inline': 0, 'retries': 0, 'failed_ops': 0, 'write_concern_errors': 0}
+
+    def submit(self, ops, session_id=None):
+        """
+        Queue one unit of work, e.g. a turn: [(collection_name, op), ...],
+        written in order. session_id marks the session for a summary refresh.
+        """
+        item = (list(ops), session_id)
+        with self._lock:
+            self._stats['submitted'] += 1
+        if not self.enabled or self._closed:
+            self._write_inline(item)
+            return
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            print("⚠️ [WRITER] Queue full, writing inline")
+            self._write_inline(item)
+
+    def _write_inline(self, item):
+        with self._lock:
+            self._stats['inline'] += 1
+        self._write([item])
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                if self._thread is None:
+                    atexit.register(self.close)
+                else:
+                    print("⚠️ [WRITER] Writer thread died, restarting it")
+                self._thread = threading.Thread(target=self._run, name='chat-turn-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            stop = False
+            # Group commit: take whatever queued up while the last batch was written
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            try:
+                self._write(batch)
+            except Exception as e:
+                # Keep the thread alive for the next batch
+                print(f"❌ [WRITER] Dropping batch of {len(batch)} unit(s): {e}")
+                with self._lock:
+                    self._stats['failed_ops'] += sum(len(ops) for ops, _ in batch)
+            if stop:
+                return
+
+    def _write(self, batch):
+        by_collection = OrderedDict()
+        for ops, _ in batch:
+            for name, op in ops:
+                by_collection.setdefault(name, []).append(op)
+        sessions = list(OrderedDict.fromkeys(sid for _, sid in batch if sid))
+
+        started = time.perf_counter()
+        for name, ops in by_collection.items():
+            self._bulk_write(name, ops)
+        write_ms = int((time.perf_counter() - started) * 1000)
+
+        with self._lock:
+            self._stats['written'] += len(batch)
+            self._stats['batches'] += 1
+            self._stats['largest_batch'] = max(self._stats['largest_batch'], len(batch))
+
+        if self.on_flush:
+            try:
+                self.on_flush(sessions, write_ms, sum(1 for _, sid in batch if sid))
+            except Exception as e:
+                print(f"❌ [WRITER] on_flush failed: {e}")
+
+    def _bulk_write(self, name, ops):
+        attempt = 0
+        while ops:
+            try:
+                db = self.get_db()
+                if db is None:
+                    raise ConnectionError("no database connection")
+                db[name].bulk_write(ops, ordered=True)
+                return
+            except BulkWriteError as e:
+                write_errors = e.details.get('writeErrors') or []
+                if not write_errors:
+                    # Only the write concern failed: the ops were applied, and retrying
+                    # the rollup $inc ops would count them twice
+                    print(f"⚠️ [WRITER] {name}: write concern not satisfied: {e.details.get('writeConcernErrors')}")
+                    with self._lock:
+                        self._stats['write_concern_errors'] += 1
+                    return
+                # Ops before the failed one are applied; skip the rejected op, keep the rest
+                failed = write_errors[0]['index']
+                print(f"❌ [WRITER] {name}: op rejected: {write_errors[0].get('errmsg')}")
+                with self._lock:
+                    self._stats['failed_ops'] += 1
+                ops = ops[failed + 1:]
+            except Exception as e:
+                if attempt >= WRITE_RETRIES:
+                    print(f"❌ [WRITER] {name}: dropping {len(ops)} op(s) after {attempt + 1} attempts: {e}")
+                    with self._lock:
+                        self._stats['failed_ops'] += len(ops)
+                    return
+                with self._lock:
+                    self._stats['retries'] += 1
+                time.sleep(WRITE_BACKOFF_SECONDS * (2 ** attempt))
+                attempt += 1
+
+    def close(self, timeout=SHUTDOWN_TIMEOUT_SECONDS):
+        """Stop queueing, let the thread write what is pending, then write any stragglers inline."""
+        self._closed = True
+        if self._thread is None:
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+
+        leftover = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                leftover.append(item)
+        if leftover:
+            self._write(leftover)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['queued'] = self._queue.qsize()
+        stats['enabled'] = self.enabled
+        return stats
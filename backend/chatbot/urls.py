@@ -1,9 +1,10 @@
 # chatbot/urls.py
 from django.urls import path
-from . import views
+from . import views, async_views
 
 urlpatterns = [
     path('api/', views.chatbot_api, name='chatbot_api'),
+    path('api/async/', async_views.chatbot_api_async, name='chatbot_api_async'),
     path('health/', views.health_check, name='health_check'),
     path('sessions/', views.list_sessions, name='list_sessions'),
     path('sessions/<str:session_id>/messages/', views.get_session_messages, name='get_session_messages'),
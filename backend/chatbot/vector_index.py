@@ -0,0 +1,377 @@
+# chatbot/vector_index.py
+"""
+In-process nearest-neighbour index over product embeddings.
+
+Used by search_products_via_vector_search when the Atlas-only `$vectorSearch`
+stage is unavailable (self-hosted MongoDB). Small catalogs are searched with a
+single NumPy matrix product over L2-normalised vectors; above
+VECTOR_INDEX_BRUTE_FORCE_MAX products an HNSW graph is built in the background
+and takes over once ready.
+
+The index loads lazily on first use and refreshes incrementally: only products
+whose `embedded_at` moved past the last refresh are re-read, and products that
+lost their embedding (or were deleted) are dropped. embedded_at is the server
+time at which the embedding was written, but concurrent writers can commit
+out of order, so each refresh also re-reads VECTOR_INDEX_WATERMARK_OVERLAP_SECONDS
+behind the newest value seen. Results follow the
+`$vectorSearch` contract: the projected product fields plus `score`, where
+score = (1 + cosine) / 2 as Atlas reports it for cosine indexes.
+"""
+import heapq
+import math
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from decouple import config
+from pymongo import MongoClient
+
+MONGO_URI = config('MONGO_URI')
+MONGO_DB_NAME = config('MONGO_DB_NAME', default='django_project')
+PRODUCTS_COLLECTION_NAME = "products"
+
+VECTOR_INDEX_BRUTE_FORCE_MAX = config('VECTOR_INDEX_BRUTE_FORCE_MAX', default=20000, cast=int)
+VECTOR_INDEX_REFRESH_SECONDS = config('VECTOR_INDEX_REFRESH_SECONDS', default=300, cast=int)
+VECTOR_INDEX_WATERMARK_OVERLAP_SECONDS = config('VECTOR_INDEX_WATERMARK_OVERLAP_SECONDS', default=120, cast=int)
+
+# Same fields the $vectorSearch pipeline projects
+RESULT_FIELDS = ('name', 'description', 'category', 'current_market_price')
+
+
+def _normalize(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+class BruteForceIndex:
+    """Exact cosine search: one matrix-vector product per query."""
+
+    def __init__(self, dim):
+        self.dim = dim
+        self._keys = []
+        self._rows = {}
+        # Grown by doubling; only the first len(self._keys) rows are live
+        self._matrix = np.zeros((1024, dim), dtype=np.float32)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def vectors(self):
+        """{key: vector} copy of the live rows."""
+        return {key: self._matrix[row].copy() for key, row in self._rows.items()}
+
+    def upsert(self, key, vector):
+        row = self._rows.get(key)
+        if row is None:
+            row = len(self._keys)
+            if row == len(self._matrix):
+                self._matrix = np.vstack([self._matrix, np.zeros_like(self._matrix)])
+            self._rows[key] = row
+            self._keys.append(key)
+        self._matrix[row] = vector
+
+    def remove(self, key):
+        row = self._rows.pop(key, None)
+        if row is None:
+            return
+        # Move the last row into the hole so the live rows stay dense
+        last = len(self._keys) - 1
+        if row != last:
+            self._matrix[row] = self._matrix[last]
+            self._keys[row] = self._keys[last]
+            self._rows[self._keys[row]] = row
+        self._keys.pop()
+
+    def search(self, query, k):
+        if not self._keys:
+            return []
+        sims = self._matrix[:len(self._keys)] @ query
+        k = min(k, len(sims))
+        top = np.argpartition(-sims, k - 1)[:k]
+        top = top[np.argsort(-sims[top])]
+        return [(self._keys[i], float(sims[i])) for i in top]
+
+
+class HNSWIndex:
+    """
+    Hierarchical navigable small-world graph (Malkov & Yashunin) over
+    normalised vectors, so inner product equals cosine similarity.
+    Removals are tombstones; the owner rebuilds when too many pile up.
+    """
+
+    def __init__(self, dim, m=16, ef_construction=100, ef_search=64, seed=42):
+        self.dim = dim
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self._level_mult = 1 / math.log(m)
+        self._random = random.Random(seed)
+        self._vectors = np.zeros((1024, dim), dtype=np.float32)
+        self._neighbors = []   # node -> [neighbour ids per level]
+        self._node_keys = []   # node -> key
+        self._key_nodes = {}   # key -> live node
+        self._entry = None
+        self._max_level = -1
+
+    def __len__(self):
+        return len(self._key_nodes)
+
+    @property
+    def tombstones(self):
+        return len(self._node_keys) - len(self._key_nodes)
+
+    def _max_neighbors(self, level):
+        return self.m * 2 if level == 0 else self.m
+
+    def _search_layer(self, query, entry_points, ef, level):
+        visited = set(entry_points)
+        sims = self._vectors[entry_points] @ query
+        candidates = [(-s, n) for s, n in zip(sims, entry_points)]
+        heapq.heapify(candidates)
+        best = [(s, n) for s, n in zip(sims, entry_points)]
+        heapq.heapify(best)
+        while len(best) > ef:
+            heapq.heappop(best)
+
+        while candidates:
+            neg_sim, node = heapq.heappop(candidates)
+            if len(best) >= ef and -neg_sim < best[0][0]:
+                break
+            fresh = [n for n in self._neighbors[node][level] if n not in visited]
+            if not fresh:
+                continue
+            visited.update(fresh)
+            for n, s in zip(fresh, self._vectors[fresh] @ query):
+                if len(best) < ef or s > best[0][0]:
+                    heapq.heappush(candidates, (-s, n))
+                    heapq.heappush(best, (s, n))
+                    if len(best) > ef:
+                        heapq.heappop(best)
+        return best
+
+    def _greedy_descent(self, query, target_level):
+        entry = [self._entry]
+        for level in range(self._max_level, target_level, -1):
+            entry = [max(self._search_layer(query, entry, 1, level))[1]]
+        return entry
+
+    def _select_neighbors(self, candidates, limit):
+        """
+        Neighbour-selection heuristic: take a candidate only if it is closer
+        to the base node than to every neighbour already taken. This keeps
+        long links between clusters, which plain top-M selection prunes away.
+        """
+        selected = []
+        for sim, node in sorted(candidates, reverse=True):
+            if len(selected) == limit:
+                break
+            if not selected or (self._vectors[selected] @ self._vectors[node]).max() < sim:
+                selected.append(node)
+        return selected
+
+    def upsert(self, key, vector):
+        if key in self._key_nodes:
+            self.remove(key)
+
+        node = len(self._node_keys)
+        if node == len(self._vectors):
+            self._vectors = np.vstack([self._vectors, np.zeros_like(self._vectors)])
+        self._vectors[node] = vector
+        level = int(-math.log(1.0 - self._random.random()) * self._level_mult)
+        self._neighbors.append([[] for _ in range(level + 1)])
+        self._node_keys.append(key)
+        self._key_nodes[key] = node
+
+        if self._entry is None:
+            self._entry, self._max_level = node, level
+            return
+
+        entry = self._greedy_descent(vector, level)
+        for lvl in range(min(level, self._max_level), -1, -1):
+            found = self._search_layer(vector, entry, self.ef_construction, lvl)
+            limit = self._max_neighbors(lvl)
+            selected = self._select_neighbors(found, limit)
+            self._neighbors[node][lvl] = selected
+            for n in selected:
+                links = self._neighbors[n][lvl]
+                links.append(node)
+                if len(links) > limit:
+                    sims = self._vectors[links] @ self._vectors[n]
+                    self._neighbors[n][lvl] = self._select_neighbors(list(zip(sims, links)), limit)
+            entry = [n for _, n in found]
+
+        if level > self._max_level:
+            self._entry, self._max_level = node, level
+
+    def remove(self, key):
+        # The node stays in the graph for navigation but is never returned
+        self._key_nodes.pop(key, None)
+
+    def search(self, query, k):
+        if self._entry is None or not self._key_nodes:
+            return []
+        entry = self._greedy_descent(query, 0)
+        # Over-fetch a little so tombstones don't shrink the result
+        found = self._search_layer(query, entry, max(self.ef_search, k + self.tombstones), 0)
+        results = []
+        for sim, node in heapq.nlargest(len(found), found):
+            key = self._node_keys[node]
+            if self._key_nodes.get(key) == node:
+                results.append((key, float(sim)))
+                if len(results) == k:
+                    break
+        return results
+
+
+class ProductVectorIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._client = None
+        self._exact = None
+        self._graph = None
+        self._docs = {}
+        self._loaded_at = None
+        self._watermark = None
+        self._building_graph = False
+        self._refreshing = False
+
+    def _collection(self):
+        if self._client is None:
+            self._client = MongoClient(MONGO_URI)
+        return self._client[MONGO_DB_NAME][PRODUCTS_COLLECTION_NAME]
+
+    def _load(self, docs):
+        """Add/replace documents; returns how many were indexed."""
+        count = 0
+        for doc in docs:
+            embedding = doc.get('embedding')
+            if not embedding:
+                continue
+            vector = _normalize(embedding)
+            if self._exact is None:
+                self._exact = BruteForceIndex(len(vector))
+            if len(vector) != self._exact.dim:
+                continue
+            key = doc['_id']
+            self._exact.upsert(key, vector)
+            if self._graph is not None:
+                self._graph.upsert(key, vector)
+            self._docs[key] = {field: doc.get(field) for field in RESULT_FIELDS}
+            embedded_at = doc.get('embedded_at')
+            if isinstance(embedded_at, datetime) and (self._watermark is None or embedded_at > self._watermark):
+                self._watermark = embedded_at
+            count += 1
+        return count
+
+    def _drop(self, key):
+        self._docs.pop(key, None)
+        if self._exact is not None:
+            self._exact.remove(key)
+        if self._graph is not None:
+            self._graph.remove(key)
+
+    def ensure_loaded(self):
+        if self._loaded_at is None:
+            with self._lock:
+                if self._loaded_at is None:
+                    started = time.time()
+                    fields = {field: 1 for field in RESULT_FIELDS}
+                    count = self._load(self._collection().find(
+                        {"embedding": {"$exists": True}}, {**fields, 'embedding': 1, 'embedded_at': 1}
+                    ))
+                    self._loaded_at = time.time()
+                    print(f"[VECTOR] Loaded {count} product embeddings in {(self._loaded_at - started) * 1000:.0f}ms")
+            self._maybe_build_graph()
+        elif time.time() - self._loaded_at > VECTOR_INDEX_REFRESH_SECONDS and not self._refreshing:
+            self._refreshing = True
+            threading.Thread(target=self._refresh, daemon=True).start()
+
+    def _refresh(self):
+        """Incremental refresh: re-read changed embeddings, drop vanished ones."""
+        try:
+            collection = self._collection()
+            fields = {field: 1 for field in RESULT_FIELDS}
+            query = {"embedding": {"$exists": True}}
+            if self._watermark is not None:
+                # Re-read the overlap window: a write stamped earlier may have committed after the watermark
+                since = self._watermark - timedelta(seconds=VECTOR_INDEX_WATERMARK_OVERLAP_SECONDS)
+                query["embedded_at"] = {"$gt": since}
+            changed = list(collection.find(query, {**fields, 'embedding': 1, 'embedded_at': 1}))
+            live = {doc['_id'] for doc in collection.find({"embedding": {"$exists": True}}, {'_id': 1})}
+            # Products embedded before embedded_at existed have no watermark; pick them up by id
+            known = set(self._docs)
+            missing = live - known - {doc['_id'] for doc in changed}
+            if missing:
+                changed += list(collection.find(
+                    {"_id": {"$in": list(missing)}}, {**fields, 'embedding': 1, 'embedded_at': 1}
+                ))
+            with self._lock:
+                updated = self._load(changed)
+                for key in known - live:
+                    self._drop(key)
+                if self._graph is not None and self._graph.tombstones > len(self._graph) // 5:
+                    # Too many dead nodes; rebuild the graph from scratch
+                    self._graph = None
+                self._loaded_at = time.time()
+            print(f"[VECTOR] Refreshed: {updated} updated, {len(known - live)} removed")
+            self._maybe_build_graph()
+        except Exception as e:
+            print(f"[VECTOR] Refresh failed: {e}")
+        finally:
+            self._refreshing = False
+
+    def _maybe_build_graph(self):
+        with self._lock:
+            if (self._graph is not None or self._building_graph or self._exact is None
+                    or len(self._exact) <= VECTOR_INDEX_BRUTE_FORCE_MAX):
+                return
+            self._building_graph = True
+            snapshot = self._exact.vectors()
+            dim = self._exact.dim
+        threading.Thread(target=self._build_graph, args=(dim, snapshot), daemon=True).start()
+
+    def _build_graph(self, dim, snapshot):
+        try:
+            started = time.time()
+            graph = HNSWIndex(dim)
+            for key, vector in snapshot.items():
+                graph.upsert(key, vector)
+            with self._lock:
+                # Catch up with anything that changed while we were building
+                current = self._exact.vectors()
+                for key in snapshot.keys() - current.keys():
+                    graph.remove(key)
+                for key, vector in current.items():
+                    if key not in snapshot or not np.array_equal(snapshot[key], vector):
+                        graph.upsert(key, vector)
+                self._graph = graph
+            print(f"[VECTOR] HNSW graph ready: {len(graph)} nodes in {time.time() - started:.1f}s")
+        except Exception as e:
+            print(f"[VECTOR] HNSW build failed, staying on brute force: {e}")
+        finally:
+            self._building_graph = False
+
+    def search(self, query_embedding, limit=3):
+        """Top-`limit` products as dicts with RESULT_FIELDS and a $vectorSearch-style score."""
+        self.ensure_loaded()
+        query = _normalize(query_embedding)
+        with self._lock:
+            index = self._graph if self._graph is not None else self._exact
+            if index is None or len(query) != self._exact.dim:
+                return []
+            hits = index.search(query, limit)
+            return [{**self._docs[key], 'score': (1 + sim) / 2} for key, sim in hits]
+
+    def stats(self):
+        return {
+            'loaded_at': self._loaded_at,
+            'products': len(self._docs),
+            'backend': 'hnsw' if self._graph is not None else 'brute_force',
+            'graph_building': self._building_graph,
+        }
+
+
+product_vector_index = ProductVectorIndex()
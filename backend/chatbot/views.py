@@ -2,12 +2,11 @@
 import json
 import re
 import time
-import requests
 from threading import Thread
 from datetime import datetime
-from pymongo import MongoClient
+from pymongo.errors import OperationFailure
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
 from rest_framework.decorators import api_view, authentication_classes, permission_classes
@@ -15,42 +14,70 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.authentication import SessionAuthentication
 from data.authentication import SimpleTokenAuthentication
 from .ollama_local import OllamaLocal
+from .ollama_http import ollama_http
 from .user_utils import get_mongo_user_id, calculate_profit_loss
 from .mongo_manager import mongo_manager
+from .embedding_cache import embedding_cache
+from .vector_index import product_vector_index
+from .response_cache import response_cache, is_cacheable
+from .retrieval import retrieve
+from .fast_path import FAST_PATH_MODEL, fast_path_router
+from .leaderboard import read_leaderboard
+from .context_builder import KEEP_RECENT_MESSAGES, Section, build_context, strip_tables
 from decouple import config
 
 # Initialize Ollama client
 ollama_client = OllamaLocal(model_name="qwen3:8b")
 
-OLLAMA_EMBED_URL = "http://localhost:11434/api/embeddings"
 OLLAMA_EMBED_MODEL = "qwen3-embedding:0.6b"
-MONGO_URI = config('MONGO_URI')
 MONGO_DB_NAME = config('MONGO_DB_NAME', default='django_project')
 PRODUCTS_COLLECTION_NAME = "products"
 VECTOR_INDEX_NAME = "product_embeddings_idx"
 
-def get_query_embedding(text, model_name=OLLAMA_EMBED_MODEL):
+def _fetch_query_embedding(text, model_name=OLLAMA_EMBED_MODEL):
     data = {"model": model_name, "prompt": text}
     try:
-        response = requests.post(OLLAMA_EMBED_URL, json=data)
+        response = ollama_http.post("/api/embeddings", json=data, timeout=30)
         response.raise_for_status()
         return response.json().get("embedding")
     except Exception as e:
         print(f"Error getting embedding: {e}")
         return None
 
+def get_query_embedding(text, model_name=OLLAMA_EMBED_MODEL):
+    """Embedding for a user query, served from the two-tier cache when possible."""
+    return embedding_cache.get_or_compute(
+        text, model_name, lambda t: _fetch_query_embedding(t, model_name)
+    )
+
+# Set once $vectorSearch is rejected as unsupported (non-Atlas deployment); later
+# queries go straight to the local index
+_atlas_vector_search_available = True
+# Unrecognized pipeline stage (self-hosted server), SearchNotEnabled (no search nodes)
+UNSUPPORTED_STAGE_CODES = (40324, 31082)
+
+def _shared_db():
+    """This module's database on mongo_manager's pooled (thread-safe) client."""
+    mongo_manager.connect()
+    if mongo_manager.client is None:
+        return None
+    return mongo_manager.client[MONGO_DB_NAME]
+
 def search_products_via_vector_search(query_text, num_candidates=10, limit=3):
+    global _atlas_vector_search_available
     query_embedding = get_query_embedding(query_text)
     if not query_embedding: return []
 
-    client = MongoClient(MONGO_URI)
+    if not _atlas_vector_search_available:
+        return product_vector_index.search(query_embedding, limit=limit)
+
+    db = _shared_db()
+    if db is None: return []
     try:
-        db = client[MONGO_DB_NAME]
         collection = db[PRODUCTS_COLLECTION_NAME]
         
-        # Check if index exists or run pipeline
-        # Note: vectorSearch requires Atlas. If local/standard mongo, this pipeline might fail 
-        # unless setup correctly. Assuming source setup is Atlas.
+        # Note: vectorSearch requires Atlas. On self-hosted Mongo the stage is
+        # rejected and we fall back to the in-process index below.
         results = collection.aggregate([
             {
                 "$vectorSearch": {
@@ -69,11 +96,17 @@ def search_products_via_vector_search(query_text, num_candidates=10, limit=3):
             }
         ])
         return list(results)
+    except OperationFailure as e:
+        if e.code in UNSUPPORTED_STAGE_CODES:
+            print(f"Vector search unavailable, using in-process index: {e}")
+            _atlas_vector_search_available = False
+        else:
+            # Transient or query-specific (missing index, timeout): keep trying Atlas next time
+            print(f"Vector search failed ({e.code}), using in-process index for this query: {e}")
+        return product_vector_index.search(query_embedding, limit=limit)
     except Exception as e:
         print(f"Vector search error: {e}")
         return []
-    finally:
-        client.close()
 
 def format_retrieved_context(docs):
     if not docs: return ""
@@ -107,46 +140,17 @@ def generate_products_html_table(products):
         rows += f"<tr><td>{p.get('name')}</td><td>{p.get('category')}</td><td align='right'>{p.get('current_market_price')}</td></tr>"
     return f"<table border='1' width='100%'><thead><tr><th>Product</th><th>Category</th><th>Price</th></tr></thead><tbody>{rows}</tbody></table>"
 
-def get_livestock_performance_data():
-    client = MongoClient(MONGO_URI)
+def get_livestock_performance_data(message=''):
+    """Best and worst performers from the materialised leaderboard (one indexed read)."""
+    db = _shared_db()
+    if db is None: return [], []
     try:
-        db = client[MONGO_DB_NAME]
-        livestock_col = db['livestock']
-        
-        pipeline = [
-            {
-                "$project": {
-                    "name": 1,
-                    "breed": 1,
-                    "type": 1,
-                    "purchase_price": { "$toDouble": "$purchase_price" },
-                    "current_value": { "$toDouble": "$current_value" },
-                    "status": 1
-                }
-            },
-            {
-                "$addFields": {
-                    "profit": { "$subtract": ["$current_value", "$purchase_price"] }
-                }
-            },
-            {
-                "$sort": { "profit": -1 }
-            }
-        ]
-        
-        results = list(livestock_col.aggregate(pipeline))
-        if not results: return [], []
-        
-        best_performers = results[:5]
-        worst_performers = results[-5:]
-        worst_performers.reverse()
-        
+        best_performers, worst_performers, scope = read_leaderboard(db, message)
+        print(f"DEBUG: Leaderboard scope '{scope}'")
         return best_performers, worst_performers
     except Exception as e:
         print(f"Livestock performance error: {e}")
         return [], []
-    finally:
-        client.close()
 
 def generate_livestock_performance_html_table(data, title="Livestock Performance"):
     if not data: return ""
@@ -194,11 +198,315 @@ def detect_sentiment_and_intent(text):
 def health_check(request):
     return JsonResponse({'status': 'ok', 'message': 'Chatbot backend is reachable'})
 
-from datetime import datetime
+def wants_stream(request, data):
+    """Stream when the body says so or the client asks for an event stream."""
+    if str(data.get('stream', '')).lower() in ('1', 'true', 'yes'):
+        return True
+    return 'text/event-stream' in request.headers.get('Accept', '')
+
+
+def fetch_portfolio(user_obj):
+    """Profit/loss rows for the user's investments (demo rows for the admin account)."""
+    mid = get_mongo_user_id(user_obj)
+    if not mid:
+        return None
+    print(f"DEBUG: Found Mongo User ID: {mid}")
+    portfolio_data = calculate_profit_loss(mid, mongo_manager)
+
+    # [MOCK ADMIN DATA]
+    if not portfolio_data and user_obj.username == 'admin':
+        portfolio_data = [
+            {
+                'product_name': 'Boer Goat (Investomart Demo)',
+                'quantity': 2,
+                'total_investment': 15000.0,
+                'current_value': 18500.0,
+                'profit_loss': 3500.0,
+                'percentage_change': 23.33
+            },
+            {
+                'product_name': 'Kadaknath Chicken (Investomart Demo)',
+                'quantity': 10,
+                'total_investment': 5000.0,
+                'current_value': 4800.0,
+                'profit_loss': -200.0,
+                'percentage_change': -4.0
+            }
+        ]
+    return portfolio_data
+
+
+def prepare_turn(request, message, session_id, session_state=None):
+    """
+    Everything the model call needs: intent, portfolio, retrieved products,
+    livestock performance and the combined, token-budgeted prompt context.
+    Pass session_state ({'history', 'summary', 'kv_context'}) to skip fetching
+    those here (the async view reads them with motor).
+
+    With a stored Ollama KV context the earlier conversation is already
+    evaluated on the Ollama side, so history and summary stay out of the prompt.
+    """
+    # Detect sentiment and intent
+    print("DEBUG: Detecting sentiment/intent...")
+    sentiment, intent = detect_sentiment_and_intent(message)
+    print(f"DEBUG: sentiment={sentiment}, intent={intent}")
+    
+    # Capture necessary data
+    print("DEBUG: Checking request.user...")
+    user_authenticated = request.user.is_authenticated
+    user_obj = request.user if user_authenticated else None
+    print(f"DEBUG: user_authenticated={user_authenticated}, user={user_obj}")
+    
+    # Concurrent Retrieval: independent sources share one bounded pool
+    lowered = message.lower()
+    sources = {}
+    if user_authenticated:
+        sources['portfolio'] = (lambda: fetch_portfolio(user_obj), None)
+    if any(k in lowered for k in ['price', 'find', 'search', 'cost', 'buy']):
+        sources['products'] = (lambda: search_products_via_vector_search(message), [])
+    perf_keywords = ['best seller', 'worst performer', 'best perform', 'worst perform', 'top livestock', 'bottom livestock', 'livestock performance']
+    livestock_perf_req = any(k in lowered for k in perf_keywords)
+    if livestock_perf_req:
+        sources['livestock_performance'] = (lambda: get_livestock_performance_data(message), ([], []))
+    if session_id and session_state is None:
+        sources['history'] = (lambda: mongo_manager.get_chat_history(session_id, limit=KEEP_RECENT_MESSAGES), [])
+        sources['summary'] = (lambda: mongo_manager.get_session_summary(session_id), '')
+        sources['kv_context'] = (
+            lambda: mongo_manager.get_kv_context(session_id, ollama_client.context_fingerprint()), None)
+
+    retrieval_started = time.perf_counter()
+    results, retrieval_timings = retrieve(sources)
+    stage_ms = {'retrieval': int((time.perf_counter() - retrieval_started) * 1000)} if sources else {}
+    portfolio_data = results.get('portfolio')
+    retrieved_products = results.get('products', [])
+    best_livestock, worst_livestock = results.get('livestock_performance', ([], []))
+    session_state = session_state or results
+    history = session_state.get('history') or []
+    summary = session_state.get('summary') or ''
+    kv_context = session_state.get('kv_context')
+    print(f"DEBUG: Vector search found {len(retrieved_products)} products, "
+          f"{len(history)} lines of history")
+    
+    # Build Dynamic Context
+    # 1. User Intent (High-level guide)
+    intent_lines = [f"The user appears to be asking about: {intent}"] if intent != 'general' else []
+    
+    # 2. Conversation History (Active Thread); stored answers carry HTML tables the model doesn't need
+    history_lines = [strip_tables(line) for line in history]
+
+    # 3. Technical Knowledge (Portfolio & Products)
+    tech_context = []
+    if portfolio_data:
+        holdings = ", ".join([f"{i['product_name']} ({i['quantity']})" for i in portfolio_data[:5]])
+        tech_context.append(f"User Portfolio: {holdings}")
+    elif user_authenticated and any(k in message.lower() for k in ['portfolio', 'investment']):
+        tech_context.append("User Portfolio: The user currently has no active investments. Inform them that their portfolio is empty.")
+    
+    if retrieved_products:
+        tech_context.append(format_retrieved_context(retrieved_products))
+        
+    if livestock_perf_req:
+        perf_context = "--- LIVESTOCK PERFORMANCE (PROFIT/LOSS) ---\n"
+        if best_livestock:
+            perf_context += "Top 5 Performers / Best Sellers:\n" + "\n".join([f"- {i.get('name') or i.get('breed')} (Type: {i.get('type')}): Net Profit NRS {i.get('profit', 0):.2f}" for i in best_livestock]) + "\n\n"
+        if worst_livestock:
+            perf_context += "Bottom 5 Performers / Worst Performers:\n" + "\n".join([f"- {i.get('name') or i.get('breed')} (Type: {i.get('type')}): Net Profit NRS {i.get('profit', 0):.2f}" for i in worst_livestock]) + "\n"
+        perf_context += "--- END ---\nUse the performance data above to answer the user's question about livestock performance, best sellers, or worst performers."
+        tech_context.append(perf_context)
+        
+    if kv_context:
+        print(f"DEBUG: Reusing Ollama KV context ({len(kv_context)} tokens); history left out of the prompt")
+        summary, history_lines = '', []
+
+    # Priority: intent, then this turn's data, then recent history, then the older-turn summary
+    context, context_stats = build_context([
+        Section("### USER INTENT", intent_lines, 0, False),
+        Section("### EARLIER CONVERSATION (SUMMARY)", summary.split("\n") if summary else [], 3, True),
+        Section("### RECENT CONVERSATION HISTORY", history_lines, 2, True),
+        Section("### SUPPLEMENTARY DATA", "\n".join(tech_context).split("\n") if tech_context else [], 1, False),
+    ])
+    print(f"DEBUG: Context ~{context_stats['used']}/{context_stats['budget']} tokens, "
+          f"truncated={context_stats['truncated']}, dropped={context_stats['dropped']}")
+        
+    personalized = bool(portfolio_data) or (
+        user_authenticated and any(k in message.lower() for k in ['portfolio', 'investment'])
+    )
+    return {
+        'message': message,
+        'session_id': session_id,
+        'sentiment': sentiment,
+        'intent': intent,
+        'user_obj': user_obj,
+        'user_authenticated': user_authenticated,
+        'portfolio_data': portfolio_data,
+        'retrieved_products': retrieved_products,
+        'livestock_perf_req': livestock_perf_req,
+        'best_livestock': best_livestock,
+        'worst_livestock': worst_livestock,
+        'personalized': personalized,
+        'has_history': bool(history or kv_context),
+        'kv_context': kv_context,
+        'retrieval_timings': retrieval_timings,
+        'stage_ms': stage_ms,
+        'context_stats': context_stats,
+        'context': context,
+    }
+
+
+def append_table(turn, response_text):
+    """Post-process (Tables): append the |||TABLE||| payload for the turn, if any."""
+    message = turn['message']
+    final_output = response_text
+    if 'portfolio' in message.lower() and turn['portfolio_data']:
+        final_output += "\n\n|||TABLE|||" + generate_portfolio_html_table(turn['portfolio_data'])
+    elif turn['livestock_perf_req']:
+        if 'worst' in message.lower() or 'bottom' in message.lower():
+            final_output += "\n\n|||TABLE|||" + generate_livestock_performance_html_table(turn['worst_livestock'], "Worst Performing Livestock")
+        else:
+            final_output += "\n\n|||TABLE|||" + generate_livestock_performance_html_table(turn['best_livestock'], "Top Performing Livestock")
+    elif turn['retrieved_products'] and any(k in message.lower() for k in ['price', 'find']):
+        final_output += "\n\n|||TABLE|||" + generate_products_html_table(turn['retrieved_products'])
+    return final_output
+
+
+def fast_path_answer(turn):
+    """(text, metrics) for a structured lookup answered from a template, else (None, None)."""
+    route, text = fast_path_router.route(turn)
+    if route is None:
+        return None, None
+    return text, {'model': FAST_PATH_MODEL, 'fast_path': route}
+
+
+def cached_answer(turn):
+    """
+    (embedding, cached_text) for a cacheable turn; cached_text is None on a miss.
+    Returns (None, None) for personalised turns, which never touch the cache.
+    """
+    if not is_cacheable(turn):
+        return None, None
+    embedding_started = time.perf_counter()
+    embedding = get_query_embedding(turn['message'])
+    turn['stage_ms']['embedding'] = int((time.perf_counter() - embedding_started) * 1000)
+    if not embedding:
+        return None, None
+    cached_text = response_cache.lookup(embedding, turn['intent'], ollama_client.model_name)
+    print(f"DEBUG: Response cache {'HIT' if cached_text is not None else 'miss'} (intent={turn['intent']})")
+    return embedding, cached_text
+
+
+def cache_answer(turn, embedding, response_text, metrics):
+    # Never cache the canned reply served while the Ollama circuit is open
+    if embedding and not metrics.get('circuit_open'):
+        response_cache.store(embedding, turn['intent'], ollama_client.model_name, turn['message'], response_text)
+
+
+def persist_turn(turn, final_output, metrics, wall_clock_ms, time_to_first_token_ms, cached=False,
+                 kv_context=None):
+    """
+    Save History to Enterprise Collections; returns the (possibly new) session id.
+    The turn's Ollama KV context replaces the session's stored one (None clears it).
+    """
+    session_id = turn['session_id']
+    user_obj = turn['user_obj']
+    user_id_to_save = user_obj.id if (user_obj and turn['user_authenticated']) else "anonymous"
+        
+    print(f"DEBUG: Saving message. UserID: {user_id_to_save}, SessionID: {session_id}")
+    
+    if turn['kv_context'] and not cached and not metrics.get('fast_path'):
+        metrics = {**metrics, 'kv_context_tokens': len(turn['kv_context'])}
+    try:
+        new_session_id = mongo_manager.save_chat_message(
+            user_id_to_save, 
+            turn['message'], 
+            final_output, 
+            metrics=metrics,
+            session_id=session_id,
+            sentiment=turn['sentiment'],
+            intent=turn['intent'],
+            wall_clock_ms=wall_clock_ms,
+            time_to_first_token_ms=time_to_first_token_ms,
+            cached=cached,
+            retrieval_timings=turn['retrieval_timings'],
+            stage_ms=turn['stage_ms'],
+        )
+        print(f"DEBUG: Message saved. New SessionID: {new_session_id}")
+        mongo_manager.save_kv_context(new_session_id, ollama_client.context_fingerprint(), kv_context)
+        return new_session_id
+    except Exception as e:
+        print(f"DEBUG: Error in save_chat_message: {e}")
+        return session_id
+
+
+def _sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, default=str)}\n\n"
+
+
+def stream_turn(turn, request_start_time):
+    """
+    Server-sent events for one turn: a 'token' event per Ollama chunk, then a
+    'done' event with the final text (table appended), session id and metrics.
+    The table and the Mongo write happen only after the model stream closes.
+    """
+    time_to_first_token_ms = None
+    completed = False
+    fast_text, fast_metrics = fast_path_answer(turn)
+    cache_embedding, cached_text = cached_answer(turn) if fast_text is None else (None, None)
+    if fast_text is not None:
+        events = iter([('token', fast_text), ('done', {'text': fast_text, 'metrics': fast_metrics})])
+    elif cached_text is not None:
+        # Cached answer: one token event carrying the whole text
+        events = iter([('token', cached_text), ('done', {'text': cached_text, 'metrics': {'model': ollama_client.model_name}})])
+    else:
+        events = ollama_client.stream_response(turn['message'], turn['context'], kv_context=turn['kv_context'])
+    try:
+        for kind, payload in events:
+            if kind == 'token':
+                if time_to_first_token_ms is None:
+                    time_to_first_token_ms = int((time.time() - request_start_time) * 1000)
+                    print(f"[API] Time to first token: {time_to_first_token_ms}ms")
+                yield _sse('token', {'text': payload})
+            elif kind == 'error':
+                mongo_manager.log_error_metric(turn['session_id'] or 'unknown', 'OllamaStreamError', payload,
+                                               user_message=turn['message'])
+                yield _sse('error', {'response': "Sorry, I couldn't generate a response."})
+                return
+            else:
+                completed = True
+                metrics = payload.get('metrics', {})
+                if cached_text is None:
+                    cache_answer(turn, cache_embedding, payload.get('text', ''), metrics)
+                final_output = append_table(turn, payload.get('text', ''))
+                wall_clock_ms = int((time.time() - request_start_time) * 1000)
+                print(f"[API] Wall-clock latency: {wall_clock_ms}ms")
+                new_session_id = persist_turn(turn, final_output, metrics, wall_clock_ms,
+                                              time_to_first_token_ms or wall_clock_ms,
+                                              cached=cached_text is not None,
+                                              kv_context=payload.get('kv_context'))
+                yield _sse('done', {
+                    'response': final_output,
+                    'success': True,
+                    'cached': cached_text is not None,
+                    'session_id': new_session_id,
+                    'metrics': {
+                        **metrics,
+                        'wall_clock_ms': wall_clock_ms,
+                        'time_to_first_token_ms': time_to_first_token_ms,
+                    } if settings.DEBUG else None,
+                })
+    finally:
+        if not completed:
+            # Client went away (or the model failed) mid-answer; nothing is persisted
+            print(f"[API] Stream closed before completion for session {turn['session_id']}")
+
+
 @api_view(['POST'])
 @authentication_classes([SimpleTokenAuthentication, SessionAuthentication])
 @permission_classes([AllowAny]) # Allow anonymous but save if auth
 def chatbot_api(request):
+    """
+    One chat turn. Pass "stream": true (or send Accept: text/event-stream) to get
+    the answer as server-sent events while the model is still generating.
+    """
     print("\n" + "="*50)
     print(f"🚨 CHATBOT API CALLED: {request.method} {request.path}")
     print(f"🚨 Request Content-Type: {request.headers.get('Content-Type')}")
@@ -221,173 +529,57 @@ def chatbot_api(request):
         print(f"[API] Session ID from Frontend: '{session_id}'")
         
         if not message: return JsonResponse({'response': 'Please type a message.'})
-        
-        # Detect sentiment and intent
-        print("DEBUG: Detecting sentiment/intent...")
-        sentiment, intent = detect_sentiment_and_intent(message)
-        print(f"DEBUG: sentiment={sentiment}, intent={intent}")
-        
-        # Basic context initialization
-        context = ""
-        portfolio_data = None
-        retrieved_products = []
-        
-        # Capture necessary data
-        print("DEBUG: Checking request.user...")
-        user_authenticated = request.user.is_authenticated
-        user_obj = request.user if user_authenticated else None
-        print(f"DEBUG: user_authenticated={user_authenticated}, user={user_obj}")
-        
-        # Synchronous Retrieval (safer on Python 3.13 with limited patching)
-        if user_authenticated:
-            try:
-                mid = get_mongo_user_id(user_obj)
-                if mid: 
-                    print(f"DEBUG: Found Mongo User ID: {mid}")
-                    portfolio_data = calculate_profit_loss(mid, mongo_manager)
-                    
-                    # [MOCK ADMIN DATA]
-                    if not portfolio_data and user_obj.username == 'admin':
-                        portfolio_data = [
-                            {
-                                'product_name': 'Boer Goat (Investomart Demo)',
-                                'quantity': 2,
-                                'total_investment': 15000.0,
-                                'current_value': 18500.0,
-                                'profit_loss': 3500.0,
-                                'percentage_change': 23.33
-                            },
-                            {
-                                'product_name': 'Kadaknath Chicken (Investomart Demo)',
-                                'quantity': 10,
-                                'total_investment': 5000.0,
-                                'current_value': 4800.0,
-                                'profit_loss': -200.0,
-                                'percentage_change': -4.0
-                            }
-                        ]
-            except Exception as e:
-                print(f"DEBUG: Portfolio fetch error: {e}")
 
-        try:
-            keywords = ['price', 'find', 'search', 'cost', 'buy']
-            if any(k in message.lower() for k in keywords):
-                retrieved_products = search_products_via_vector_search(message)
-                print(f"DEBUG: Vector search found {len(retrieved_products)} products")
-        except Exception as e:
-            print(f"DEBUG: Vector search error: {e}")
-            
-        best_livestock = []
-        worst_livestock = []
-        livestock_perf_req = False
-        perf_keywords = ['best seller', 'worst performer', 'best perform', 'worst perform', 'top livestock', 'bottom livestock', 'livestock performance']
-        if any(k in message.lower() for k in perf_keywords):
-            livestock_perf_req = True
-            best_livestock, worst_livestock = get_livestock_performance_data()
-            print(f"DEBUG: Retrieved best ({len(best_livestock)}) and worst ({len(worst_livestock)}) performing livestock")
-        
-        # Build Dynamic Context
-        context_parts = []
-        
-        # 1. User Intent (High-level guide)
-        if intent != 'general':
-            context_parts.append(f"### USER INTENT\nThe user appears to be asking about: {intent}")
-        
-        # 2. Conversation History (Active Thread)
-        history = []
-        if session_id:
-            try:
-                print(f"DEBUG: Calling mongo_manager.get_chat_history for '{session_id}'...")
-                history = mongo_manager.get_chat_history(session_id, limit=6)
-                print(f"DEBUG: Retrieved {len(history)} lines of history.")
-            except Exception as e:
-                print(f"DEBUG: CRITICAL History fetch error: {e}")
-
-        if history:
-            context_parts.append("### RECENT CONVERSATION HISTORY\n" + "\n".join(history))
-
-        # 3. Technical Knowledge (Portfolio & Products)
-        tech_context = []
-        if portfolio_data:
-            summary = ", ".join([f"{i['product_name']} ({i['quantity']})" for i in portfolio_data[:5]])
-            tech_context.append(f"User Portfolio: {summary}")
-        elif user_authenticated and any(k in message.lower() for k in ['portfolio', 'investment']):
-            tech_context.append("User Portfolio: The user currently has no active investments. Inform them that their portfolio is empty.")
-        
-        if retrieved_products:
-            tech_context.append(format_retrieved_context(retrieved_products))
-            
-        if livestock_perf_req:
-            perf_context = "--- LIVESTOCK PERFORMANCE (PROFIT/LOSS) ---\n"
-            if best_livestock:
-                perf_context += "Top 5 Performers / Best Sellers:\n" + "\n".join([f"- {i.get('name') or i.get('breed')} (Type: {i.get('type')}): Net Profit NRS {i.get('profit', 0):.2f}" for i in best_livestock]) + "\n\n"
-            if worst_livestock:
-                perf_context += "Bottom 5 Performers / Worst Performers:\n" + "\n".join([f"- {i.get('name') or i.get('breed')} (Type: {i.get('type')}): Net Profit NRS {i.get('profit', 0):.2f}" for i in worst_livestock]) + "\n"
-            perf_context += "--- END ---\nUse the performance data above to answer the user's question about livestock performance, best sellers, or worst performers."
-            tech_context.append(perf_context)
-            
-        if tech_context:
-            context_parts.append("### SUPPLEMENTARY DATA\n" + "\n".join(tech_context))
+        turn = prepare_turn(request, message, session_id)
+
+        if wants_stream(request, data):
+            response = StreamingHttpResponse(stream_turn(turn, request_start_time), content_type='text/event-stream')
+            response['Cache-Control'] = 'no-cache'
+            # Stop nginx-style proxies from buffering the whole stream
+            response['X-Accel-Buffering'] = 'no'
+            return response
             
-        # Combine all context
-        context = "\n\n".join(context_parts)
+        # Structured lookups are answered from a template, then the response cache, then Ollama
+        fast_text, fast_metrics = fast_path_answer(turn)
+        cache_embedding, cached_text = cached_answer(turn) if fast_text is None else (None, None)
+        kv_context = None
+        if fast_text is not None:
+            response_text, metrics = fast_text, fast_metrics
+        elif cached_text is not None:
+            response_text = cached_text
+            metrics = {'model': ollama_client.model_name}
+        else:
+            # Call Ollama with metrics capture
+            print(f"DEBUG: Querying Ollama with structured context...")
+            ollama_response = ollama_client.generate_response(message, turn['context'], kv_context=turn['kv_context'])
             
-        # Call Ollama with metrics capture
-        print(f"DEBUG: Querying Ollama with structured context...")
-        ollama_response = ollama_client.generate_response(message, context)
-        
-        if not ollama_response:
-            return JsonResponse({'response': "Sorry, I couldn't generate a response."}, status=200)
+            if not ollama_response:
+                return JsonResponse({'response': "Sorry, I couldn't generate a response."}, status=200)
 
-        response_text = ollama_response.get('text', '')
-        metrics = ollama_response.get('metrics', {})
-        
-        # Post-process (Tables)
-        final_output = response_text
+            response_text = ollama_response.get('text', '')
+            metrics = ollama_response.get('metrics', {})
+            kv_context = ollama_response.get('kv_context')
+            cache_answer(turn, cache_embedding, response_text, metrics)
         
-        # Append Table based on logic
-        if 'portfolio' in message.lower() and portfolio_data:
-            final_output += "\n\n|||TABLE|||" + generate_portfolio_html_table(portfolio_data)
-        elif livestock_perf_req:
-            if 'worst' in message.lower() or 'bottom' in message.lower():
-                final_output += "\n\n|||TABLE|||" + generate_livestock_performance_html_table(worst_livestock, "Worst Performing Livestock")
-            else:
-                final_output += "\n\n|||TABLE|||" + generate_livestock_performance_html_table(best_livestock, "Top Performing Livestock")
-        elif retrieved_products and any(k in message.lower() for k in ['price', 'find']):
-            final_output += "\n\n|||TABLE|||" + generate_products_html_table(retrieved_products)
+        final_output = append_table(turn, response_text)
             
         # ── Wall-clock latency ────────────────────────────────────────────
         wall_clock_ms = int((time.time() - request_start_time) * 1000)
         print(f"[API] Wall-clock latency: {wall_clock_ms}ms")
 
-        # Save History to Enterprise Collections
-        new_session_id = session_id
-        user_id_to_save = user_obj.id if (user_obj and user_authenticated) else "anonymous"
-            
-        print(f"DEBUG: Saving message. UserID: {user_id_to_save}, SessionID: {session_id}")
-        
-        try:
-            new_session_id = mongo_manager.save_chat_message(
-                user_id_to_save, 
-                message, 
-                final_output, 
-                metrics=metrics,
-                session_id=session_id,
-                sentiment=sentiment,
-                intent=intent,
-                wall_clock_ms=wall_clock_ms,
-            )
-            print(f"DEBUG: Message saved. New SessionID: {new_session_id}")
-        except Exception as e:
-            print(f"DEBUG: Error in save_chat_message: {e}")
+        # Without streaming there is no first token to time: TTFT stays unset
+        new_session_id = persist_turn(turn, final_output, metrics, wall_clock_ms, None,
+                                      cached=cached_text is not None, kv_context=kv_context)
             
         return JsonResponse({
             'response': final_output, 
             'success': True,
+            'cached': cached_text is not None,
             'session_id': new_session_id,
             'metrics': {
                 **metrics,
                 'wall_clock_ms': wall_clock_ms,
+                'time_to_first_token_ms': None,
             } if settings.DEBUG else None
         })
 
@@ -410,6 +602,7 @@ def chatbot_api(request):
                 f.write(f"\n--- {datetime.now()} ---\n{error_msg}\n")
         except:
             pass
+        return JsonResponse({'response': "Sorry, something went wrong.", 'success': False}, status=500)
 
 @api_view(['GET'])
 @authentication_classes([SimpleTokenAuthentication, SessionAuthentication])
@@ -476,6 +669,13 @@ def chatbot_metrics_summary(request):
     try:
         days = min(int(request.GET.get('days', 30)), 365)
         summary = mongo_manager.get_metrics_summary(days=days)
+        # In-process counters for this worker only
+        summary['embedding_cache'] = embedding_cache.stats()
+        summary['vector_index'] = product_vector_index.stats()
+        summary['response_cache'] = response_cache.stats()
+        summary['ollama_http'] = ollama_http.stats()
+        summary['fast_path'] = fast_path_router.stats()
+        summary['turn_writer'] = mongo_manager.writer.stats()
         return JsonResponse({'success': True, 'metrics': summary})
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
@@ -0,0 +1,104 @@
+"""
+Shared MongoDB field projections, one per endpoint / use case.
+
+Product documents carry a full float ``embedding`` vector (see
+embed_products.py), so an unprojected ``find()`` ships kilobytes of data per
+hit that no endpoint ever reads. Every read in searchapp, payments and
+data.views picks its projection from this registry by name.
+"""
+
+_LISTING_SORT_FIELDS = {'created_at': 1, 'views': 1}
+
+PROJECTIONS = {
+    # ── searchapp ─────────────────────────────────────────────────────────
+    'search.product_hit': {
+        '_id': 1, 'product_id': 1, 'title': 1, 'name': 1, 'description': 1,
+        'current_price': 1, 'base_price': 1, 'quantity': 1, 'image_url': 1, 'category': 1,
+    },
+    'search.livestock_hit': {
+        '_id': 1, 'animal_id': 1, 'name': 1, 'breed': 1, 'type': 1, 'age_months': 1,
+        'current_value': 1, 'purchase_price': 1,
+    },
+    'explore.product_card': {
+        '_id': 1, 'product_id': 1, 'title': 1, 'name': 1, 'description': 1,
+        'current_price': 1, 'base_price': 1, 'quantity': 1, 'image_url': 1, 'category': 1,
+        **_LISTING_SORT_FIELDS,
+    },
+    'explore.livestock_card': {
+        '_id': 1, 'animal_id': 1, 'name': 1, 'breed': 1, 'type': 1, 'age_months': 1,
+        'current_weight': 1, 'health_status': 1, 'current_value': 1, 'purchase_price': 1,
+        **_LISTING_SORT_FIELDS,
+    },
+    'detail.product': {
+        '_id': 1, 'product_id': 1, 'title': 1, 'name': 1, 'description': 1,
+        'current_price': 1, 'base_price': 1, 'quantity': 1, 'image_url': 1, 'category': 1,
+        'status': 1, 'location': 1, 'tags': 1, 'roi_estimate': 1, 'risk_level': 1,
+        'seller_id': 1, 'created_at': 1, 'updated_at': 1, 'version': 1, 'farm_id': 1, 'animal_id': 1,
+    },
+    'detail.related_animal': {
+        '_id': 0, 'breed': 1, 'age_months': 1, 'current_weight': 1, 'health_status': 1, 'gender': 1,
+    },
+    'detail.livestock': {
+        '_id': 1, 'animal_id': 1, 'name': 1, 'breed': 1, 'type': 1, 'status': 1, 'location': 1,
+        'age_months': 1, 'current_weight': 1, 'health_status': 1, 'gender': 1, 'tag_number': 1,
+        'farm_id': 1, 'owner_id': 1, 'purchase_date': 1, 'current_value': 1, 'purchase_price': 1,
+        'created_at': 1, 'updated_at': 1, 'version': 1,
+    },
+    'batch.product': {
+        '_id': 1, 'product_id': 1, 'title': 1, 'name': 1, 'current_price': 1, 'base_price': 1,
+        'quantity': 1, 'image_url': 1, 'category': 1, 'status': 1,
+    },
+    'batch.livestock': {
+        '_id': 1, 'animal_id': 1, 'name': 1, 'breed': 1, 'type': 1,
+        'current_value': 1, 'purchase_price': 1, 'status': 1,
+    },
+    'index.product': {'_id': 1, 'product_id': 1, 'title': 1, 'name': 1, 'category': 1, 'status': 1},
+    'index.livestock': {'_id': 1, 'animal_id': 1, 'name': 1, 'breed': 1, 'type': 1, 'status': 1},
+
+    # ── payments ──────────────────────────────────────────────────────────
+    'payments.product': {
+        '_id': 1, 'product_id': 1, 'status': 1, 'quantity': 1,
+        'seller_id': 1, 'seller': 1, 'title': 1, 'name': 1,
+    },
+    'payments.livestock': {
+        '_id': 1, 'animal_id': 1, 'status': 1,
+        'owner_id': 1, 'seller_id': 1, 'seller': 1, 'name': 1, 'breed': 1,
+    },
+
+    # ── data.views ────────────────────────────────────────────────────────
+    'analytics.transaction': {
+        '_id': 0, 'total_amount': 1, 'payment_date': 1,
+        'items.item_type': 1, 'items.item_id': 1, 'items.quantity': 1,
+    },
+    'analytics.product_title': {'_id': 0, 'title': 1, 'name': 1},
+    'analytics.popular_livestock': {
+        '_id': 1, 'animal_id': 1, 'name': 1, 'breed': 1, 'type': 1, 'views': 1,
+    },
+    'notifications.list': {
+        '_id': 1, 'message': 1, 'type': 1, 'is_read': 1, 'created_at': 1,
+        'related_item_id': 1, 'transaction_id': 1,
+    },
+    'profile.livestock': {'_id': 0, 'current_value': 1, 'purchase_price': 1, 'type': 1},
+    'profile.transaction': {
+        '_id': 1, 'seller_id': 1, 'items': 1, 'payment_date': 1, 'total_amount': 1, 'status': 1,
+    },
+    'approvals.pending_product': {
+        '_id': 1, 'product_id': 1, 'title': 1, 'category': 1, 'current_price': 1,
+        'currency': 1, 'seller_id': 1, 'created_at': 1,
+    },
+}
+
+
+def projection(name, **extra):
+    """
+    Return a fresh copy of the named projection, optionally extended
+    (e.g. ``projection('search.product_hit', score={'$meta': 'textScore'})``).
+    """
+    fields = dict(PROJECTIONS[name])
+    fields.update(extra)
+    return fields
+
+
+def project_stage(name):
+    """The named projection as an aggregation ``$project`` stage."""
+    return {'$project': projection(name)}
@@ -28,6 +28,8 @@ from collections import defaultdict
 import uuid
 from django.core.mail import send_mail
 from django.conf import settings
+from searchapp import listing_index
+from .projections import projection
 
 # Initialize logger
 logger = logging.getLogger(__name__)
@@ -719,7 +721,7 @@ def platform_analytics_summary(request):
         recent_txs = list(db.transactions.find({
             "status": "completed",
             "payment_date": {"$gte": thirty_days_ago}
-        }))
+        }, projection('analytics.transaction')))
         
         total_revenue = sum(float(tx.get('total_amount', 0)) for tx in recent_txs)
         total_orders = len(recent_txs)
@@ -753,7 +755,9 @@ def platform_analytics_summary(request):
         sorted_products = sorted(product_sales_freq.items(), key=lambda x: x[1], reverse=True)[:5]
         
         for p_id, count in sorted_products:
-            prod = db.products.find_one({"$or": [{"product_id": p_id}, {"_id": p_id}]})
+            prod = db.products.find_one(
+                {"$or": [{"product_id": p_id}, {"_id": p_id}]}, projection('analytics.product_title')
+            )
             title = prod.get('title') or prod.get('name') or "Unknown Product" if prod else "Unknown Product"
             top_selling_commodities.append({
                 "id": str(p_id),
@@ -763,7 +767,9 @@ def platform_analytics_summary(request):
             
         # 4. Most Popular Livestock (by views)
         popular_livestock = []
-        popular_cursor = db.livestock.find({"status": "active"}).sort("views", -1).limit(5)
+        popular_cursor = db.livestock.find(
+            {"status": "active"}, projection('analytics.popular_livestock')
+        ).sort("views", -1).limit(5)
         
         for l in popular_cursor:
             title = f"{l.get('name') or l.get('breed', 'Unknown')} ({l.get('type', '').capitalize()})"
@@ -799,7 +805,9 @@ def get_user_notifications(request):
         user_id = str(getattr(request.user, 'user_id', request.user.id))
         
         # Fetch notifications sorted by newest first
-        cursor = db.notifications.find({"user_id": user_id}).sort("created_at", -1).limit(50)
+        cursor = db.notifications.find(
+            {"user_id": user_id}, projection('notifications.list')
+        ).sort("created_at", -1).limit(50)
         
         notifications = []
         for notif in cursor:
@@ -913,7 +921,7 @@ def user_profile_summary(request):
         active_livestock = list(db.livestock.find({
             "owner": user.username,
             "status": "active"
-        }))
+        }, projection('profile.livestock')))
         
         portfolio_value = 0
         holdings_map = {}
@@ -949,7 +957,7 @@ def user_profile_summary(request):
                 {"buyer_id": user_id_str},
                 {"seller_id": user_id_str}
             ]
-        }).sort("payment_date", -1).limit(50)) # Get latest 50
+        }, projection('profile.transaction')).sort("payment_date", -1).limit(50)) # Get latest 50
         
         transactions = []
         for idx, tx in enumerate(raw_transactions):
@@ -1044,7 +1052,9 @@ def get_pending_approvals(request):
         } for u in pending_kyc_users]
         
         # 2. Pending Products (PyMongo)
-        raw_products = list(db.products.find({"status": "pending"}).sort("created_at", -1))
+        raw_products = list(
+            db.products.find({"status": "pending"}, projection('approvals.pending_product')).sort("created_at", -1)
+        )
         product_approvals = [{
             'id': p.get('product_id', str(p.get('_id'))),
             'type': 'product',
@@ -1093,8 +1103,9 @@ def process_approval_action(request):
             new_status = 'active' if action == 'approve' else 'rejected'
             db.products.update_one(
                 {"product_id": item_id},
-                {"$set": {"status": new_status, "updated_at": datetime.now()}}
+                {"$set": {"status": new_status, "updated_at": datetime.utcnow()}, "$inc": {"version": 1}}
             )
+            listing_index.listing_changed('product', item_id)
             
             # Optional: if it rejected, we might want to notify the seller
             # We already have a Notification model logic we could trigger here
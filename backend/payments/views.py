@@ -6,6 +6,9 @@ import os
 import uuid
 from datetime import datetime
 from dotenv import load_dotenv
+from searchapp import listing_index
+from chatbot import leaderboard
+from data.projections import projection
 
 load_dotenv()
 
@@ -50,14 +53,18 @@ def process_payment(request):
             qty = int(item.get('quantity', 1))
             
             if item_type == 'product':
-                product = db.products.find_one({"$or": [{"product_id": item_id}, {"_id": item_id}]})
+                product = db.products.find_one(
+                    {"$or": [{"product_id": item_id}, {"_id": item_id}]}, projection('payments.product')
+                )
                 if not product or product.get('status') == 'sold':
                     return Response({'error': f"Product {item_id} is unavailable."}, status=400)
                 available = int(product.get('quantity', 1))
                 if qty > available:
                     return Response({'error': f"Only {available} items available for Product {item_id}."}, status=400)
             elif item_type == 'livestock':
-                animal = db.livestock.find_one({"$or": [{"animal_id": item_id}, {"_id": item_id}]})
+                animal = db.livestock.find_one(
+                    {"$or": [{"animal_id": item_id}, {"_id": item_id}]}, projection('payments.livestock')
+                )
                 if not animal or animal.get('status') != 'active':
                     return Response({'error': f"Livestock {item_id} is unavailable."}, status=400)
                 if qty > 1:
@@ -93,29 +100,40 @@ def process_payment(request):
             item_name = "Item"
             
             if item_type == 'product':
-                product = db.products.find_one({"$or": [{"product_id": item_id}, {"_id": item_id}]})
+                product = db.products.find_one(
+                    {"$or": [{"product_id": item_id}, {"_id": item_id}]}, projection('payments.product')
+                )
                 if product:
                     seller_id = product.get('seller_id') or product.get('seller')
                     item_name = product.get('title') or product.get('name') or "Product"
                 
+                # updated_at/version feed the detail endpoint's ETag
                 db.products.update_one(
                     {"$or": [{"product_id": item_id}, {"_id": item_id}]},
-                    {"$inc": {"quantity": -qty}}
+                    {"$inc": {"quantity": -qty, "version": 1}, "$set": {"updated_at": datetime.utcnow()}}
                 )
                 db.products.update_one(
                     {"$or": [{"product_id": item_id}, {"_id": item_id}], "quantity": {"$lte": 0}},
-                    {"$set": {"status": "sold"}}
+                    {"$set": {"status": "sold", "updated_at": datetime.utcnow()}, "$inc": {"version": 1}}
                 )
             elif item_type == 'livestock':
-                animal = db.livestock.find_one({"$or": [{"animal_id": item_id}, {"_id": item_id}]})
+                animal = db.livestock.find_one(
+                    {"$or": [{"animal_id": item_id}, {"_id": item_id}]}, projection('payments.livestock')
+                )
                 if animal:
                     seller_id = animal.get('owner_id') or animal.get('seller_id') or animal.get('seller')
                     item_name = animal.get('name') or animal.get('breed') or "Livestock"
                 
                 db.livestock.update_one(
                     {"$or": [{"animal_id": item_id}, {"_id": item_id}]},
-                    {"$set": {"status": "sold"}}
+                    {"$set": {"status": "sold", "updated_at": datetime.utcnow()}, "$inc": {"version": 1}}
                 )
+                if animal:
+                    # The leaderboard shows each animal's status
+                    leaderboard.animal_changed(db, animal['_id'])
+
+            # Keep autocomplete/search indexes in step with sold-out stock
+            listing_index.listing_changed(item_type, item_id)
 
             # Notify seller
             buyer_uid = str(getattr(request.user, 'user_id', request.user.id))
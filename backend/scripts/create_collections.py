@@ -4,7 +4,7 @@ Creates all enterprise-level collections in the goatfarm database
 """
 
 import os
-from pymongo import MongoClient, IndexModel, ASCENDING, DESCENDING
+from pymongo import MongoClient, IndexModel, ASCENDING, DESCENDING, TEXT
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -33,6 +33,12 @@ def create_collections_and_indexes():
                 IndexModel([('owner_id', ASCENDING)]),
                 IndexModel([('type', ASCENDING), ('status', ASCENDING)]),
                 IndexModel([('tag_number', ASCENDING)], unique=True),
+                IndexModel(
+                    [('breed', TEXT), ('name', TEXT), ('type', TEXT)],
+                    weights={'breed': 10, 'name': 8, 'type': 5},
+                    name='livestock_text_idx',
+                    language_override='text_language',
+                ),
             ],
             'health_records': [
                 IndexModel([('record_id', ASCENDING)], unique=True),
@@ -45,6 +51,12 @@ def create_collections_and_indexes():
                 IndexModel([('category', ASCENDING), ('status', ASCENDING)]),
                 IndexModel([('seller_id', ASCENDING)]),
                 IndexModel([('featured', DESCENDING), ('created_at', DESCENDING)]),
+                IndexModel(
+                    [('title', TEXT), ('name', TEXT), ('category', TEXT), ('description', TEXT)],
+                    weights={'title': 10, 'name': 8, 'category': 5, 'description': 1},
+                    name='products_text_idx',
+                    language_override='text_language',
+                ),
             ],
             'transactions': [
                 IndexModel([('transaction_id', ASCENDING)], unique=True),
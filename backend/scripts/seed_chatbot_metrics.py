@@ -19,7 +19,7 @@ from chatbot.mongo_manager import mongo_manager
 mongo_manager.connect()
 db = mongo_manager.db
 
-if not db:
+if db is None:
     print("❌ Failed to connect to MongoDB!")
     sys.exit(1)
 
@@ -1,5 +1,6 @@
 import os
 import requests
+from datetime import datetime
 from pymongo import MongoClient
 import cloudinary
 import cloudinary.uploader
@@ -67,7 +68,7 @@ if cloudinary_urls:
         # Update all Nepal products of this category that don't already have an image
         result = db.products.update_many(
             {"category": category},
-            {"$set": {"image_url": url, "images": [url]}}
+            {"$set": {"image_url": url, "images": [url], "updated_at": datetime.utcnow()}, "$inc": {"version": 1}}
         )
         print(f"   ✅ Linked {category} image to {result.modified_count} products")
 else:
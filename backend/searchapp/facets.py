@@ -0,0 +1,97 @@
+"""
+Facet counts for the search and explore endpoints.
+
+Each collection is queried once with a ``$facet`` stage that returns the first
+page of hits together with counts per category, risk level, location and
+price bucket, so the filter sidebar costs a single aggregation per collection
+instead of one request per filter value.
+"""
+
+# Price bucket edges in NPR; the last bucket is open-ended
+PRICE_BOUNDARIES = [0, 1000, 5000, 10000, 25000, 50000, 100000, 500000]
+MAX_FACET_VALUES = 20
+
+
+def _count_by(field):
+    return [
+        {'$group': {'_id': f'${field}', 'count': {'$sum': 1}}},
+        {'$sort': {'count': -1}},
+        {'$limit': MAX_FACET_VALUES},
+    ]
+
+
+def price_expr(price_fields):
+    """
+    First non-null of ``price_fields``, so ('current_price', 'base_price')
+    mirrors the price shown on the cards.
+    """
+    expr = f'${price_fields[-1]}'
+    for field in reversed(price_fields[:-1]):
+        expr = {'$ifNull': [f'${field}', expr]}
+    return expr
+
+
+def facet_stage(hits_pipeline, category_field, price_fields):
+    """Build the ``$facet`` stage over the documents reaching it."""
+    return {'$facet': {
+        'hits': hits_pipeline,
+        'category': _count_by(category_field),
+        'risk_level': _count_by('risk_level'),
+        'location': _count_by('location'),
+        'price': [
+            {'$bucket': {
+                'groupBy': {'$convert': {'input': price_expr(price_fields), 'to': 'double', 'onError': None, 'onNull': None}},
+                'boundaries': PRICE_BOUNDARIES + [float('inf')],
+                'default': 'unknown',
+                'output': {'count': {'$sum': 1}},
+            }},
+        ],
+    }}
+
+
+def faceted_aggregate(collection, pipeline_prefix, hits_pipeline, category_field, price_fields):
+    """Run one aggregation and return (hit_docs, raw_facet_doc)."""
+    pipeline = pipeline_prefix + [facet_stage(hits_pipeline, category_field, price_fields)]
+    result = next(collection.aggregate(pipeline), None) or {}
+    return result.pop('hits', []), result
+
+
+def merge_facets(raw_facets):
+    """Combine the per-collection facet documents into the API response shape."""
+    merged = {'category': {}, 'risk_level': {}, 'location': {}}
+    price_counts = {}
+
+    for raw in raw_facets:
+        for name, counts in merged.items():
+            for bucket in raw.get(name, []):
+                value = bucket.get('_id')
+                if value in (None, ''):
+                    continue
+                # 'goat' from products and 'Goat' from livestock are the same facet value
+                key = str(value).strip().lower()
+                counts[key] = counts.get(key, 0) + bucket.get('count', 0)
+        for bucket in raw.get('price', []):
+            price_counts[bucket.get('_id')] = price_counts.get(bucket.get('_id'), 0) + bucket.get('count', 0)
+
+    facets = {
+        name: [
+            {'value': value, 'count': count}
+            for value, count in sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+        ]
+        for name, counts in merged.items()
+    }
+
+    facets['price'] = []
+    for i, low in enumerate(PRICE_BOUNDARIES):
+        high = PRICE_BOUNDARIES[i + 1] if i + 1 < len(PRICE_BOUNDARIES) else None
+        # Bucket ids come back as int or double; equal numbers hash alike
+        count = price_counts.get(low, 0)
+        if count:
+            facets['price'].append({'min': low, 'max': high, 'count': count})
+    if price_counts.get('unknown'):
+        facets['price'].append({'min': None, 'max': None, 'count': price_counts['unknown']})
+    return facets
+
+
+def wants_facets(request):
+    return request.query_params.get('facets', '').strip().lower() in ('1', 'true', 'yes')
@@ -0,0 +1,241 @@
+"""
+Typo-tolerant search over listing titles, names, breeds and types.
+
+The index works on the vocabulary, not on documents: each distinct word is
+split into padded character trigrams, so "bufallo" finds "buffalo" and
+"kadaknat" finds "kadaknath" by trigram overlap. Matched words are then mapped
+back to listings. The vocabulary is far smaller than the catalog, which keeps
+lookups in the low milliseconds even with hundreds of thousands of listings.
+
+Two bounds keep a lookup under ~10ms at 500k listings. A word can only
+reach MIN_WORD_SIMILARITY if it shares a minimum number of the query word's
+trigrams, so the most common trigrams' word lists never need scanning; and
+each query word contributes at most MAX_CANDIDATE_LISTINGS listings to score.
+"""
+
+import re
+import threading
+from collections import defaultdict
+from itertools import islice
+
+from data.projections import projection
+
+from . import listing_index
+from .listing_index import listing_id_of, listing_query
+
+# Per-word Jaccard similarity needed for a vocabulary word to count as a match
+MIN_WORD_SIMILARITY = 0.25
+# Listing score is the mean best similarity over the query words
+MIN_LISTING_SCORE = 0.25
+MAX_WORDS_PER_TOKEN = 20
+# Listings scored per query word, taken from its best-matching words first
+MAX_CANDIDATE_LISTINGS = 500
+MIN_WORD_LENGTH = 2
+# Padded trigrams of the shortest indexed word: "ab" -> "  a", " ab", "ab "
+MIN_WORD_TRIGRAMS = MIN_WORD_LENGTH + 1
+
+
+def tokenize(text):
+    return [w for w in re.findall(r'\w+', str(text or '').lower()) if len(w) >= MIN_WORD_LENGTH and not w.isdigit()]
+
+
+def trigrams(word):
+    padded = f"  {word} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def min_shared_trigrams(query_grams):
+    """
+    Fewest trigrams a vocabulary word must share with a query word of
+    ``query_grams`` trigrams to reach MIN_WORD_SIMILARITY. With s shared, the
+    best case is a word of max(s, MIN_WORD_TRIGRAMS) trigrams.
+    """
+    for shared in range(1, query_grams + 1):
+        word_grams = max(shared, MIN_WORD_TRIGRAMS)
+        if shared / (query_grams + word_grams - shared) >= MIN_WORD_SIMILARITY:
+            return shared
+    return query_grams
+
+
+def listing_words(kind, doc):
+    if kind == 'product':
+        fields = (doc.get('title'), doc.get('name'), doc.get('category'))
+    else:
+        fields = (doc.get('name'), doc.get('breed'), doc.get('type'))
+    words = set()
+    for value in fields:
+        words.update(tokenize(value))
+    return words
+
+
+class TrigramIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._word_listings = defaultdict(set)   # word -> {(kind, listing_id)}
+        self._trigram_words = defaultdict(set)   # trigram -> {word}
+        self._word_trigrams = {}                 # word -> frozenset(trigrams)
+        self._listing_words = {}                 # (kind, listing_id) -> {word}
+
+    # ── Registry hooks ────────────────────────────────────────────────────
+    def rebuild(self, listings):
+        fresh = TrigramIndex.__new__(TrigramIndex)
+        fresh._reset()
+        for kind, listing_id, doc in listings:
+            fresh._add((kind, listing_id), listing_words(kind, doc))
+        with self._lock:
+            self._word_listings = fresh._word_listings
+            self._trigram_words = fresh._trigram_words
+            self._word_trigrams = fresh._word_trigrams
+            self._listing_words = fresh._listing_words
+
+    def upsert(self, kind, listing_id, doc):
+        key = (kind, listing_id)
+        words = listing_words(kind, doc)
+        with self._lock:
+            if self._listing_words.get(key) == words:
+                return
+            self._remove(key)
+            self._add(key, words)
+
+    def discard(self, kind, listing_id):
+        with self._lock:
+            self._remove((kind, listing_id))
+
+    def _add(self, key, words):
+        self._listing_words[key] = words
+        for word in words:
+            if word not in self._word_trigrams:
+                grams = trigrams(word)
+                self._word_trigrams[word] = grams
+                for gram in grams:
+                    self._trigram_words[gram].add(word)
+            self._word_listings[word].add(key)
+
+    def _remove(self, key):
+        for word in self._listing_words.pop(key, ()):
+            owners = self._word_listings.get(word)
+            if owners is None:
+                continue
+            owners.discard(key)
+            if not owners:
+                # Last listing using this word: drop it from the vocabulary
+                del self._word_listings[word]
+                for gram in self._word_trigrams.pop(word, ()):
+                    words = self._trigram_words.get(gram)
+                    if words is not None:
+                        words.discard(word)
+                        if not words:
+                            del self._trigram_words[gram]
+
+    # ── Lookups ───────────────────────────────────────────────────────────
+    def similar_words(self, token):
+        """Vocabulary words ranked by trigram Jaccard similarity to ``token``."""
+        grams = trigrams(token)
+        # Every match shares at least min_shared trigrams, so it has one among any
+        # len(grams) - min_shared + 1 of them: scan the rarest, skip the common ones
+        min_shared = min_shared_trigrams(len(grams))
+        rarest = sorted(grams, key=lambda gram: len(self._trigram_words.get(gram, ())))
+        candidates = set()
+        for gram in rarest[:len(grams) - min_shared + 1]:
+            candidates.update(self._trigram_words.get(gram, ()))
+        scored = []
+        for word in candidates:
+            word_grams = self._word_trigrams[word]
+            overlap = len(grams & word_grams)
+            similarity = overlap / (len(grams) + len(word_grams) - overlap)
+            if similarity >= MIN_WORD_SIMILARITY:
+                scored.append((similarity, word))
+        scored.sort(reverse=True)
+        return scored[:MAX_WORDS_PER_TOKEN]
+
+    def search(self, query, limit=10):
+        """Return [(kind, listing_id, score)] best first."""
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return []
+
+        with self._lock:
+            matches = [dict((w, s) for s, w in self.similar_words(t)) for t in tokens]
+            if not any(matches):
+                return []
+
+            def listing_count(word_sims):
+                return sum(len(self._word_listings[w]) for w in word_sims)
+
+            # Seed candidates from the most selective query word; move on to the
+            # next one while too few listings qualify (they may lack the seed word)
+            seeds = sorted((m for m in matches if m), key=listing_count)
+            # word -> [(query word position, similarity)]; listings have only a few words
+            word_hits = defaultdict(list)
+            for position, word_sims in enumerate(matches):
+                for word, similarity in word_sims.items():
+                    word_hits[word].append((position, similarity))
+            scored = {}
+            seen = set()
+            for seed in seeds:
+                candidates = []
+                for word, _ in sorted(seed.items(), key=lambda item: -item[1]):
+                    room = MAX_CANDIDATE_LISTINGS - len(candidates)
+                    candidates.extend(islice(self._word_listings[word], room))
+                    if len(candidates) >= MAX_CANDIDATE_LISTINGS:
+                        break
+
+                for key in candidates:
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    best = [0.0] * len(tokens)
+                    for word in self._listing_words.get(key, ()):
+                        for position, similarity in word_hits.get(word, ()):
+                            if similarity > best[position]:
+                                best[position] = similarity
+                    score = sum(best) / len(tokens)
+                    if score >= MIN_LISTING_SCORE:
+                        scored[key] = score
+                if len(scored) >= limit:
+                    break
+
+        ranked = sorted(scored.items(), key=lambda item: -item[1])[:limit]
+        return [(kind, listing_id, round(score, 3)) for (kind, listing_id), score in ranked]
+
+    def stats(self):
+        return {
+            'listings': len(self._listing_words),
+            'vocabulary': len(self._word_trigrams),
+            'trigrams': len(self._trigram_words),
+        }
+
+
+fuzzy_index = TrigramIndex()
+listing_index.register(fuzzy_index)
+
+
+def fuzzy_search(db, query, limit=10):
+    """
+    Typo-tolerant fallback shaped like ``text_search.search`` hits:
+    a list of (kind, doc, score), best first.
+    """
+    listing_index.ensure_loaded(db)
+    matches = fuzzy_index.search(query, limit=limit)
+    if not matches:
+        return []
+
+    product_ids = [listing_id for kind, listing_id, _ in matches if kind == 'product']
+    animal_ids = [listing_id for kind, listing_id, _ in matches if kind == 'livestock']
+    docs = {}
+    if product_ids:
+        for p in db.products.find(listing_query('product', product_ids), projection('search.product_hit')):
+            docs[('product', listing_id_of('product', p))] = p
+    if animal_ids:
+        for l in db.livestock.find(listing_query('livestock', animal_ids), projection('search.livestock_hit')):
+            docs[('livestock', listing_id_of('livestock', l))] = l
+
+    # Keep the similarity order; listings removed since the last refresh are skipped
+    return [
+        (kind, docs[(kind, listing_id)], score)
+        for kind, listing_id, score in matches
+        if (kind, listing_id) in docs
+    ]
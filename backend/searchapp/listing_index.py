@@ -0,0 +1,152 @@
+"""
+Registry for the in-process listing indexes (autocomplete, fuzzy search, ...).
+
+Indexes are loaded lazily from MongoDB on first use, patched incrementally
+through ``listing_changed`` whenever a view writes to a listing document in
+MongoDB (ORM saves go to the SQL database and need no hook), and rebuilt in
+the background every ``LISTING_INDEX_REFRESH_SECONDS`` to pick up writes made
+by other worker processes or scripts.
+
+An index registers itself with ``register`` and must implement
+``rebuild(listings)``, ``upsert(kind, listing_id, doc)`` and
+``discard(kind, listing_id)``, where ``listings`` yields
+``(kind, listing_id, doc)`` tuples and ``kind`` is 'product' or 'livestock'.
+"""
+
+import logging
+import os
+import threading
+import time
+
+from bson import ObjectId
+
+from data.projections import projection
+
+logger = logging.getLogger(__name__)
+
+REFRESH_SECONDS = int(os.getenv('LISTING_INDEX_REFRESH_SECONDS', '300'))
+
+# Only the fields the in-process indexes read
+PRODUCT_FIELDS = projection('index.product')
+LIVESTOCK_FIELDS = projection('index.livestock')
+
+_indexes = []
+_db = None
+_loaded_at = None
+_load_lock = threading.Lock()
+_refreshing = threading.Event()
+
+
+def register(index):
+    """Add an index to the registry. Safe to call at import time."""
+    if index not in _indexes:
+        _indexes.append(index)
+        if _loaded_at is not None:
+            index.rebuild(_iter_listings(_db))
+
+
+def is_listed(kind, doc):
+    """Mirror of the active-listing filters used by the search queries."""
+    if not doc:
+        return False
+    if kind == 'product':
+        return doc.get('status') != 'sold'
+    return doc.get('status') == 'active'
+
+
+def listing_id_of(kind, doc):
+    if kind == 'product':
+        return doc.get('product_id', str(doc.get('_id')))
+    return doc.get('animal_id', str(doc.get('_id')))
+
+
+def listing_query(kind, listing_ids):
+    """
+    Filter for the listings with these ids as ``listing_id_of`` assigns them:
+    the product_id / animal_id, or the stringified _id of a doc without one.
+    Key the results by ``listing_id_of`` again.
+    """
+    listing_ids = list(listing_ids)
+    field = 'product_id' if kind == 'product' else 'animal_id'
+    object_ids = [ObjectId(i) for i in listing_ids if isinstance(i, str) and ObjectId.is_valid(i)]
+    if not object_ids:
+        return {field: {"$in": listing_ids}}
+    return {"$or": [{field: {"$in": listing_ids}}, {"_id": {"$in": object_ids}}]}
+
+
+def _iter_listings(db):
+    for p in db.products.find({"status": {"$ne": "sold"}}, PRODUCT_FIELDS):
+        yield 'product', listing_id_of('product', p), p
+    for l in db.livestock.find({"status": "active"}, LIVESTOCK_FIELDS):
+        yield 'livestock', listing_id_of('livestock', l), l
+
+
+def _rebuild_all(db):
+    global _loaded_at
+    started = time.time()
+    listings = list(_iter_listings(db))
+    for index in list(_indexes):
+        index.rebuild(listings)
+    _loaded_at = time.time()
+    logger.info(f"Listing indexes rebuilt: {len(listings)} listings in {(_loaded_at - started) * 1000:.0f}ms")
+
+
+def _background_refresh(db):
+    try:
+        _rebuild_all(db)
+    except Exception as e:
+        logger.error(f"Listing index refresh failed: {e}")
+    finally:
+        _refreshing.clear()
+
+
+def ensure_loaded(db):
+    """
+    Load every registered index on first call (blocking). Later calls return
+    immediately and kick off a background rebuild once the data is stale.
+    """
+    global _db
+    if _loaded_at is None:
+        with _load_lock:
+            if _loaded_at is None:
+                _db = db
+                _rebuild_all(db)
+        return
+    if time.time() - _loaded_at > REFRESH_SECONDS and not _refreshing.is_set():
+        _refreshing.set()
+        threading.Thread(target=_background_refresh, args=(db,), daemon=True).start()
+
+
+def listing_changed(kind, listing_id, db=None):
+    """
+    Re-read one listing and patch every index. Call after any MongoDB write
+    that can change a listing's text fields or its active/sold status.
+    """
+    if _loaded_at is None:
+        # Nothing loaded yet; the first load will see the change anyway
+        return
+    source = db if db is not None else _db
+    try:
+        if kind == 'product':
+            doc = source.products.find_one(listing_query(kind, [listing_id]), PRODUCT_FIELDS)
+        else:
+            doc = source.livestock.find_one(listing_query(kind, [listing_id]), LIVESTOCK_FIELDS)
+        for index in list(_indexes):
+            if is_listed(kind, doc):
+                index.upsert(kind, listing_id_of(kind, doc), doc)
+            else:
+                index.discard(kind, listing_id)
+    except Exception as e:
+        logger.error(f"Listing index update failed for {kind} {listing_id}: {e}")
+
+
+def stats():
+    return {
+        'loaded_at': _loaded_at,
+        'refreshing': _refreshing.is_set(),
+        'refresh_seconds': REFRESH_SECONDS,
+        'indexes': {
+            type(index).__name__: index.stats() if hasattr(index, 'stats') else {}
+            for index in _indexes
+        },
+    }
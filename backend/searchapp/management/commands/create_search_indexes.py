@@ -0,0 +1,47 @@
+"""
+Create the indexes search and explore rely on: the weighted text indexes and
+the compound (status, sort field, _id) indexes behind explore's keyset pages.
+
+Run it once per deployment (and after changing the field weights or the
+explore sorts). Until the text indexes exist, $text queries fail and search
+falls back to the regex scan; without the keyset indexes explore pages are
+sorted in memory.
+
+    python manage.py create_search_indexes
+"""
+import os
+
+from django.core.management.base import BaseCommand
+from dotenv import load_dotenv
+from pymongo import MongoClient
+from pymongo.errors import OperationFailure
+
+from searchapp.pagination import ensure_sort_index
+from searchapp.text_search import ensure_text_indexes
+from searchapp.views import explore_sort_indexes
+
+load_dotenv()
+
+MONGO_URI = os.getenv('MONGO_URI')
+
+
+class Command(BaseCommand):
+    help = 'Creates the text and keyset indexes used by search and explore'
+
+    def handle(self, *args, **options):
+        client = MongoClient(MONGO_URI)
+        try:
+            db = client['goatfarm']
+            failed = ensure_text_indexes(db)
+            for collection, prefix_fields, field in explore_sort_indexes(db):
+                try:
+                    ensure_sort_index(collection, prefix_fields, field)
+                except OperationFailure as e:
+                    self.stderr.write(f"Could not create the {collection.name} '{field}' keyset index: {e}")
+                    failed.append(f"{collection.name}.{field}")
+            if failed:
+                self.stderr.write(self.style.ERROR(f"Could not create: {', '.join(failed)}"))
+            else:
+                self.stdout.write(self.style.SUCCESS("Search indexes are in place"))
+        finally:
+            client.close()
@@ -0,0 +1,80 @@
+"""
+Keyset (cursor) pagination helpers.
+
+A page is fetched with a range filter on ``(sort_field, _id)`` starting right
+after the last document of the previous page, so page 500 costs the same
+single index walk as page one. The position is handed to the client as an
+opaque, URL-safe continuation token.
+"""
+
+import base64
+
+from bson import json_util
+from pymongo import ASCENDING, DESCENDING
+
+
+class InvalidCursor(ValueError):
+    """Raised when a continuation token cannot be decoded."""
+
+
+def encode_cursor(state):
+    raw = json_util.dumps(state, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        state = json_util.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except Exception as e:
+        raise InvalidCursor(f"Malformed cursor: {e}")
+    if not isinstance(state, dict):
+        raise InvalidCursor("Malformed cursor")
+    return state
+
+
+def keyset_filter(field, last_value, last_id, descending):
+    """
+    Mongo filter for documents strictly after (last_value, last_id) in the
+    (field, _id) ordering. Missing/null values sort lowest, as in MongoDB.
+    """
+    op = '$lt' if descending else '$gt'
+    if last_value is None:
+        after_nulls = {field: None, '_id': {op: last_id}}
+        if descending:
+            # Nulls are last in descending order; only the remaining nulls are left
+            return after_nulls
+        return {'$or': [after_nulls, {field: {'$ne': None}}]}
+
+    clauses = [
+        {field: {op: last_value}},
+        {field: last_value, '_id': {op: last_id}},
+    ]
+    if descending:
+        clauses.append({field: None})
+    return {'$or': clauses}
+
+
+def sort_spec(field, descending):
+    direction = DESCENDING if descending else ASCENDING
+    return [(field, direction), ('_id', direction)]
+
+
+def sort_key(value, doc_id):
+    """Python ordering key matching MongoDB's (field, _id) order, nulls lowest."""
+    return (value is not None, value if value is not None else 0, doc_id)
+
+
+def ensure_sort_index(collection, prefix_fields, field):
+    """
+    Create the compound index backing a keyset sort (no-op when it exists).
+    Run from the ``create_search_indexes`` management command, not per
+    request; pagination still works without the index, just slower.
+    Returns the index name.
+    """
+    name = f"{collection.name}_{'_'.join(prefix_fields + [field])}_keyset"
+    collection.create_index(
+        [(f, ASCENDING) for f in prefix_fields] + [(field, DESCENDING), ('_id', DESCENDING)],
+        name=name,
+    )
+    return name
@@ -0,0 +1,214 @@
+"""
+Prefix autocomplete backed by an in-memory trie.
+
+Every node keeps a precomputed top-k list of the suggestions below it, so a
+lookup is a walk down ``len(prefix)`` nodes followed by a list copy. Updates
+are incremental: adding or removing a term only recomputes the nodes on that
+term's path.
+"""
+
+import re
+import threading
+
+from . import listing_index
+
+# Deeper prefixes are rare in practice and would only bloat the trie
+MAX_KEY_DEPTH = 24
+# Inner-word suggestions: "boer" should also find "Premium Boer Goat"
+MAX_TITLE_WORD_OFFSETS = 3
+
+
+def normalize(text):
+    """Lower-case and collapse punctuation/whitespace into single spaces."""
+    return ' '.join(re.findall(r'\w+', str(text or '').lower()))
+
+
+class _Node:
+    __slots__ = ('children', 'entries', 'top')
+
+    def __init__(self):
+        self.children = {}
+        # (display, label) -> number of listings contributing that suggestion
+        self.entries = {}
+        # Precomputed best suggestions in this subtree: [(weight, display, label), ...]
+        self.top = []
+
+
+class SuggestionTrie:
+    """Weighted prefix trie with per-node top-k suggestion lists."""
+
+    def __init__(self, top_k=8):
+        self.top_k = top_k
+        self._root = _Node()
+        self._lock = threading.Lock()
+        self._term_count = 0
+
+    # ── Lookups ───────────────────────────────────────────────────────────
+    def suggest(self, prefix, limit=None):
+        """Up to `limit` suggestions for the prefix; limit is clamped to 1..top_k."""
+        key = normalize(prefix)[:MAX_KEY_DEPTH]
+        if not key:
+            return []
+        limit = self.top_k if limit is None else max(1, min(limit, self.top_k))
+        node = self._root
+        for ch in key:
+            node = node.children.get(ch)
+            if node is None:
+                return []
+        return [
+            {'text': display, 'type': label, 'count': weight}
+            for weight, display, label in node.top[:limit]
+        ]
+
+    def __len__(self):
+        return self._term_count
+
+    # ── Mutations ─────────────────────────────────────────────────────────
+    def add(self, key, display, label):
+        with self._lock:
+            self._adjust(self._root, key, display, label, 1)
+
+    def remove(self, key, display, label):
+        with self._lock:
+            self._adjust(self._root, key, display, label, -1)
+
+    def rebuild(self, terms):
+        """Build a fresh trie from (key, display, label) terms and swap it in."""
+        root = _Node()
+        count = 0
+        # Insert without recomputing, then fill the top-k lists bottom-up once
+        for key, display, label in terms:
+            key = normalize(key)[:MAX_KEY_DEPTH]
+            if not key:
+                continue
+            node = root
+            for ch in key:
+                node = node.children.setdefault(ch, _Node())
+            if (display, label) not in node.entries:
+                count += 1
+            node.entries[(display, label)] = node.entries.get((display, label), 0) + 1
+        self._fill_tops(root)
+        with self._lock:
+            self._root = root
+            self._term_count = count
+
+    def _adjust(self, root, key, display, label, delta):
+        key = normalize(key)[:MAX_KEY_DEPTH]
+        if not key:
+            return
+        path = [root]
+        node = root
+        for ch in key:
+            child = node.children.get(ch)
+            if child is None:
+                if delta < 0:
+                    return
+                child = node.children[ch] = _Node()
+            node = child
+            path.append(node)
+
+        entry = (display, label)
+        weight = node.entries.get(entry, 0) + delta
+        if weight > 0:
+            if entry not in node.entries:
+                self._term_count += 1
+            node.entries[entry] = weight
+        elif entry in node.entries:
+            del node.entries[entry]
+            self._term_count -= 1
+
+        # Recompute top-k bottom-up along the path, pruning emptied nodes
+        for depth in range(len(path) - 1, -1, -1):
+            current = path[depth]
+            if depth > 0 and not current.entries and not current.children:
+                del path[depth - 1].children[key[depth - 1]]
+                continue
+            current.top = self._merge_top(current)
+
+    def _fill_tops(self, node):
+        for child in node.children.values():
+            self._fill_tops(child)
+        node.top = self._merge_top(node)
+
+    def _merge_top(self, node):
+        best = {}
+        candidates = [(w, d, l) for (d, l), w in node.entries.items()]
+        for child in node.children.values():
+            candidates.extend(child.top)
+        for weight, display, label in candidates:
+            # The same title can be reached through several inner-word keys
+            ident = (display.lower(), label)
+            if ident not in best or best[ident][0] < weight:
+                best[ident] = (weight, display, label)
+        ranked = sorted(best.values(), key=lambda item: (-item[0], item[1]))
+        return ranked[:self.top_k]
+
+
+def listing_terms(kind, doc):
+    """The (key, display, label) suggestion terms contributed by one listing."""
+    terms = []
+    if kind == 'product':
+        title = (doc.get('title') or doc.get('name') or '').strip()
+        if title:
+            words = normalize(title).split(' ')
+            for offset in range(min(len(words), MAX_TITLE_WORD_OFFSETS)):
+                terms.append((' '.join(words[offset:]), title, 'product'))
+        category = (doc.get('category') or '').strip()
+        if category:
+            terms.append((category, category.capitalize(), 'category'))
+    else:
+        breed = (doc.get('breed') or '').strip()
+        if breed:
+            terms.append((breed, breed, 'breed'))
+        animal_type = (doc.get('type') or '').strip()
+        if animal_type:
+            terms.append((animal_type, animal_type.capitalize(), 'category'))
+    return terms
+
+
+class SuggestionIndex:
+    """Adapts the trie to the listing index registry (see listing_index.py)."""
+
+    def __init__(self, top_k=8):
+        self.trie = SuggestionTrie(top_k=top_k)
+        self._listing_terms = {}
+        self._lock = threading.Lock()
+
+    def rebuild(self, listings):
+        listing_terms_map = {}
+        all_terms = []
+        for kind, listing_id, doc in listings:
+            terms = listing_terms(kind, doc)
+            listing_terms_map[(kind, listing_id)] = terms
+            all_terms.extend(terms)
+        self.trie.rebuild(all_terms)
+        with self._lock:
+            self._listing_terms = listing_terms_map
+
+    def upsert(self, kind, listing_id, doc):
+        terms = listing_terms(kind, doc)
+        with self._lock:
+            previous = self._listing_terms.get((kind, listing_id), [])
+            self._listing_terms[(kind, listing_id)] = terms
+        if previous == terms:
+            return
+        for term in previous:
+            self.trie.remove(*term)
+        for term in terms:
+            self.trie.add(*term)
+
+    def discard(self, kind, listing_id):
+        with self._lock:
+            previous = self._listing_terms.pop((kind, listing_id), [])
+        for term in previous:
+            self.trie.remove(*term)
+
+    def suggest(self, prefix, limit=None):
+        return self.trie.suggest(prefix, limit=limit)
+
+    def stats(self):
+        return {'listings': len(self._listing_terms), 'terms': len(self.trie)}
+
+
+suggestion_index = SuggestionIndex()
+listing_index.register(suggestion_index)
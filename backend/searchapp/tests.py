@@ -1,3 +1,393 @@
-from django.test import TestCase
+import re
+import time
+from datetime import datetime
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from bson import ObjectId
+from django.test import SimpleTestCase
+from rest_framework.test import APIRequestFactory
+from pymongo.errors import OperationFailure
+
+from . import conditional, fuzzy, listing_index, pagination, text_search, unified, views
+from .fuzzy import MIN_WORD_SIMILARITY, TrigramIndex, fuzzy_search, min_shared_trigrams
+from .suggest import SuggestionIndex, SuggestionTrie
+
+
+class FakeCollection:
+    """find() over in-memory docs for the $or / $in filters the search helpers build."""
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    def _matches(self, doc, query):
+        for field, condition in query.items():
+            if field == '$or':
+                if not any(self._matches(doc, clause) for clause in condition):
+                    return False
+            elif isinstance(condition, dict) and '$in' in condition:
+                if field not in doc or doc[field] not in condition['$in']:
+                    return False
+            elif doc.get(field) != condition:
+                return False
+        return True
+
+    def find(self, query, projection=None):
+        return [dict(doc) for doc in self.docs if self._matches(doc, query)]
+
+    def find_one(self, query, projection=None):
+        found = self.find(query, projection)
+        return found[0] if found else None
+
+
+class TrigramIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = TrigramIndex()
+        self.index.rebuild([
+            ('livestock', 'L1', {'name': 'Kali', 'breed': 'Murrah', 'type': 'buffalo'}),
+            ('livestock', 'L2', {'name': 'Rani', 'breed': 'Holstein', 'type': 'cow'}),
+            ('product', 'P1', {'title': 'Kadaknath chicks', 'category': 'poultry'}),
+            ('product', 'P2', {'title': 'Friesian heifer', 'category': 'cattle'}),
+        ])
+
+    def keys(self, query):
+        return [(kind, listing_id) for kind, listing_id, _ in self.index.search(query)]
+
+    def test_misspellings_find_listings(self):
+        self.assertEqual(self.keys('bufallo')[0], ('livestock', 'L1'))
+        self.assertEqual(self.keys('kadaknat')[0], ('product', 'P1'))
+
+    def test_listings_without_the_rarest_query_word_are_still_found(self):
+        # 'holstein' is the rarer word, but its only listing scores too low on its own
+        self.index.upsert('product', 'P4', {'title': 'Friesian bull', 'category': 'cattle'})
+        self.assertEqual(set(self.keys('holstien frisian')), {('product', 'P2'), ('product', 'P4')})
+
+    def test_upsert_and_discard_patch_the_index(self):
+        self.index.upsert('product', 'P3', {'title': 'Jamunapari goat', 'category': 'goat'})
+        self.assertEqual(self.keys('jamunapary')[0], ('product', 'P3'))
+        self.index.discard('product', 'P3')
+        self.assertEqual(self.keys('jamunapary'), [])
+        self.assertNotIn('jamunapari', self.index._word_trigrams)
+
+    def test_min_shared_trigrams_never_prunes_a_reachable_match(self):
+        for query_grams in range(3, 20):
+            shared = min_shared_trigrams(query_grams)
+            # One fewer shared trigram cannot reach the threshold even with the smallest word
+            if shared > 1:
+                fewer = shared - 1
+                best = fewer / (query_grams + max(fewer, 3) - fewer)
+                self.assertLess(best, MIN_WORD_SIMILARITY)
+
+
+class FuzzySearchTests(SimpleTestCase):
+    def test_listings_without_a_product_id_are_returned(self):
+        object_id = ObjectId()
+        db = mock.Mock()
+        db.products = FakeCollection([
+            {'_id': object_id, 'title': 'Murrah buffalo'},
+            {'_id': ObjectId(), 'product_id': 'P9', 'title': 'Murrah buffalo calf'},
+        ])
+        db.livestock = FakeCollection([])
+        index = TrigramIndex()
+        index.rebuild([
+            ('product', str(object_id), {'title': 'Murrah buffalo'}),
+            ('product', 'P9', {'title': 'Murrah buffalo calf'}),
+        ])
+        with mock.patch.object(fuzzy, 'fuzzy_index', index), mock.patch.object(fuzzy.listing_index, 'ensure_loaded'):
+            hits = fuzzy_search(db, 'murah bufalo')
+
+        self.assertEqual({doc['title'] for _, doc, _ in hits}, {'Murrah buffalo', 'Murrah buffalo calf'})
+
+
+class UnionFallbackTests(SimpleTestCase):
+    def setUp(self):
+        unified._disabled.clear()
+        self.addCleanup(unified._disabled.clear)
+        self.union = mock.Mock(return_value='union')
+        self.split = mock.Mock(return_value='split')
+
+    def call(self):
+        return unified.with_fallback('test', self.union, self.split)
+
+    def test_unsupported_stage_skips_the_union_until_reprobe(self):
+        self.union.side_effect = OperationFailure('Unrecognized pipeline stage name', 40324)
+        self.assertEqual(self.call(), 'split')
+        self.assertEqual(self.call(), 'split')
+        self.assertEqual(self.union.call_count, 1)
+
+        self.union.side_effect = None
+        with mock.patch.object(unified, 'UNION_REPROBE_SECONDS', 0):
+            self.assertEqual(self.call(), 'union')
+        self.assertNotIn('test', unified._disabled)
+
+    def test_other_failures_fall_back_for_one_call_only(self):
+        self.union.side_effect = [OperationFailure('operation exceeded time limit', 50), 'union']
+        self.assertEqual(self.call(), 'split')
+        self.assertEqual(self.call(), 'union')
+
+
+class TextSearchFallbackTests(SimpleTestCase):
+    def setUp(self):
+        unified._disabled.clear()
+        self.addCleanup(unified._disabled.clear)
+        patcher = mock.patch.object(text_search, '_text_unavailable_at', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.db = mock.Mock()
+        self.regex_hits = [('product', {'title': 'Buffalo milk'}, 1.0)]
+        patcher = mock.patch.multiple(text_search, union_text_search=mock.DEFAULT, union_regex_search=mock.DEFAULT)
+        self.mocks = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mocks['union_regex_search'].return_value = (self.regex_hits, None)
+
+    def test_text_hits_are_returned(self):
+        text_hits = [('product', {'title': 'Buffalo milk'}, 3.2)]
+        self.mocks['union_text_search'].return_value = (text_hits, None)
+        self.assertEqual(text_search.search(self.db, 'buffalo'), (text_hits, 'text', None))
+        self.mocks['union_regex_search'].assert_not_called()
+
+    def test_partial_word_falls_back_to_regex(self):
+        self.mocks['union_text_search'].return_value = ([], None)
+        self.assertEqual(text_search.search(self.db, 'buff'), (self.regex_hits, 'regex', None))
+
+    def test_missing_text_index_falls_back_to_regex(self):
+        missing_index = OperationFailure('text index required for $text query', 27)
+        self.mocks['union_text_search'].side_effect = missing_index
+        self.db.products.find.side_effect = missing_index
+        self.assertEqual(text_search.search(self.db, 'buffalo'), (self.regex_hits, 'regex', None))
+
+    def test_missing_text_index_is_skipped_until_reprobe(self):
+        missing_index = OperationFailure('text index required for $text query', 27)
+        self.mocks['union_text_search'].side_effect = missing_index
+        self.db.products.find.side_effect = missing_index
+        text_search.search(self.db, 'buffalo')
+        text_search.search(self.db, 'buffalo')
+        self.assertEqual(self.mocks['union_text_search'].call_count, 1)
+
+        text_hits = [('product', {'title': 'Buffalo milk'}, 3.2)]
+        self.mocks['union_text_search'].side_effect = None
+        self.mocks['union_text_search'].return_value = (text_hits, None)
+        with mock.patch.object(text_search, 'TEXT_REPROBE_SECONDS', 0):
+            self.assertEqual(text_search.search(self.db, 'buffalo')[1], 'text')
+        self.assertIsNone(text_search._text_unavailable_at)
+
+    def test_other_text_failures_fall_back_for_one_request(self):
+        timeout = OperationFailure('operation exceeded time limit', 50)
+        self.mocks['union_text_search'].side_effect = timeout
+        self.db.products.find.side_effect = timeout
+        self.assertEqual(text_search.search(self.db, 'buffalo')[1], 'regex')
+        self.assertIsNone(text_search._text_unavailable_at)
+
+    def test_short_query_goes_straight_to_regex(self):
+        self.assertEqual(text_search.search(self.db, 'bu'), (self.regex_hits, 'regex', None))
+        self.mocks['union_text_search'].assert_not_called()
+
+    def test_queries_do_not_create_indexes(self):
+        for collection in (self.db.products, self.db.livestock):
+            collection.find.return_value.sort.return_value.limit.return_value = []
+        text_search.text_search(self.db, 'buffalo')
+        self.db.products.create_index.assert_not_called()
+        self.db.livestock.create_index.assert_not_called()
+
+
+class ConditionalValidatorTests(SimpleTestCase):
+    def test_unversioned_docs_change_etag_with_their_content(self):
+        etag, last_modified = conditional.validators('P1', {'title': 'Murrah buffalo', 'current_price': 90000})
+        edited, _ = conditional.validators('P1', {'title': 'Murrah buffalo', 'current_price': 85000})
+        self.assertNotEqual(etag, edited)
+        self.assertIsNone(last_modified)
+
+    def test_version_bump_changes_etag_within_the_same_second(self):
+        updated_at = datetime(2024, 5, 1, 12, 0, 0)
+        etag, last_modified = conditional.validators('P1', {'updated_at': updated_at, 'version': 1})
+        bumped, _ = conditional.validators('P1', {'updated_at': updated_at, 'version': 2})
+        self.assertNotEqual(etag, bumped)
+        # Naive updated_at is read as UTC
+        self.assertEqual(last_modified, 1714564800)
+
+
+class SuggestionTrieTests(SimpleTestCase):
+    def setUp(self):
+        self.trie = SuggestionTrie(top_k=3)
+        self.trie.rebuild([
+            ('boer goat', 'Boer goat', 'product'),
+            ('boer goat', 'Boer goat', 'product'),
+            ('buffalo', 'Buffalo', 'category'),
+            ('bull calf', 'Bull calf', 'product'),
+            ('broiler', 'Broiler', 'breed'),
+        ])
+
+    def texts(self, prefix, limit=None):
+        return [s['text'] for s in self.trie.suggest(prefix, limit=limit)]
+
+    def test_suggestions_are_ranked_by_listing_count(self):
+        self.assertEqual(self.texts('b'), ['Boer goat', 'Broiler', 'Buffalo'])
+        self.assertEqual(self.texts('Bu'), ['Buffalo', 'Bull calf'])
+        self.assertEqual(self.texts('x'), [])
+
+    def test_limit_is_clamped_to_one_through_top_k(self):
+        self.assertEqual(len(self.texts('b', limit=20)), 3)
+        self.assertEqual(self.texts('b', limit=-2), ['Boer goat'])
+        self.assertEqual(self.texts('b', limit=0), ['Boer goat'])
+
+    def test_add_and_remove_update_the_path(self):
+        self.trie.add('bulldog', 'Bulldog', 'breed')
+        self.assertIn('Bulldog', self.texts('bull'))
+        self.trie.remove('bulldog', 'Bulldog', 'breed')
+        self.assertEqual(self.texts('bulld'), [])
+        self.assertNotIn('d', self.trie._root.children['b'].children['u'].children['l'].children['l'].children)
+
+    def test_listing_index_adds_inner_word_prefixes(self):
+        index = SuggestionIndex()
+        index.rebuild([('product', 'P1', {'title': 'Premium Boer Goat', 'category': 'goat'})])
+        self.assertEqual(index.suggest('boer')[0]['text'], 'Premium Boer Goat')
+        index.upsert('product', 'P1', {'title': 'Premium Jamunapari Goat', 'category': 'goat'})
+        self.assertEqual(index.suggest('boer'), [])
+        index.discard('product', 'P1')
+        self.assertEqual(index.suggest('goat'), [])
+
+
+class ListingChangedTests(SimpleTestCase):
+    def test_listing_without_product_id_is_found_by_object_id(self):
+        object_id = ObjectId()
+        db = mock.Mock()
+        db.products = FakeCollection([{'_id': object_id, 'title': 'Sold Boer goat', 'status': 'sold'}])
+        index = mock.Mock()
+        with mock.patch.object(listing_index, '_indexes', [index]), \
+                mock.patch.object(listing_index, '_loaded_at', 1.0):
+            listing_index.listing_changed('product', str(object_id), db=db)
+        index.discard.assert_called_once_with('product', str(object_id))
+
+        db.products.docs[0]['status'] = 'active'
+        with mock.patch.object(listing_index, '_indexes', [index]), \
+                mock.patch.object(listing_index, '_loaded_at', 1.0):
+            listing_index.listing_changed('product', str(object_id), db=db)
+        index.upsert.assert_called_once_with('product', str(object_id), db.products.docs[0])
+
+
+def matches_keyset(doc, query):
+    """Evaluate the operators keyset_filter emits with MongoDB's null semantics."""
+    if '$or' in query:
+        return any(matches_keyset(doc, clause) for clause in query['$or'])
+    for field, condition in query.items():
+        value = doc.get(field)
+        if isinstance(condition, dict):
+            (op, operand), = condition.items()
+            if op == '$ne':
+                if value == operand:
+                    return False
+            elif value is None or not (value < operand if op == '$lt' else value > operand):
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+class KeysetPaginationTests(SimpleTestCase):
+    def setUp(self):
+        prices = [300, None, 150, 300, None, 75, 150, 300]
+        self.docs = [{'_id': ObjectId(), 'price': price} for price in prices]
+
+    def walk(self, descending, page_size=3):
+        ordered = sorted(
+            self.docs, key=lambda d: pagination.sort_key(d['price'], d['_id']), reverse=descending,
+        )
+        seen, query = [], {}
+        while True:
+            page = [d for d in ordered if matches_keyset(d, query)][:page_size]
+            if not page:
+                return ordered, seen
+            seen.extend(page)
+            state = pagination.decode_cursor(pagination.encode_cursor(
+                {'v': page[-1]['price'], 'id': page[-1]['_id']}
+            ))
+            query = pagination.keyset_filter('price', state['v'], state['id'], descending)
+
+    def test_pages_cover_every_doc_once_in_order(self):
+        for descending in (False, True):
+            ordered, seen = self.walk(descending)
+            self.assertEqual([d['_id'] for d in seen], [d['_id'] for d in ordered])
+
+    def test_malformed_cursor_is_rejected(self):
+        for token in ('not-a-cursor', pagination.encode_cursor([1, 2])):
+            with self.assertRaises(pagination.InvalidCursor):
+                pagination.decode_cursor(token)
+
+
+class ExploreViewTests(SimpleTestCase):
+    def setUp(self):
+        unified._disabled.clear()
+        self.addCleanup(unified._disabled.clear)
+        self.db = mock.Mock()
+        for patcher in (
+            mock.patch.object(views, 'db', self.db),
+            mock.patch.object(unified, 'aggregate', return_value=[]),
+            mock.patch.object(unified, 'branch', wraps=unified.branch),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def get(self, **params):
+        return views.explore_livestock(APIRequestFactory().get('/api/search/explore/', params))
+
+    def test_category_filter_matches_free_text_categories(self):
+        self.assertEqual(self.get(category='Dairy Cow').status_code, 200)
+        for call in unified.branch.call_args_list:
+            field = 'category' if call.args[0] == 'product' else 'type'
+            condition = call.args[1][field]
+            self.assertTrue(re.match(condition['$regex'], 'Dairy Cow', re.IGNORECASE))
+            self.assertFalse(re.match(condition['$regex'], 'Dairy Cows', re.IGNORECASE))
+
+    def test_requests_do_not_create_indexes(self):
+        self.get(sort='price')
+        self.db.products.create_index.assert_not_called()
+        self.db.livestock.create_index.assert_not_called()
+
+    def test_malformed_cursors_are_rejected(self):
+        for state in (
+            {'n': None, 'k': [1, 'x']},
+            {'k': [1]},
+            {'k': 'position'},
+            {'s': ['price'], 'k': [1, 'x']},
+        ):
+            response = self.get(cursor=pagination.encode_cursor(state))
+            self.assertEqual(response.status_code, 400, state)
+
+
+class ItemsBatchTests(SimpleTestCase):
+    def setUp(self):
+        unified._disabled['batch'] = time.time()
+        self.addCleanup(unified._disabled.clear)
+        db = SimpleNamespace(
+            products=FakeCollection([
+                {'_id': ObjectId(), 'product_id': 'P1', 'title': 'Goat feed', 'current_price': 1200, 'quantity': 3},
+            ]),
+            livestock=FakeCollection([
+                {'_id': ObjectId(), 'animal_id': 'L1', 'name': 'Kali', 'type': 'goat', 'current_value': '18000',
+                 'status': 'sold'},
+            ]),
+        )
+        patcher = mock.patch.object(views, 'db', db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, ids):
+        return views.get_items_batch(APIRequestFactory().post('/api/search/products/batch/', {'ids': ids}, format='json'))
+
+    def test_results_follow_request_order_and_list_missing_ids(self):
+        response = self.post(['L1', 'gone', 'P1', 'L1'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['id'] for item in response.data['results']], ['L1', 'P1'])
+        self.assertEqual(response.data['missing'], ['gone'])
+        sold, product = response.data['results']
+        self.assertEqual((sold['type'], sold['status'], sold['price']), ('livestock', 'sold', 18000.0))
+        self.assertEqual((product['type'], product['status'], product['available_quantity']), ('product', 'active', 3))
+
+    def test_id_count_is_capped_after_deduplication(self):
+        ids = [f"X{i}" for i in range(views.BATCH_MAX_IDS)]
+        self.assertEqual(self.post(ids + ids[:5]).status_code, 200)
+        self.assertEqual(self.post(ids + ['X-extra']).status_code, 400)
+
+    def test_malformed_ids_are_rejected(self):
+        for ids in ('P1', [1], [''], None):
+            self.assertEqual(self.post(ids).status_code, 400, ids)
@@ -0,0 +1,284 @@
+"""
+Full-text search over the products and livestock collections.
+
+The primary path uses weighted MongoDB text indexes and ranks hits by
+``textScore``. The old case-insensitive ``$regex`` scan is the fallback where
+the text indexes are missing or cannot be queried, and for queries ``$text``
+cannot answer: it matches whole (stemmed) words only, so a partly typed word
+such as "buff" finds nothing. The indexes are created by
+``python manage.py create_search_indexes``, not on the request path. While
+they are missing, ``$text`` is skipped and retried every
+TEXT_REPROBE_SECONDS, the way ``unified`` re-probes ``$unionWith``.
+
+Both collections are searched in one ``$unionWith`` aggregation (see
+``unified``) so hits are ranked together under a single limit; the
+per-collection queries below remain as the fallback for older servers.
+"""
+
+import logging
+import os
+import re
+import time
+
+from pymongo import TEXT
+from pymongo.errors import OperationFailure
+
+from data.projections import projection, project_stage
+
+from . import facets as facet_utils
+from . import unified
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_TEXT_INDEX = 'products_text_idx'
+LIVESTOCK_TEXT_INDEX = 'livestock_text_idx'
+
+# Field weights: a hit on the title/breed outranks a hit buried in a description
+PRODUCT_TEXT_WEIGHTS = {'title': 10, 'name': 8, 'category': 5, 'description': 1}
+LIVESTOCK_TEXT_WEIGHTS = {'breed': 10, 'name': 8, 'type': 5}
+
+PRODUCT_ACTIVE_FILTER = {"status": {"$ne": "sold"}}
+LIVESTOCK_ACTIVE_FILTER = {"status": "active"}
+
+# Shorter words are usually a query still being typed; only the regex finds them inside longer words
+MIN_TEXT_TOKEN_LENGTH = 3
+
+# IndexNotFound: "text index required for $text query"
+TEXT_INDEX_MISSING_CODES = (27,)
+# Indexes built after a failure are picked up by retrying $text this often
+TEXT_REPROBE_SECONDS = float(os.getenv('TEXT_REPROBE_SECONDS', '600'))
+
+# When $text last failed for lack of an index (None while it works)
+_text_unavailable_at = None
+
+
+def ensure_text_indexes(db):
+    """
+    Create the text indexes (no-op when they already exist). Run by the
+    ``create_search_indexes`` management command; returns the names of the
+    indexes that could not be created.
+    """
+    failed = []
+    for collection, weights, name in (
+        (db.products, PRODUCT_TEXT_WEIGHTS, PRODUCT_TEXT_INDEX),
+        (db.livestock, LIVESTOCK_TEXT_WEIGHTS, LIVESTOCK_TEXT_INDEX),
+    ):
+        try:
+            collection.create_index(
+                [(field, TEXT) for field in weights],
+                weights=weights,
+                name=name,
+                default_language='english',
+                # Listings may carry their own 'language' field; don't let it drive stemming
+                language_override='text_language',
+            )
+        except OperationFailure as e:
+            logger.warning(f"Could not create text index {name}: {e}")
+            failed.append(name)
+    return failed
+
+
+def has_text_token(query):
+    """True if at least one query word is long enough for ``$text`` to be worth trying."""
+    return any(len(word) >= MIN_TEXT_TOKEN_LENGTH for word in re.findall(r'\w+', query))
+
+
+def text_search(db, query, limit=10):
+    """
+    Relevance-ranked search using the text indexes.
+    Returns a list of (kind, doc, score) tuples sorted by score, best first.
+    Raises OperationFailure when the text indexes are unavailable.
+    """
+    score_meta = {"$meta": "textScore"}
+    sort_by_score = [("score", {"$meta": "textScore"})]
+
+    products = db.products.find(
+        {"$text": {"$search": query}, **PRODUCT_ACTIVE_FILTER},
+        projection('search.product_hit', score=score_meta),
+    ).sort(sort_by_score).limit(limit)
+    livestock = db.livestock.find(
+        {"$text": {"$search": query}, **LIVESTOCK_ACTIVE_FILTER},
+        projection('search.livestock_hit', score=score_meta),
+    ).sort(sort_by_score).limit(limit)
+
+    hits = [('product', p, p.get('score', 0.0)) for p in products]
+    hits += [('livestock', l, l.get('score', 0.0)) for l in livestock]
+    hits.sort(key=lambda hit: hit[2], reverse=True)
+    return hits
+
+
+def faceted_text_search(db, query, limit=10):
+    """
+    Text search plus facet counts, one aggregation per collection.
+    Returns (hits, facets) with hits shaped like ``text_search``.
+    """
+
+    def hits_pipeline(projection_name):
+        return [
+            {"$sort": {"score": -1}},
+            {"$limit": limit},
+            {"$project": projection(projection_name, score=1)},
+        ]
+
+    def prefix(active_filter):
+        return [
+            {"$match": {"$text": {"$search": query}, **active_filter}},
+            {"$addFields": {"score": {"$meta": "textScore"}}},
+        ]
+
+    products, product_facets = facet_utils.faceted_aggregate(
+        db.products, prefix(PRODUCT_ACTIVE_FILTER), hits_pipeline('search.product_hit'),
+        'category', ('current_price', 'base_price'),
+    )
+    livestock, livestock_facets = facet_utils.faceted_aggregate(
+        db.livestock, prefix(LIVESTOCK_ACTIVE_FILTER), hits_pipeline('search.livestock_hit'),
+        'type', ('current_value', 'purchase_price'),
+    )
+
+    hits = [('product', p, p.get('score', 0.0)) for p in products]
+    hits += [('livestock', l, l.get('score', 0.0)) for l in livestock]
+    hits.sort(key=lambda hit: hit[2], reverse=True)
+    return hits, facet_utils.merge_facets([product_facets, livestock_facets])
+
+
+def union_text_search(db, query, limit=10, facets=False):
+    """
+    Text search over both collections in one aggregation, ranked by a shared
+    textScore sort. Returns (hits, facets); facets is None unless requested.
+    """
+    branches = [
+        unified.branch(
+            kind, {"$text": {"$search": query}, **active_filter}, projection_name,
+            text_score=True, presort=None if facets else {"score": -1}, limit=limit,
+            facet_fields=facets,
+        )
+        for kind, active_filter, projection_name in (
+            ('product', PRODUCT_ACTIVE_FILTER, 'search.product_hit'),
+            ('livestock', LIVESTOCK_ACTIVE_FILTER, 'search.livestock_hit'),
+        )
+    ]
+    hits_pipeline = [{"$sort": {"score": -1, "_id": 1}}, {"$limit": limit}]
+    if facets:
+        docs, facet_counts = unified.faceted_aggregate(db, *branches, hits_pipeline)
+    else:
+        docs, facet_counts = unified.aggregate(db, *branches, hits_pipeline), None
+    return [(doc['kind'], doc, doc.get('score', 0.0)) for doc in docs], facet_counts
+
+
+def _split_text_search(db, query, limit=10, facets=False):
+    if facets:
+        return faceted_text_search(db, query, limit=limit)
+    return text_search(db, query, limit=limit), None
+
+
+def _regex_queries(query):
+    regex_pattern = {"$regex": re.escape(query), "$options": "i"}
+    product_query = {
+        "$or": [
+            {"title": regex_pattern},
+            {"description": regex_pattern},
+            {"category": regex_pattern},
+            {"name": regex_pattern}
+        ],
+        **PRODUCT_ACTIVE_FILTER
+    }
+    livestock_query = {
+        "$or": [
+            {"breed": regex_pattern},
+            {"name": regex_pattern},
+            {"type": regex_pattern}
+        ],
+        **LIVESTOCK_ACTIVE_FILTER
+    }
+    return product_query, livestock_query
+
+
+def faceted_regex_search(db, query, limit=10):
+    """Regex fallback counterpart of ``faceted_text_search``."""
+    product_query, livestock_query = _regex_queries(query)
+    products, product_facets = facet_utils.faceted_aggregate(
+        db.products, [{"$match": product_query}],
+        [{"$limit": limit}, project_stage('search.product_hit')],
+        'category', ('current_price', 'base_price'),
+    )
+    livestock, livestock_facets = facet_utils.faceted_aggregate(
+        db.livestock, [{"$match": livestock_query}],
+        [{"$limit": limit}, project_stage('search.livestock_hit')],
+        'type', ('current_value', 'purchase_price'),
+    )
+    hits = [('product', p, None) for p in products]
+    hits += [('livestock', l, None) for l in livestock]
+    return hits, facet_utils.merge_facets([product_facets, livestock_facets])
+
+
+def regex_search(db, query, limit=10):
+    """
+    Legacy unanchored regex scan. Collection-scans both collections, so it is
+    only used when the text path fails. Products are listed before livestock.
+    """
+    product_query, livestock_query = _regex_queries(query)
+    products = db.products.find(product_query, projection('search.product_hit')).limit(limit)
+    livestock = db.livestock.find(livestock_query, projection('search.livestock_hit')).limit(limit)
+
+    hits = [('product', p, None) for p in products]
+    hits += [('livestock', l, None) for l in livestock]
+    return hits
+
+
+def union_regex_search(db, query, limit=10, facets=False):
+    """Regex fallback counterpart of ``union_text_search`` (no ranking, one limit)."""
+    product_query, livestock_query = _regex_queries(query)
+    branches = [
+        unified.branch('product', product_query, 'search.product_hit',
+                       presort=None if facets else {"_id": 1}, limit=limit, facet_fields=facets),
+        unified.branch('livestock', livestock_query, 'search.livestock_hit',
+                       presort=None if facets else {"_id": 1}, limit=limit, facet_fields=facets),
+    ]
+    hits_pipeline = [{"$limit": limit}]
+    if facets:
+        docs, facet_counts = unified.faceted_aggregate(db, *branches, hits_pipeline)
+    else:
+        docs, facet_counts = unified.aggregate(db, *branches, hits_pipeline), None
+    return [(doc['kind'], doc, None) for doc in docs], facet_counts
+
+
+def _split_regex_search(db, query, limit=10, facets=False):
+    if facets:
+        return faceted_regex_search(db, query, limit=limit)
+    return regex_search(db, query, limit=limit), None
+
+
+def search(db, query, limit=10, facets=False):
+    """
+    Text search with regex fallback, each as a single union aggregation when
+    the server supports it. The regex scan runs when the text indexes are
+    unavailable, when ``$text`` finds nothing (e.g. a partly typed word) and
+    when no query word reaches MIN_TEXT_TOKEN_LENGTH.
+    Returns (hits, engine_name, facets); facets is None unless requested.
+    """
+    global _text_unavailable_at
+    text_available = (
+        _text_unavailable_at is None or time.time() - _text_unavailable_at >= TEXT_REPROBE_SECONDS
+    )
+    if text_available and has_text_token(query):
+        try:
+            hits, facet_counts = unified.with_fallback(
+                'text_search',
+                lambda: union_text_search(db, query, limit=limit, facets=facets),
+                lambda: _split_text_search(db, query, limit=limit, facets=facets),
+            )
+            _text_unavailable_at = None
+            if hits:
+                return hits, 'text', facet_counts
+        except OperationFailure as e:
+            if e.code in TEXT_INDEX_MISSING_CODES:
+                logger.warning(f"Text indexes missing, using the regex scan for {TEXT_REPROBE_SECONDS:.0f}s: {e}")
+                _text_unavailable_at = time.time()
+            else:
+                logger.warning(f"Text search failed ({e.code}), regex scan for this request: {e}")
+    hits, facet_counts = unified.with_fallback(
+        'regex_search',
+        lambda: union_regex_search(db, query, limit=limit, facets=facets),
+        lambda: _split_regex_search(db, query, limit=limit, facets=facets),
+    )
+    return hits, 'regex', facet_counts
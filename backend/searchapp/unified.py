@@ -0,0 +1,122 @@
+"""
+Products and livestock merged server-side in a single aggregation.
+
+Each collection contributes a branch pipeline that filters it, optionally
+pre-sorts/limits it on its own indexes, and projects onto the card fields plus
+a common set (``kind``, ``sort_value``/``score`` and the facet inputs). The
+livestock branch is attached with ``$unionWith`` and the combined stream is
+sorted and limited once, so one round trip returns a correctly interleaved
+page with a single result cap.
+
+``$unionWith`` needs MongoDB 4.4+. ``with_fallback`` runs the per-collection
+path instead when the aggregation is rejected.
+"""
+
+import logging
+import os
+import time
+
+from pymongo.errors import OperationFailure
+
+from data.projections import projection
+
+from . import facets as facet_utils
+
+logger = logging.getLogger(__name__)
+
+SOURCES = {
+    'product': {
+        'collection': 'products',
+        'category_field': 'category',
+        'price_fields': ('current_price', 'base_price'),
+    },
+    'livestock': {
+        'collection': 'livestock',
+        'category_field': 'type',
+        'price_fields': ('current_value', 'purchase_price'),
+    },
+}
+
+# Unrecognized pipeline stage: the server predates $unionWith
+UNSUPPORTED_STAGE_CODES = (40324,)
+# A server upgrade is picked up by retrying the union this often
+UNION_REPROBE_SECONDS = float(os.getenv('UNION_REPROBE_SECONDS', '3600'))
+
+# Caller name -> when its union pipeline was rejected as unsupported
+_disabled = {}
+
+
+def branch(kind, match, projection_name, sort_field=None, text_score=False,
+           presort=None, limit=None, facet_fields=False):
+    """
+    Pipeline for one side of the union. ``sort_field`` is copied to the
+    shared ``sort_value`` field; ``presort``/``limit`` bound the branch before
+    the merge (leave them out when facets must see every match).
+    """
+    source = SOURCES[kind]
+    stages = [{'$match': match}]
+    if text_score:
+        stages.append({'$addFields': {'score': {'$meta': 'textScore'}}})
+    if presort and limit:
+        stages += [{'$sort': presort}, {'$limit': limit}]
+
+    common = {'kind': {'$literal': kind}}
+    if text_score:
+        common['score'] = 1
+    if sort_field:
+        common['sort_value'] = f'${sort_field}'
+    if facet_fields:
+        common.update(
+            facet_category=f"${source['category_field']}",
+            facet_price=facet_utils.price_expr(source['price_fields']),
+            risk_level=1,
+            location=1,
+        )
+    stages.append({'$project': projection(projection_name, **common)})
+    return stages
+
+
+def aggregate(db, product_branch, livestock_branch, tail):
+    """Run ``product_branch`` unioned with ``livestock_branch``, then ``tail``."""
+    pipeline = product_branch + [
+        {'$unionWith': {'coll': SOURCES['livestock']['collection'], 'pipeline': livestock_branch}},
+    ] + tail
+    return list(db[SOURCES['product']['collection']].aggregate(pipeline))
+
+
+def faceted_aggregate(db, product_branch, livestock_branch, hits_pipeline):
+    """
+    Union plus ``$facet`` over the merged stream. Branches must be built with
+    ``facet_fields=True``. Returns (hit_docs, facets).
+    """
+    tail = [facet_utils.facet_stage(hits_pipeline, 'facet_category', ('facet_price',))]
+    result = next(iter(aggregate(db, product_branch, livestock_branch, tail)), None) or {}
+    return result.pop('hits', []), facet_utils.merge_facets([result])
+
+
+def with_fallback(name, union_call, split_call):
+    """
+    Return ``union_call()``; on OperationFailure return ``split_call()``.
+    Only an unsupported-stage error (old server) makes ``name`` skip the
+    union, and only for UNION_REPROBE_SECONDS; anything else (timeouts,
+    transient errors) falls back for this call alone. Errors from
+    ``split_call`` propagate.
+    """
+    disabled_at = _disabled.get(name)
+    if disabled_at is not None and time.time() - disabled_at < UNION_REPROBE_SECONDS:
+        return split_call()
+    try:
+        result = union_call()
+    except OperationFailure as e:
+        union_error = e
+    else:
+        _disabled.pop(name, None)
+        return result
+    result = split_call()
+    if union_error.code in UNSUPPORTED_STAGE_CODES:
+        logger.warning(f"$unionWith unavailable for {name}, using per-collection queries: {union_error}")
+        _disabled[name] = time.time()
+    else:
+        logger.warning(f"$unionWith failed for {name} ({union_error.code}), per-collection for this request: "
+                       f"{union_error}")
+    return result
@@ -3,7 +3,10 @@ from . import views
 
 urlpatterns = [
     path('', views.global_search, name='global_search'),
+    path('suggest/', views.search_suggestions, name='search_suggestions'),
     path('explore/', views.explore_livestock, name='explore_livestock'),
     path('product/<str:product_id>/', views.get_product_by_id, name='get_product_by_id'),
+    path('products/batch/', views.get_items_batch, name='get_items_batch'),
     path('livestock/<str:animal_id>/', views.get_livestock_by_id, name='get_livestock_by_id'),
+    path('metrics/', views.search_runtime_metrics, name='search_runtime_metrics'),
 ]
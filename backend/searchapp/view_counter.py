@@ -0,0 +1,136 @@
+"""
+Write-behind buffer for listing view counters.
+
+Detail-page hits only bump an in-memory counter. Increments are coalesced per
+listing and flushed with one unordered ``bulk_write`` per collection every
+``VIEW_COUNTER_FLUSH_SECONDS`` or once ``VIEW_COUNTER_FLUSH_HITS`` hits have
+accumulated, whichever comes first. Pending increments are flushed on
+interpreter shutdown and re-queued if a flush fails.
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+FLUSH_SECONDS = float(os.getenv('VIEW_COUNTER_FLUSH_SECONDS', '5'))
+FLUSH_HITS = int(os.getenv('VIEW_COUNTER_FLUSH_HITS', '500'))
+
+
+class ViewCounterBuffer:
+    def __init__(self, flush_seconds=FLUSH_SECONDS, flush_hits=FLUSH_HITS):
+        self.flush_seconds = flush_seconds
+        self.flush_hits = flush_hits
+        self._db = None
+        # (collection_name, id_field, listing_id) -> pending increment
+        self._pending = defaultdict(int)
+        self._pending_hits = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        # Metrics
+        self.total_hits = 0
+        self.total_flushed = 0
+        self.flush_count = 0
+        self.failed_flushes = 0
+        self.last_flush_at = None
+        self.last_flush_ms = 0
+
+    def increment(self, db, collection_name, id_field, listing_id):
+        """Record one view. Never touches the database on the request path."""
+        with self._lock:
+            self._db = db
+            self._pending[(collection_name, id_field, listing_id)] += 1
+            self._pending_hits += 1
+            self.total_hits += 1
+            threshold_reached = self._pending_hits >= self.flush_hits
+        self._ensure_thread()
+        if threshold_reached:
+            self._wake.set()
+
+    def pending(self):
+        """Number of buffered increments not yet written."""
+        return self._pending_hits
+
+    def flush(self):
+        """Write all buffered increments. Returns the number of increments flushed."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch, self._pending = self._pending, defaultdict(int)
+                batch_hits, self._pending_hits = self._pending_hits, 0
+                db = self._db
+
+            started = time.time()
+            by_collection = defaultdict(list)
+            for (collection_name, id_field, listing_id), count in batch.items():
+                by_collection[collection_name].append(
+                    UpdateOne({id_field: listing_id}, {"$inc": {"views": count}})
+                )
+            try:
+                for collection_name, ops in by_collection.items():
+                    db[collection_name].bulk_write(ops, ordered=False)
+            except Exception as e:
+                # Put the increments back so the next flush retries them
+                with self._lock:
+                    for key, count in batch.items():
+                        self._pending[key] += count
+                    self._pending_hits += batch_hits
+                self.failed_flushes += 1
+                logger.error(f"View counter flush failed, {batch_hits} increments re-queued: {e}")
+                return 0
+
+            self.total_flushed += batch_hits
+            self.flush_count += 1
+            self.last_flush_at = time.time()
+            self.last_flush_ms = round((self.last_flush_at - started) * 1000, 2)
+            return batch_hits
+
+    def shutdown(self):
+        self._stopped.set()
+        self._wake.set()
+        self.flush()
+
+    def stats(self):
+        return {
+            'pending_increments': self._pending_hits,
+            'pending_listings': len(self._pending),
+            'total_hits': self.total_hits,
+            'total_flushed': self.total_flushed,
+            'flush_count': self.flush_count,
+            'failed_flushes': self.failed_flushes,
+            'last_flush_at': self.last_flush_at,
+            'last_flush_ms': self.last_flush_ms,
+            'flush_seconds': self.flush_seconds,
+            'flush_hits': self.flush_hits,
+        }
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='view-counter-flusher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"View counter flusher error: {e}")
+
+
+view_counter = ViewCounterBuffer()
+atexit.register(view_counter.shutdown)
@@ -1,9 +1,15 @@
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from pymongo import MongoClient
 import os
+import re
 from dotenv import load_dotenv
+from data.projections import projection, project_stage
+from . import conditional, facets, listing_index, pagination, text_search, unified
+from .fuzzy import fuzzy_search
+from .suggest import suggestion_index
+from .view_counter import view_counter
 
 load_dotenv()
 
@@ -12,89 +18,119 @@ MONGO_URI = os.getenv('MONGO_URI')
 client = MongoClient(MONGO_URI)
 db = client['goatfarm']
 
+
+def _product_hit(p):
+    """Compact search-result shape for a product document"""
+    return {
+        'id': p.get('product_id', str(p.get('_id'))),
+        'type': 'product',
+        'title': p.get('title') or p.get('name', 'Unknown Product'),
+        'description': p.get('description', '')[:100] + '...',
+        'price': float(p.get('current_price', p.get('base_price', 0))),
+        'available_quantity': p.get('quantity', 1),
+        'image_url': p.get('image_url', ''),
+        'category': p.get('category', ''),
+        'url': f"/product/{p.get('product_id', '')}"
+    }
+
+
+def _livestock_hit(l):
+    """Compact search-result shape for a livestock document"""
+    return {
+        'id': l.get('animal_id', str(l.get('_id'))),
+        'type': 'livestock',
+        'title': f"{l.get('name') or l.get('breed', 'Unknown')} ({l.get('type', '').capitalize()})",
+        'description': f"Breed: {l.get('breed', '')}, Age: {l.get('age_months', 0)} months",
+        'price': float(l.get('current_value', l.get('purchase_price', 0))),
+        'available_quantity': 1,
+        'image_url': '', # Could fetch from related product if needed
+        'category': l.get('type', ''),
+        'url': f"/livestock/{l.get('animal_id', '')}"
+    }
+
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def global_search(request):
     """
     Modular global search endpoint using PyMongo.
-    Natively supports searching deeply nested and dynamic schema objects.
+    Results are ranked by MongoDB text-index relevance; the regex scan is used
+    when the text indexes are unavailable or find nothing (partly typed words,
+    very short queries). When neither finds anything
+    (usually a misspelling), the trigram index supplies typo-tolerant matches.
+    Pass ?facets=1 to also get category/risk/location/price counts.
     """
     query = request.query_params.get('q', '').strip()
     if not query or len(query) < 2:
         return Response({'results': []})
 
-    # Case-insensitive regex pattern
-    regex_pattern = {"$regex": query, "$options": "i"}
-
-    # Search Products
-    # Matches title, description, or category where status is active
-    products_cursor = db.products.find({
-        "$or": [
-            {"title": regex_pattern},
-            {"description": regex_pattern},
-            {"category": regex_pattern},
-            {"name": regex_pattern}
-        ],
-        "status": {"$ne": "sold"} # exclude sold if needed, or active
-    }).limit(10)
-
-    # Search Livestock
-    # Matches breed, name, or type
-    livestock_cursor = db.livestock.find({
-        "$or": [
-            {"breed": regex_pattern},
-            {"name": regex_pattern},
-            {"type": regex_pattern}
-        ],
-        "status": "active"
-    }).limit(10)
+    with_facets = facets.wants_facets(request)
+    hits, engine, facet_counts = text_search.search(db, query, limit=10, facets=with_facets)
+    if not hits:
+        fuzzy_hits = fuzzy_search(db, query, limit=10)
+        if fuzzy_hits:
+            # Facet counts (if requested) still describe the literal matches
+            hits, engine = fuzzy_hits, 'fuzzy'
 
     results = []
+    for kind, doc, score in hits:
+        item = _product_hit(doc) if kind == 'product' else _livestock_hit(doc)
+        if score is not None:
+            item['score'] = round(score, 3)
+        results.append(item)
 
-    for p in products_cursor:
-        results.append({
-            'id': p.get('product_id', str(p.get('_id'))),
-            'type': 'product',
-            'title': p.get('title') or p.get('name', 'Unknown Product'),
-            'description': p.get('description', '')[:100] + '...',
-            'price': float(p.get('current_price', p.get('base_price', 0))),
-            'available_quantity': p.get('quantity', 1),
-            'image_url': p.get('image_url', ''),
-            'category': p.get('category', ''),
-            'url': f"/product/{p.get('product_id', '')}"
-        })
+    payload = {'results': results, 'engine': engine}
+    if with_facets:
+        payload['facets'] = facet_counts
+    return Response(payload)
 
-    for l in livestock_cursor:
-        results.append({
-            'id': l.get('animal_id', str(l.get('_id'))),
-            'type': 'livestock',
-            'title': f"{l.get('name') or l.get('breed', 'Unknown')} ({l.get('type', '').capitalize()})",
-            'description': f"Breed: {l.get('breed', '')}, Age: {l.get('age_months', 0)} months",
-            'price': float(l.get('current_value', l.get('purchase_price', 0))),
-            'available_quantity': 1,
-            'image_url': '', # Could fetch from related product if needed
-            'category': l.get('type', ''),
-            'url': f"/livestock/{l.get('animal_id', '')}"
-        })
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def search_suggestions(request):
+    """
+    Prefix autocomplete for the search bar.
+    Served from the in-memory suggestion trie; no database round trip once loaded.
+    ``limit`` is clamped to 1..top_k, the number of suggestions each trie node keeps.
+    """
+    prefix = request.query_params.get('q', '').strip()
+    if not prefix:
+        return Response({'suggestions': []})
+    try:
+        limit = int(request.query_params.get('limit', 8))
+    except ValueError:
+        limit = 8
 
-    return Response({'results': results})
+    listing_index.ensure_loaded(db)
+    return Response({'suggestions': suggestion_index.suggest(prefix, limit=limit)})
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def get_product_by_id(request, product_id):
-    """Fetch a single product by its product_id using PyMongo"""
+    """
+    Fetch a single product by its product_id using PyMongo.
+    Supports conditional GET (ETag / Last-Modified), answering 304 when unchanged.
+    """
     try:
-        p = db.products.find_one({"product_id": product_id})
+        p = db.products.find_one({"product_id": product_id}, projection('detail.product'))
         if not p:
             return Response({'error': 'Product not found'}, status=404)
             
-        # Increment views for analytics
-        db.products.update_one({"product_id": product_id}, {"$inc": {"views": 1}})
+        # Increment views for analytics (buffered, flushed in bulk off the request path)
+        view_counter.increment(db, 'products', 'product_id', product_id)
+
+        # Unchanged since the client's copy: skip the related-animal lookup and serialization.
+        # The ETag tracks the product only; the embedded animal summary refreshes on the next product write.
+        etag, last_modified = conditional.validators(product_id, p)
+        cached = conditional.not_modified(request, etag, last_modified)
+        if cached is not None:
+            return cached
             
         # Optional: Fetch related livestock info if available
         related_animal = None
         if p.get('animal_id'):
-            related_animal = db.livestock.find_one({"animal_id": p.get('animal_id')})
+            related_animal = db.livestock.find_one(
+                {"animal_id": p.get('animal_id')}, projection('detail.related_animal')
+            )
 
         result = {
             'id': p.get('product_id', str(p.get('_id'))),
@@ -127,7 +163,7 @@ def get_product_by_id(request, product_id):
                 'gender': related_animal.get('gender')
             }
             
-        return Response(result)
+        return conditional.set_validators(Response(result), etag, last_modified)
     except Exception as e:
         return Response({'error': str(e)}, status=500)
 
@@ -135,14 +171,22 @@ def get_product_by_id(request, product_id):
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def get_livestock_by_id(request, animal_id):
-    """Fetch a single livestock record by its animal_id using PyMongo"""
+    """
+    Fetch a single livestock record by its animal_id using PyMongo.
+    Supports conditional GET (ETag / Last-Modified), answering 304 when unchanged.
+    """
     try:
-        l = db.livestock.find_one({"animal_id": animal_id})
+        l = db.livestock.find_one({"animal_id": animal_id}, projection('detail.livestock'))
         if not l:
             return Response({'error': 'Livestock not found'}, status=404)
             
-        # Increment views for analytics
-        db.livestock.update_one({"animal_id": animal_id}, {"$inc": {"views": 1}})
+        # Increment views for analytics (buffered, flushed in bulk off the request path)
+        view_counter.increment(db, 'livestock', 'animal_id', animal_id)
+
+        etag, last_modified = conditional.validators(animal_id, l)
+        cached = conditional.not_modified(request, etag, last_modified)
+        if cached is not None:
+            return cached
             
         result = {
             'id': l.get('animal_id', str(l.get('_id'))),
@@ -165,74 +209,302 @@ def get_livestock_by_id(request, animal_id):
             'owner_id': l.get('owner_id'),
             'purchase_date': l.get('purchase_date')
         }
-        return Response(result)
+        return conditional.set_validators(Response(result), etag, last_modified)
     except Exception as e:
         return Response({'error': str(e)}, status=500)
 
+BATCH_MAX_IDS = 100
+
+
+def _batch_item(kind, doc):
+    """Lean cart/checkout shape; same id, title and price rules as the detail views"""
+    if kind == 'product':
+        return {
+            'id': doc.get('product_id', str(doc.get('_id'))),
+            'type': 'product',
+            'title': doc.get('title') or doc.get('name', 'Unknown Product'),
+            'price': float(doc.get('current_price', doc.get('base_price', 0))),
+            'available_quantity': doc.get('quantity', 1),
+            'image_url': doc.get('image_url', ''),
+            'category': doc.get('category', ''),
+            'status': doc.get('status', 'active'),
+        }
+    return {
+        'id': doc.get('animal_id', str(doc.get('_id'))),
+        'type': 'livestock',
+        'title': f"{doc.get('name') or doc.get('breed', 'Unknown')} ({doc.get('type', '').capitalize()})",
+        'price': float(doc.get('current_value', doc.get('purchase_price', 0))),
+        'available_quantity': 1,
+        'image_url': '',
+        'category': doc.get('type', ''),
+        'status': doc.get('status', 'active'),
+    }
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def get_items_batch(request):
+    """
+    Hydrate a cart/checkout in one round trip.
+    Body: {"ids": ["<product_id or animal_id>", ...]} (at most BATCH_MAX_IDS).
+    Results come back in request order; unknown ids are listed under 'missing'.
+    Unlike the detail endpoints this does not count as a view.
+    """
+    ids = request.data.get('ids')
+    if not isinstance(ids, list) or not all(isinstance(i, str) and i for i in ids):
+        return Response({'error': "'ids' must be a list of id strings"}, status=400)
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > BATCH_MAX_IDS:
+        return Response({'error': f"At most {BATCH_MAX_IDS} ids per request"}, status=400)
+    if not ids:
+        return Response({'results': [], 'missing': []})
+
+    def union_lookup():
+        return unified.aggregate(
+            db,
+            unified.branch('product', {"product_id": {"$in": ids}}, 'batch.product'),
+            unified.branch('livestock', {"animal_id": {"$in": ids}}, 'batch.livestock'),
+            [],
+        )
+
+    def split_lookup():
+        docs = []
+        for kind, collection, id_field, projection_name in (
+            ('product', db.products, 'product_id', 'batch.product'),
+            ('livestock', db.livestock, 'animal_id', 'batch.livestock'),
+        ):
+            for doc in collection.find({id_field: {"$in": ids}}, projection(projection_name)):
+                doc['kind'] = kind
+                docs.append(doc)
+        return docs
+
+    try:
+        found = {}
+        for doc in unified.with_fallback('batch', union_lookup, split_lookup):
+            item = _batch_item(doc['kind'], doc)
+            found.setdefault(item['id'], item)
+        return Response({
+            'results': [found[i] for i in ids if i in found],
+            'missing': [i for i in ids if i not in found],
+        })
+    except Exception as e:
+        return Response({'error': str(e)}, status=500)
+
+# Sortable explore-feed keys -> (products field, livestock field)
+EXPLORE_SORT_FIELDS = {
+    'created_at': ('created_at', 'created_at'),
+    'price': ('current_price', 'current_value'),
+    'views': ('views', 'views'),
+}
+EXPLORE_DEFAULT_LIMIT = 24
+EXPLORE_MAX_LIMIT = 100
+
+
+def explore_sort_indexes(db):
+    """
+    (collection, prefix_fields, sort_field) for each compound index behind an
+    explore sort; created by ``python manage.py create_search_indexes``.
+    """
+    return [
+        (collection, ['status'], field)
+        for fields in EXPLORE_SORT_FIELDS.values()
+        for collection, field in zip((db.products, db.livestock), fields)
+    ]
+
+
+def _explore_product_card(p):
+    return {
+        'id': p.get('product_id', str(p.get('_id'))),
+        'type': 'product',
+        'title': p.get('title') or p.get('name', 'Unknown Product'),
+        'description': p.get('description', '')[:100] + '...',
+        'price': float(p.get('current_price', p.get('base_price', 0))),
+        'available_quantity': p.get('quantity', 1),
+        'image_url': p.get('image_url', ''),
+        'category': p.get('category', ''),
+        # Map properties for generic ProductCard usage
+        'animalType': p.get('category', '').capitalize(),
+        'age': 'N/A',
+        'weight': 'N/A',
+        'health': 'N/A',
+        'use': 'Product/Asset',
+        'url': f"/product/{p.get('product_id', '')}"
+    }
+
+
+def _explore_livestock_card(l):
+    return {
+        'id': l.get('animal_id', str(l.get('_id'))),
+        'type': 'livestock',
+        'title': f"{l.get('name') or l.get('breed', 'Unknown')} ({l.get('type', '').capitalize()})",
+        'description': f"Breed: {l.get('breed', '')}",
+        'price': float(l.get('current_value', l.get('purchase_price', 0))),
+        'available_quantity': 1,
+        'image_url': '',
+        'category': l.get('type', ''),
+        # Farm specific stats for the grid card
+        'animalType': l.get('type', '').capitalize(),
+        'age': f"{l.get('age_months', 0)} Months",
+        'weight': f"{l.get('current_weight', 0)} kg",
+        'health': l.get('health_status', 'Unknown').capitalize(),
+        'use': 'Farming/Breeding',
+        'url': f"/livestock/{l.get('animal_id', '')}"
+    }
+
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def explore_livestock(request):
     """
     Fetch livestock and products for the Buy Stocks page.
-    Supports optional ?category= filter (e.g. 'goat', 'chicken', 'buffalo').
+    Supports optional ?category= filter (e.g. 'goat', 'chicken', 'buffalo'),
+    ?sort=created_at|price|views, ?order=desc|asc and ?limit=.
+    Both collections are merged, sorted and limited in a single aggregation.
+    Pages are keyset-paginated: pass the returned next_cursor back as ?cursor=.
+    ?facets=1 on the first page adds facet counts computed in the same query.
     """
-    category_filter = request.query_params.get('category', '').strip().lower()
-    
-    results = []
+    token = request.query_params.get('cursor', '').strip()
+    try:
+        if token:
+            state = pagination.decode_cursor(token)
+            category_filter = state.get('c', '')
+            sort = state.get('s', 'created_at')
+            descending = state.get('d', True)
+            limit = int(state.get('n', EXPLORE_DEFAULT_LIMIT))
+            position = state.get('k')
+            if not (isinstance(category_filter, str) and isinstance(sort, str) and isinstance(descending, bool)):
+                raise pagination.InvalidCursor("Malformed cursor")
+            if not isinstance(position, list) or len(position) != 2:
+                raise pagination.InvalidCursor("Malformed cursor position")
+        else:
+            category_filter = request.query_params.get('category', '').strip().lower()
+            sort = request.query_params.get('sort', 'created_at').strip()
+            descending = request.query_params.get('order', 'desc').strip().lower() != 'asc'
+            limit = int(request.query_params.get('limit', EXPLORE_DEFAULT_LIMIT))
+            position = None
+    except (pagination.InvalidCursor, ValueError, TypeError):
+        return Response({'error': 'Invalid cursor or limit'}, status=400)
+
+    if sort not in EXPLORE_SORT_FIELDS:
+        return Response({'error': f"Unsupported sort '{sort}'"}, status=400)
+    limit = max(1, min(limit, EXPLORE_MAX_LIMIT))
+    product_field, livestock_field = EXPLORE_SORT_FIELDS[sort]
 
     # Query setup
     product_query = {"status": {"$ne": "sold"}}
     livestock_query = {"status": "active"}
 
     if category_filter and category_filter != 'all':
-        # Apply regex filter to categories/types
-        regex = {"$regex": f"^{category_filter}$", "$options": "i"}
+        # Categories are free text ("Dairy Cow"); the sort still walks the (status, field, _id) index
+        regex = {"$regex": f"^{re.escape(category_filter)}$", "$options": "i"}
         product_query["category"] = regex
         livestock_query["type"] = regex
 
+    sources = [
+        ('product', db.products, product_query, product_field, 'explore.product_card',
+         ('category', ('current_price', 'base_price'))),
+        ('livestock', db.livestock, livestock_query, livestock_field, 'explore.livestock_card',
+         ('type', ('current_value', 'purchase_price'))),
+    ]
+    # Facets describe the whole filtered set, so they only make sense on page one
+    with_facets = facets.wants_facets(request) and not token
+    # One row past the page tells us whether another page exists
+    fetch = limit + 1
+
+    # Both collections share one (sort value, _id) position: the merged order
+    # is by that pair, so "after the last card" is the same filter on each side
+    queries = {}
+    for kind, _, query, field, *_ in sources:
+        if position:
+            last_value, last_id = position
+            query = {"$and": [query, pagination.keyset_filter(field, last_value, last_id, descending)]}
+        queries[kind] = query
+
+    def union_page():
+        branches = [
+            unified.branch(
+                kind, queries[kind], projection_name, sort_field=field,
+                presort=None if with_facets else dict(pagination.sort_spec(field, descending)),
+                limit=fetch, facet_fields=with_facets,
+            )
+            for kind, _, _, field, projection_name, _ in sources
+        ]
+        hits_pipeline = [
+            {"$sort": dict(pagination.sort_spec('sort_value', descending))},
+            {"$limit": fetch},
+        ]
+        if with_facets:
+            return unified.faceted_aggregate(db, *branches, hits_pipeline)
+        return unified.aggregate(db, *branches, hits_pipeline), None
+
+    def split_page():
+        docs = []
+        raw_facets = []
+        for kind, collection, _, field, projection_name, facet_fields in sources:
+            if with_facets:
+                hits_pipeline = [
+                    {"$sort": dict(pagination.sort_spec(field, descending))},
+                    {"$limit": fetch},
+                    project_stage(projection_name),
+                ]
+                hits, raw = facets.faceted_aggregate(
+                    collection, [{"$match": queries[kind]}], hits_pipeline, *facet_fields
+                )
+                raw_facets.append(raw)
+            else:
+                hits = (
+                    collection.find(queries[kind], projection(projection_name))
+                    .sort(pagination.sort_spec(field, descending))
+                    .limit(fetch)
+                )
+            for doc in hits:
+                doc['kind'] = kind
+                doc['sort_value'] = doc.get(field)
+                docs.append(doc)
+        docs.sort(key=lambda d: pagination.sort_key(d['sort_value'], d['_id']), reverse=descending)
+        return docs[:fetch], facets.merge_facets(raw_facets) if with_facets else None
+
     try:
-        # Fetch matching active products
-        products_cursor = db.products.find(product_query).limit(50)
-        for p in products_cursor:
-            results.append({
-                'id': p.get('product_id', str(p.get('_id'))),
-                'type': 'product',
-                'title': p.get('title') or p.get('name', 'Unknown Product'),
-                'description': p.get('description', '')[:100] + '...',
-                'price': float(p.get('current_price', p.get('base_price', 0))),
-                'available_quantity': p.get('quantity', 1),
-                'image_url': p.get('image_url', ''),
-                'category': p.get('category', ''),
-                # Map properties for generic ProductCard usage
-                'animalType': p.get('category', '').capitalize(),
-                'age': 'N/A',
-                'weight': 'N/A',
-                'health': 'N/A',
-                'use': 'Product/Asset',
-                'url': f"/product/{p.get('product_id', '')}"
-            })
+        docs, facet_counts = unified.with_fallback('explore', union_page, split_page)
+
+        page = docs[:limit]
+        has_more = len(docs) > limit
+        results = [
+            _explore_product_card(doc) if doc['kind'] == 'product' else _explore_livestock_card(doc)
+            for doc in page
+        ]
 
-        # Fetch matching active livestock
-        livestock_cursor = db.livestock.find(livestock_query).limit(50)
-        for l in livestock_cursor:
-            results.append({
-                'id': l.get('animal_id', str(l.get('_id'))),
-                'type': 'livestock',
-                'title': f"{l.get('name') or l.get('breed', 'Unknown')} ({l.get('type', '').capitalize()})",
-                'description': f"Breed: {l.get('breed', '')}",
-                'price': float(l.get('current_value', l.get('purchase_price', 0))),
-                'available_quantity': 1,
-                'image_url': '',
-                'category': l.get('type', ''),
-                # Farm specific stats for the grid card
-                'animalType': l.get('type', '').capitalize(),
-                'age': f"{l.get('age_months', 0)} Months",
-                'weight': f"{l.get('current_weight', 0)} kg",
-                'health': l.get('health_status', 'Unknown').capitalize(),
-                'use': 'Farming/Breeding',
-                'url': f"/livestock/{l.get('animal_id', '')}"
+        next_cursor = None
+        if has_more:
+            last = page[-1]
+            next_cursor = pagination.encode_cursor({
+                'c': category_filter, 's': sort, 'd': descending, 'n': limit,
+                'k': [last.get('sort_value'), last['_id']],
             })
-            
-        return Response({'results': results})
+
+        payload = {
+            'results': results,
+            'next_cursor': next_cursor,
+            'has_more': has_more,
+        }
+        if with_facets:
+            payload['facets'] = facet_counts
+        return Response(payload)
     except Exception as e:
         return Response({'error': str(e)}, status=500)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def search_runtime_metrics(request):
+    """
+    In-process search metrics (view-counter buffer, listing indexes).
+    Values are per worker process. Restricted to superusers/admins.
+    """
+    if not request.user.is_superuser and request.user.username != 'admin':
+        return Response({'error': 'Admin access required'}, status=403)
+
+    return Response({
+        'view_counter': view_counter.stats(),
+        'listing_indexes': listing_index.stats(),
+    })
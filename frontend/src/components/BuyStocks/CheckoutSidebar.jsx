@@ -1,6 +1,7 @@
-import React, { useState } from 'react';
+import React, { useEffect, useState } from 'react';
 import { useNavigate } from 'react-router-dom';
-import { useCart } from '../../context/CartContext';
+import { useCart, unavailableItems } from '../../context/CartContext';
+import SearchService from '../../services/SearchService';
 import AddCircleOutlineIcon from '@mui/icons-material/AddCircleOutline';
 import RemoveCircleOutlineIcon from '@mui/icons-material/RemoveCircleOutline';
 import CloseIcon from '@mui/icons-material/Close';
@@ -48,8 +49,24 @@ const CartItem = ({ item, updateQuantity, removeFromCart }) => {
 
 const CheckoutSidebar = () => {
     const navigate = useNavigate();
-    const { cartItems, updateQuantity, removeFromCart, getCartTotal } = useCart();
+    const { cartItems, updateQuantity, removeFromCart, refreshItems, getCartTotal } = useCart();
     const [selectedPayment, setSelectedPayment] = useState('esewa');
+    const [notice, setNotice] = useState('');
+
+    // Prices and stock may have moved since items were added; refresh them in one request
+    useEffect(() => {
+        if (cartItems.length === 0) return;
+        SearchService.getItemsBatch(cartItems.map(i => i.id))
+            .then(batch => {
+                const removed = unavailableItems(cartItems, batch);
+                if (removed.length > 0) {
+                    setNotice(`No longer available: ${removed.map(i => i.title).join(', ')}`);
+                }
+                refreshItems(batch);
+            });
+        // Only when the cart page opens; refreshItems itself updates cartItems
+        // eslint-disable-next-line react-hooks/exhaustive-deps
+    }, []);
 
     const subtotal = getCartTotal();
     const platformFee = subtotal * 0.05;
@@ -62,6 +79,7 @@ const CheckoutSidebar = () => {
                 <ShoppingCartIcon sx={{ fontSize: 60 }} className="text-gray-200 mb-4" />
                 <h3 className="font-serif font-bold text-xl text-gray-800 mb-2">Cart is empty</h3>
                 <p className="text-gray-400 text-sm mb-6">Add livestock or products to start investing.</p>
+                {notice && <p className="text-xs text-red-600 mb-6">{notice}</p>}
                 <button 
                     onClick={() => {}} // Could potentially close sidebar or focus catalog
                     className="w-full bg-gray-100 text-gray-500 font-bold py-3 rounded-full cursor-not-allowed"
@@ -76,6 +94,10 @@ const CheckoutSidebar = () => {
         <div className="bg-white p-6 rounded-3xl h-full flex flex-col">
             <h3 className="font-serif font-bold text-xl text-gray-800 mb-6">Checkout Cart</h3>
 
+            {notice && (
+                <p className="text-xs text-red-600 bg-red-50 border border-red-100 rounded-lg p-2 mb-4">{notice}</p>
+            )}
+
             {/* Cart Items */}
             <div className="flex-1 overflow-y-auto mb-6 pr-2 custom-scrollbar">
                 {cartItems.map(item => (
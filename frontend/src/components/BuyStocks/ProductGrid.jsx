@@ -100,13 +100,16 @@ const ProductCard = ({ product }) => {
 const ProductGrid = ({ selectedCategory }) => {
     const [products, setProducts] = useState([]);
     const [loading, setLoading] = useState(true);
+    const [nextCursor, setNextCursor] = useState(null);
+    const [loadingMore, setLoadingMore] = useState(false);
 
     useEffect(() => {
         const fetchProducts = async () => {
             setLoading(true);
             try {
-                const data = await SearchService.explore(selectedCategory);
-                setProducts(data);
+                const page = await SearchService.explorePage(selectedCategory);
+                setProducts(page.results);
+                setNextCursor(page.nextCursor);
             } catch (error) {
                 console.error("Failed to load products");
             } finally {
@@ -117,6 +120,18 @@ const ProductGrid = ({ selectedCategory }) => {
         fetchProducts();
     }, [selectedCategory]);
 
+    const loadMore = async () => {
+        if (!nextCursor) return;
+        setLoadingMore(true);
+        try {
+            const page = await SearchService.explorePage(selectedCategory, nextCursor);
+            setProducts(prev => [...prev, ...page.results]);
+            setNextCursor(page.nextCursor);
+        } finally {
+            setLoadingMore(false);
+        }
+    };
+
     return (
         <div className="bg-blue-50/50 p-6 rounded-3xl min-h-[400px]">
             <div className="flex justify-between items-center mb-6">
@@ -133,6 +148,15 @@ const ProductGrid = ({ selectedCategory }) => {
                     {products.map(p => (
                         <ProductCard key={p.id} product={p} />
                     ))}
+                    {nextCursor && (
+                        <button
+                            onClick={loadMore}
+                            disabled={loadingMore}
+                            className="mx-auto text-sm font-bold py-2.5 px-6 rounded-full bg-white text-green-700 border border-green-200 hover:bg-green-50 transition-all disabled:opacity-50"
+                        >
+                            {loadingMore ? 'Loading...' : 'Load more'}
+                        </button>
+                    )}
                 </div>
             ) : (
                 <div className="flex flex-col items-center justify-center h-64 text-gray-400">
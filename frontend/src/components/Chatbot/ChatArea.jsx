@@ -81,37 +81,72 @@ const ChatArea = ({ chat, onUpdateTitle, onUpdateMessages, onLoginClick, user })
         abortControllerRef.current = new AbortController();
 
         try {
-            // 3. Call API
+            // 3. Call API (server-sent events: tokens arrive while the model is generating)
             const token = localStorage.getItem('token');
             const backendUrl = '/api/chatbot/api/';
-            const response = await axios.post(backendUrl, {
-                message: messageText,
-                session_id: chat.sessionId // Send sessionId if it exists
-            }, {
+            const response = await fetch(backendUrl, {
+                method: 'POST',
                 signal: abortControllerRef.current.signal,
-                headers: token ? { 'Authorization': `Bearer ${token}` } : {}
+                headers: {
+                    'Content-Type': 'application/json',
+                    'Accept': 'text/event-stream',
+                    ...(token ? { 'Authorization': `Bearer ${token}` } : {})
+                },
+                body: JSON.stringify({
+                    message: messageText,
+                    session_id: chat.sessionId, // Send sessionId if it exists
+                    stream: true
+                })
             });
+            if (!response.ok || !response.body) {
+                throw new Error(`HTTP ${response.status}`);
+            }
 
-            // 4. Add Bot Response
-            console.log("Chat API Response:", response.data);
-            if (response.data && response.data.response) {
-                const botMsg = { text: response.data.response, sender: 'bot' };
-                // Pass new sessionId to parent if it changed
-                console.log("Updating messages with session_id:", response.data.session_id);
-                onUpdateMessages(chat.id, [...updatedMessages, botMsg], response.data.session_id);
-            } else {
-                const errorMsg = { text: "Sorry, I received an empty response.", sender: 'bot' };
-                onUpdateMessages(chat.id, [...updatedMessages, errorMsg]);
+            // 4. Grow the bot message as tokens arrive, then swap in the final text (with any table)
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let streamedText = '';
+            let finished = false;
+
+            while (!finished) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+
+                const events = buffer.split('\n\n');
+                buffer = events.pop();
+                for (const raw of events) {
+                    const eventLine = raw.split('\n').find(l => l.startsWith('event: '));
+                    const dataLine = raw.split('\n').find(l => l.startsWith('data: '));
+                    if (!eventLine || !dataLine) continue;
+                    const event = eventLine.slice(7);
+                    const payload = JSON.parse(dataLine.slice(6));
+
+                    if (event === 'token') {
+                        streamedText += payload.text;
+                        onUpdateMessages(chat.id, [...updatedMessages, { text: streamedText, sender: 'bot' }]);
+                    } else if (event === 'done') {
+                        console.log("Chat API Response:", payload);
+                        const botMsg = { text: payload.response || "Sorry, I received an empty response.", sender: 'bot' };
+                        // Pass new sessionId to parent if it changed
+                        onUpdateMessages(chat.id, [...updatedMessages, botMsg], payload.session_id);
+                        finished = true;
+                    } else if (event === 'error') {
+                        const errorMsg = { text: payload.response, sender: 'bot' };
+                        onUpdateMessages(chat.id, [...updatedMessages, errorMsg]);
+                        finished = true;
+                    }
+                }
             }
         } catch (error) {
-            if (axios.isCancel(error)) {
+            if (error.name === 'AbortError') {
                 console.log('Request canceled', error.message);
                 // We handled the UI update in handleStop, so nothing else needed here
             } else {
                 console.error("Chat API Error:", error);
                 const backendUrl = `http://127.0.0.1:8000/api/chatbot/api/`;
-                const errorText = error.response?.data?.response ||
-                    `Connection Error: Failed to reach ${backendUrl}. ${error.message}`;
+                const errorText = `Connection Error: Failed to reach ${backendUrl}. ${error.message}`;
                 const errorMsg = { text: errorText, sender: 'bot' };
                 onUpdateMessages(chat.id, [...updatedMessages, errorMsg]);
             }
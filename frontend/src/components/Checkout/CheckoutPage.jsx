@@ -1,8 +1,9 @@
-import React, { useState } from 'react';
+import React, { useEffect, useState } from 'react';
 import { useNavigate } from 'react-router-dom';
 import axios from 'axios';
-import { useCart } from '../../context/CartContext';
+import { useCart, unavailableItems } from '../../context/CartContext';
 import { useAuth } from '../../context/AuthContext';
+import SearchService from '../../services/SearchService';
 import KeyboardArrowLeftIcon from '@mui/icons-material/KeyboardArrowLeft';
 import CheckCircleOutlineIcon from '@mui/icons-material/CheckCircleOutline';
 import AddCircleOutlineIcon from '@mui/icons-material/AddCircleOutline';
@@ -14,7 +15,7 @@ import KYCGuardModal from '../KYC/KYCGuardModal';
 const CheckoutPage = () => {
     const navigate = useNavigate();
     const { user } = useAuth();
-    const { cartItems, updateQuantity, removeFromCart, clearCart, getCartTotal } = useCart();
+    const { cartItems, updateQuantity, removeFromCart, refreshItems, clearCart, getCartTotal } = useCart();
 
     const [selectedPayment, setSelectedPayment] = useState('esewa');
     const [isProcessing, setIsProcessing] = useState(false);
@@ -27,6 +28,21 @@ const CheckoutPage = () => {
 
     const [showKYCGuard, setShowKYCGuard] = useState(false);
 
+    // Re-hydrate prices and stock for the whole cart in one request
+    useEffect(() => {
+        if (cartItems.length === 0) return;
+        SearchService.getItemsBatch(cartItems.map(i => i.id))
+            .then(batch => {
+                const removed = unavailableItems(cartItems, batch);
+                if (removed.length > 0) {
+                    setError(`No longer available and removed from your cart: ${removed.map(i => i.title).join(', ')}`);
+                }
+                refreshItems(batch);
+            });
+        // Only on entering checkout; refreshItems itself updates cartItems
+        // eslint-disable-next-line react-hooks/exhaustive-deps
+    }, []);
+
     const handlePayment = async () => {
         if (cartItems.length === 0) return;
 
@@ -95,6 +111,7 @@ const CheckoutPage = () => {
                     <ShoppingCartIcon sx={{ fontSize: 80 }} className="text-gray-200 mb-4" />
                     <h2 className="text-2xl font-bold text-gray-800 mb-2">Your cart is empty</h2>
                     <p className="text-gray-400 mb-8">Add some livestock or products from the marketplace.</p>
+                    {error && <p className="text-sm text-red-600 mb-8">{error}</p>}
                     <button
                         onClick={() => navigate('/buy-stocks')}
                         className="w-full bg-green-700 text-white font-bold py-3 rounded-xl hover:bg-green-800 transition-colors"
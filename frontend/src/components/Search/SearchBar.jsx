@@ -55,9 +55,9 @@ const SearchBar = () => {
             
             setIsSearching(true);
             try {
-                const results = await SearchService.search(searchQuery.trim());
                 // Only take top 5 suggestions to keep dropdown clean
-                setSuggestions(results.slice(0, 5));
+                const results = await SearchService.suggest(searchQuery.trim(), 5);
+                setSuggestions(results);
             } catch (error) {
                 console.error('Failed to fetch suggestions', error);
                 setSuggestions([]);
@@ -108,14 +108,8 @@ const SearchBar = () => {
     };
 
     const handleSuggestionClick = (suggestion) => {
-        saveToHistory(suggestion.title || suggestion.name);
-        setIsFocused(false);
-        
-        if (suggestion.type === 'product') {
-            navigate(`/product/${suggestion.id || suggestion.product_id}`);
-        } else if (suggestion.type === 'livestock') {
-            navigate(`/livestock/${suggestion.id || suggestion.animal_id}`);
-        }
+        // Suggestions are search terms, so picking one runs the full search
+        handleHistoryClick(suggestion.text);
     };
 
     // Determine what to show in the dropdown
@@ -213,10 +207,10 @@ const SearchBar = () => {
                                             )}
                                             <div className="flex flex-col min-w-0">
                                                 <span className="text-sm font-medium text-gray-800 truncate">
-                                                    {suggestion.title || suggestion.name}
+                                                    {suggestion.text}
                                                 </span>
                                                 <span className="text-xs text-gray-500 capitalize">
-                                                    {suggestion.type} {suggestion.category ? `• ${suggestion.category}` : ''}
+                                                    {suggestion.type} {suggestion.count > 1 ? `• ${suggestion.count} listings` : ''}
                                                 </span>
                                             </div>
                                         </li>
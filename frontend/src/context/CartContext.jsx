@@ -2,6 +2,13 @@ import React, { createContext, useContext, useState, useCallback } from 'react';
 
 const CartContext = createContext(null);
 
+// Cart items a batch lookup reports as gone (unknown id) or sold. Ids absent from both lists are
+// kept: getItemsBatch returns empty lists when the request itself fails.
+export const unavailableItems = (items, { results, missing = [] }) => {
+    const gone = new Set([...missing, ...results.filter(f => f.status === 'sold').map(f => f.id)]);
+    return items.filter(i => gone.has(i.id));
+};
+
 export const CartProvider = ({ children }) => {
     const [cartItems, setCartItems] = useState([]);
 
@@ -34,6 +41,21 @@ export const CartProvider = ({ children }) => {
         );
     }, []);
 
+    // Apply a batch lookup ({ results, missing }): fresh price/stock with quantities clamped to
+    // what is left, and unavailable items dropped
+    const refreshItems = useCallback((batch) => {
+        const byId = new Map(batch.results.map(f => [f.id, f]));
+        setCartItems(prev => {
+            const unavailable = new Set(unavailableItems(prev, batch).map(i => i.id));
+            return prev.filter(i => !unavailable.has(i.id)).map(i => {
+                const fresh = byId.get(i.id);
+                if (!fresh) return i;
+                const maxQty = fresh.available_quantity || 1;
+                return { ...i, price: fresh.price, available_quantity: maxQty, quantity: Math.min(i.quantity, maxQty) };
+            });
+        });
+    }, []);
+
     const clearCart = useCallback(() => {
         setCartItems([]);
     }, []);
@@ -43,7 +65,7 @@ export const CartProvider = ({ children }) => {
     const getCartTotal = () => cartItems.reduce((sum, i) => sum + (i.price * i.quantity), 0);
 
     return (
-        <CartContext.Provider value={{ cartItems, addToCart, removeFromCart, updateQuantity, clearCart, getCartCount, getCartTotal }}>
+        <CartContext.Provider value={{ cartItems, addToCart, removeFromCart, updateQuantity, refreshItems, clearCart, getCartCount, getCartTotal }}>
             {children}
         </CartContext.Provider>
     );
@@ -23,6 +23,25 @@ const SearchService = {
         }
     },
 
+    /**
+     * Prefix autocomplete served from the backend's in-memory suggestion trie
+     * @param {string} prefix - What the user has typed so far
+     * @returns {Promise<Array>} - [{ text, type, count }]
+     */
+    async suggest(prefix, limit = 8) {
+        if (!prefix || !prefix.trim()) return [];
+
+        try {
+            const response = await axios.get(`${API_BASE_URL}/search/suggest/`, {
+                params: { q: prefix, limit }
+            });
+            return response.data.suggestions || [];
+        } catch (error) {
+            console.error('Suggest error:', error);
+            return [];
+        }
+    },
+
     /**
      * Fetch a single product by ID
      */
@@ -49,6 +68,27 @@ const SearchService = {
         }
     },
 
+    /**
+     * Fetch many products/livestock items in one request (cart & checkout hydration).
+     * Does not count as a product view.
+     * @param {Array<string>} ids product_id / animal_id values
+     * @returns {Promise<{results: Array, missing: Array<string>}>}
+     */
+    async getItemsBatch(ids) {
+        if (!ids || ids.length === 0) return { results: [], missing: [] };
+
+        try {
+            const response = await axios.post(`${API_BASE_URL}/search/products/batch/`, { ids });
+            return {
+                results: response.data.results || [],
+                missing: response.data.missing || []
+            };
+        } catch (error) {
+            console.error('Batch lookup error:', error);
+            return { results: [], missing: [] };
+        }
+    },
+
     /**
      * Fetch products and livestock for the Explore/Buy Stocks page
      * @param {string} category Optional category filter
@@ -63,6 +103,29 @@ const SearchService = {
             console.error('Explore error:', error);
             return [];
         }
+    },
+
+    /**
+     * Fetch one keyset-paginated page of the Explore feed
+     * @param {string} category Optional category filter
+     * @param {string|null} cursor next_cursor from the previous page (null for page one)
+     * @param {object} options { sort: 'created_at'|'price'|'views', order: 'desc'|'asc', limit }
+     * @returns {Promise<{results: Array, nextCursor: string|null}>}
+     */
+    async explorePage(category = '', cursor = null, options = {}) {
+        try {
+            const params = cursor
+                ? { cursor }
+                : { category: category === 'All' ? '' : category, ...options };
+            const response = await axios.get(`${API_BASE_URL}/search/explore/`, { params });
+            return {
+                results: response.data.results || [],
+                nextCursor: response.data.next_cursor || null
+            };
+        } catch (error) {
+            console.error('Explore error:', error);
+            return { results: [], nextCursor: null };
+        }
     }
 };
 